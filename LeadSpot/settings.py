@@ -32,6 +32,8 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'leads.middleware.ProfilerMiddleware',
+    'leads.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,8 +73,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Test-only: LeadCodeTests runs concurrent add_lead requests against
+    # this file-backed database. IMMEDIATE transactions take SQLite's write
+    # lock up front, so the writers wait (up to timeout seconds) for each
+    # other instead of failing mid-transaction. Nothing else routes here.
+    'concurrency': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            'NAME': BASE_DIR / 'test_concurrency.sqlite3',
+        },
+    },
+}
+
+
+# CACHE
+# Dashboard and list pages are cached per model "generation" (see leads/cache.py).
+# LocMemCache is per process: with several workers, point this at a shared
+# backend (Redis / Memcached) so invalidations reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'leadspot',
     }
 }
+LEADS_CACHE_TIMEOUT = 300
+
+
+# QUERY BUDGET
+# Per-request query limit and N+1 detection (see leads/middleware.py).
+# Offending requests are logged; set LEADS_QUERY_BUDGET_RAISE to fail them.
+LEADS_QUERY_BUDGET = 50
+LEADS_N_PLUS_ONE_THRESHOLD = 10
+LEADS_QUERY_BUDGET_RAISE = False
+
+
+# PROFILING
+# Opt-in cProfile sampling (see leads/middleware.py); summarize the
+# captured files with `manage.py profile_summary`. Off while both are unset.
+LEADS_PROFILE_SAMPLE_RATE = 0
+LEADS_PROFILE_SLOW_MS = None
+LEADS_PROFILE_DIR = BASE_DIR / 'profiles'
+LEADS_PROFILE_KEEP = 200
+
+
+# LEAD IMPORTS
+# Uploaded sheets are stored here and imported in batches (see leads/imports.py).
+# Imports run in a background thread of the web process; a failed one resumes
+# from the import page or with `manage.py import_leads --resume <job id>`.
+LEADS_IMPORT_DIR = BASE_DIR / 'imports'
+LEADS_IMPORT_BATCH_SIZE = 1000
+LEADS_IMPORT_IN_BACKGROUND = True
 
 
 # PASSWORD VALIDATION
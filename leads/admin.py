@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     Lead, Profile, CallHistory, RequirementYes,
     StageHistory, Quotation, Meeting, RegretOffer,
-    FutureRequirement, AdditionalContact
+    FutureRequirement, AdditionalContact, DashboardCounter, CodeSequence, ImportJob
 )
 
 @admin.register(Lead)
@@ -85,4 +85,22 @@ class QuotationAdmin(admin.ModelAdmin):
 admin.site.register(Profile)
 admin.site.register(RegretOffer)
 admin.site.register(FutureRequirement)
-admin.site.register(AdditionalContact)
\ No newline at end of file
+admin.site.register(AdditionalContact)
+
+@admin.register(DashboardCounter)
+class DashboardCounterAdmin(admin.ModelAdmin):
+    list_display = ['metric', 'key', 'day', 'value']
+    list_filter = ['metric']
+
+
+@admin.register(CodeSequence)
+class CodeSequenceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'next_value']
+    # Only moved forward by leads.codes; editing it by hand risks reusing codes
+    readonly_fields = ['name', 'next_value']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'status', 'next_row', 'total_rows', 'created_count', 'duplicate_count', 'invalid_count', 'created_at']
+    list_filter = ['status']
@@ -0,0 +1,212 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .models import Lead
+from .normalize import normalize_company_name, phone_search_prefixes
+
+
+# Ceiling on (token, lead) entries held in memory. An index that would
+# grow past it is dropped and autocomplete falls back to the database.
+MAX_ENTRIES = getattr(settings, 'LEADS_AUTOCOMPLETE_MAX_ENTRIES', 1_000_000)
+
+# Each process rebuilds its index this often (seconds), to pick up
+# writes made by other processes. Writes in this process apply at once.
+REFRESH_INTERVAL = getattr(settings, 'LEADS_AUTOCOMPLETE_REFRESH', 300)
+
+PHONE_QUERY = re.compile(r'[\d\s()+-]+')
+
+INDEXED_FIELDS = ('id', 'lead_code', 'company_name', 'contact_name', 'email_key', 'phone_key')
+
+_END = '\uffff'
+
+
+# ===========================================
+# HELPER: Tokens
+# ===========================================
+def _words(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def lead_tokens(lead_code, company_name, contact_name, email_key, phone_key):
+    """Distinct normalized tokens a lead can be found by"""
+    tokens = {lead_code.lower()} if lead_code else set()
+    tokens.update(normalize_company_name(company_name).split())
+    tokens.update(_words(contact_name))
+    tokens.update(_words(email_key))
+    if phone_key:
+        # Full key and the local number, so '98765' finds '919876543210'
+        tokens.update((phone_key, phone_key[-10:]))
+    return tuple(sorted(sys.intern(token) for token in tokens))
+
+
+def query_terms(query):
+    """
+    [[alternative prefixes]] for a typed query; a lead must match every term.
+
+    Phone-looking input is one term with the phone key prefixes as
+    alternatives, anything else is one term per word.
+    """
+    if PHONE_QUERY.fullmatch(query) and re.search(r'\d', query):
+        return [phone_search_prefixes(query) + [re.sub(r'\D', '', query)]]
+    return [[word] for word in _words(query)]
+
+
+# ===========================================
+# PREFIX INDEX
+# ===========================================
+class PrefixIndex:
+    """
+    Sorted token array with a parallel array of lead ids.
+
+    A prefix lookup is two binary searches; inserts and removals shift the
+    arrays in place. All access goes through one lock.
+    """
+    __slots__ = ('tokens', 'lead_ids', 'by_lead', 'max_entries', 'built_at', 'overflowed', 'lock')
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.tokens = []
+        self.lead_ids = array('q')
+        self.by_lead = {}
+        self.max_entries = max_entries
+        self.built_at = time.monotonic()
+        self.overflowed = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @classmethod
+    def build(cls, rows, max_entries=MAX_ENTRIES):
+        """Index from (id, lead_code, company_name, contact_name, email_key, phone_key) rows"""
+        index = cls(max_entries)
+        pairs = []
+        for lead_id, *fields in rows:
+            tokens = lead_tokens(*fields)
+            index.by_lead[lead_id] = tokens
+            pairs.extend((token, lead_id) for token in tokens)
+            if len(pairs) > max_entries:
+                index._overflow()
+                return index
+        pairs.sort()
+        index.tokens = [token for token, _ in pairs]
+        index.lead_ids = array('q', (lead_id for _, lead_id in pairs))
+        return index
+
+    def _overflow(self):
+        self.overflowed = True
+        self.tokens = []
+        self.lead_ids = array('q')
+        self.by_lead = {}
+
+    def _remove(self, lead_id):
+        for token in self.by_lead.pop(lead_id, ()):
+            lo = bisect_left(self.tokens, token)
+            hi = bisect_right(self.tokens, token, lo)
+            for i in range(lo, hi):
+                if self.lead_ids[i] == lead_id:
+                    del self.tokens[i]
+                    del self.lead_ids[i]
+                    break
+
+    def update(self, lead_id, tokens):
+        with self.lock:
+            if self.overflowed or self.by_lead.get(lead_id) == tokens:
+                return
+            self._remove(lead_id)
+            if len(self.tokens) + len(tokens) > self.max_entries:
+                self._overflow()
+                return
+            for token in tokens:
+                i = bisect_right(self.tokens, token)
+                self.tokens.insert(i, token)
+                self.lead_ids.insert(i, lead_id)
+            self.by_lead[lead_id] = tokens
+
+    def remove(self, lead_id):
+        with self.lock:
+            self._remove(lead_id)
+
+    def _prefix_ids(self, prefix):
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + _END, lo)
+        return set(self.lead_ids[lo:hi])
+
+    def search(self, terms, limit=10):
+        """Newest lead ids matching every term (any alternative prefix of it)"""
+        if not terms:
+            return []
+        with self.lock:
+            matches = None
+            for alternatives in terms:
+                ids = set().union(*(self._prefix_ids(prefix) for prefix in alternatives))
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    return []
+        return sorted(matches, reverse=True)[:limit]
+
+    def memory_usage(self):
+        """Approximate bytes held by the arrays (tokens are interned and shared)"""
+        return (
+            sys.getsizeof(self.tokens) + sys.getsizeof(self.lead_ids) +
+            sys.getsizeof(self.by_lead) + sum(map(sys.getsizeof, self.by_lead.values()))
+        )
+
+
+# ===========================================
+# PROCESS-LOCAL INSTANCE
+# ===========================================
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_index():
+    """The process's index, built on first use and rebuilt every REFRESH_INTERVAL"""
+    global _index
+    index = _index
+    if index is not None and time.monotonic() - index.built_at < REFRESH_INTERVAL:
+        return index
+    with _build_lock:
+        if _index is index:
+            rows = Lead.objects.order_by().values_list(*INDEXED_FIELDS).iterator(chunk_size=5000)
+            _index = PrefixIndex.build(rows)
+        return _index
+
+
+def reset_index():
+    """Drop the index so the next lookup rebuilds it"""
+    global _index
+    _index = None
+
+
+def index_lead(lead):
+    if _index is not None:
+        _index.update(lead.pk, lead_tokens(
+            lead.lead_code, lead.company_name, lead.contact_name, lead.email_key, lead.phone_key
+        ))
+
+
+def unindex_lead(lead_id):
+    if _index is not None:
+        _index.remove(lead_id)
+
+
+def autocomplete_leads(query, limit=10):
+    """
+    Up to limit leads whose tokens start with every word of query.
+
+    Answered from the in-memory index; the database is only hit to load
+    the matched leads. Returns None when the index overflowed its
+    memory ceiling, so callers can fall back to a database search.
+    """
+    index = get_index()
+    if index.overflowed:
+        return None
+    ids = index.search(query_terms(query), limit)
+    leads = Lead.objects.in_bulk(ids)
+    return [leads[lead_id] for lead_id in ids if lead_id in leads]
@@ -0,0 +1,158 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+
+CACHE_PREFIX = 'leads'
+
+# How long a built context stays cached (seconds). Generation bumps
+# invalidate it long before this on any write.
+CACHE_TIMEOUT = getattr(settings, 'LEADS_CACHE_TIMEOUT', 300)
+
+# Stampede protection: only one request rebuilds a missing entry, the
+# others poll for up to LOCK_WAIT seconds before building it themselves.
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL = 0.05
+
+STAT_NAMES = ('hits', 'misses', 'waits', 'builds')
+
+_MISSING = object()
+
+
+# ===========================================
+# GENERATION COUNTERS
+# ===========================================
+def _generation_key(model):
+    return f'{CACHE_PREFIX}:gen:{model._meta.label_lower}'
+
+
+def get_generations(*models):
+    """Current generation of each model, seeding any that were evicted"""
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Seed with a timestamp so an evicted counter never restarts
+            # at a value that old cache entries were keyed on
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bump(model):
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_generation(*models):
+    """
+    Invalidate every cached entry that depends on these models, and
+    move their shared ModelVersion rows.
+
+    Deferred until the surrounding transaction commits, so nobody can
+    rebuild the new generation from uncommitted data. Code that writes
+    with QuerySet.update() must call this itself.
+    """
+    def bump():
+        for model in models:
+            _bump(model)
+        _bump_versions(models)
+
+    transaction.on_commit(bump)
+
+
+# ===========================================
+# SHARED MODEL VERSIONS
+# ===========================================
+def versions_queryset(*models):
+    """The ModelVersion rows of these models: one primary key lookup"""
+    from .models import ModelVersion
+
+    return ModelVersion.objects.filter(model__in=[model._meta.label_lower for model in models])
+
+
+def get_model_versions(*models):
+    """
+    Current ModelVersion of each model (0 before its first write). Unlike
+    get_generations these move for writes made by any process.
+    """
+    versions = dict(versions_queryset(*models).values_list('model', 'version'))
+    return [versions.get(model._meta.label_lower, 0) for model in models]
+
+
+def _bump_versions(models):
+    from .models import ModelVersion
+
+    rows = versions_queryset(*models)
+    if rows.update(version=F('version') + 1) < len(set(models)):
+        # First write to some model: create its row, then count this write
+        ModelVersion.objects.bulk_create(
+            [ModelVersion(model=model._meta.label_lower) for model in models], ignore_conflicts=True,
+        )
+        rows.update(version=F('version') + 1)
+
+
+# ===========================================
+# HIT / MISS STATS
+# ===========================================
+def _record(stat):
+    key = f'{CACHE_PREFIX}:stats:{stat}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_stats():
+    """Hit/miss counters since the cache was last cleared"""
+    keys = {f'{CACHE_PREFIX}:stats:{stat}': stat for stat in STAT_NAMES}
+    values = cache.get_many(keys)
+    return {stat: values.get(key, 0) for key, stat in keys.items()}
+
+
+# ===========================================
+# CACHED CONTEXTS
+# ===========================================
+def cached_context(name, depends_on, build, *vary_on):
+    """
+    Return build() from the cache, keyed on the generations of depends_on.
+
+    vary_on values (role, date, page...) are added to the key as-is.
+    """
+    generations = get_generations(*depends_on)
+    parts = [CACHE_PREFIX, 'ctx', name, *map(str, vary_on), *map(str, generations)]
+    key = ':'.join(parts)
+
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _record('hits')
+        return value
+    _record('misses')
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        # Someone else is already building this entry
+        _record('waits')
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        return build()
+
+    try:
+        _record('builds')
+        value = build()
+        cache.set(key, value, timeout=CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,111 @@
+import re
+import threading
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Length
+
+
+LEAD_CODE_SEQUENCE = 'lead_code'
+LEAD_CODE_PREFIX = 'EP'
+
+# Codes each worker process reserves per write to the sequence table.
+# Codes stay unique but are no longer gapless or in creation order
+# across workers; a restarting worker drops the rest of its block.
+LEAD_CODE_BLOCK_SIZE = getattr(settings, 'LEADS_CODE_BLOCK_SIZE', 20)
+
+_LEAD_CODE = re.compile(rf'^{LEAD_CODE_PREFIX}(\d+)$')
+
+
+def format_lead_code(value):
+    """7 -> 'EP00007'"""
+    return f'{LEAD_CODE_PREFIX}{value:05d}'
+
+
+def first_lead_code_value(apps=None, using=None):
+    """The value after the highest EPnnnnn code already in use"""
+    Lead = (apps or global_apps).get_model('leads', 'Lead')
+    codes = (
+        Lead.objects.using(using).filter(lead_code__regex=_LEAD_CODE.pattern)
+        .order_by(Length('lead_code').desc(), '-lead_code')
+        .values_list('lead_code', flat=True)
+    )
+    highest = codes.first()
+    return int(_LEAD_CODE.match(highest).group(1)) + 1 if highest else 1
+
+
+# ===========================================
+# SEQUENCE TABLE
+# ===========================================
+def reserve_block(name, size, first_value):
+    """
+    Atomically take values [start, start + size) from a named sequence;
+    returns (start, end). first_value() gives the start of a sequence
+    that has no row yet.
+    """
+    from .models import CodeSequence
+
+    with transaction.atomic():
+        # UPDATE first: it takes the row (or, on SQLite, database) write
+        # lock before anything is read, so no two callers see one value
+        sequence = CodeSequence.objects.filter(name=name)
+        if not sequence.update(next_value=F('next_value') + size):
+            try:
+                with transaction.atomic():
+                    CodeSequence.objects.create(name=name, next_value=first_value() + size)
+            except IntegrityError:
+                # Another worker created the row first
+                sequence.update(next_value=F('next_value') + size)
+        end = sequence.values_list('next_value', flat=True).get()
+    return end - size, end
+
+
+# ===========================================
+# BLOCK ALLOCATOR
+# ===========================================
+class BlockAllocator:
+    """
+    Hands out values of a sequence from a per-process block, reserving
+    a new block only when the current one runs out.
+
+    A block reserved inside a transaction is only pooled once that
+    transaction commits: if it rolls back, so does the reservation, and
+    another worker may be given the same values.
+    """
+
+    def __init__(self, name, block_size, first_value):
+        self.name = name
+        self.block_size = block_size
+        self.first_value = first_value
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the pooled block (e.g. after the sequence table is emptied)"""
+        with self._lock:
+            self._next = self._end = 0
+
+    def allocate(self):
+        with self._lock:
+            if self._next < self._end:
+                self._next += 1
+                return self._next - 1
+
+        start, end = reserve_block(self.name, self.block_size, self.first_value)
+        transaction.on_commit(lambda: self._pool(start + 1, end))
+        return start
+
+    def _pool(self, start, end):
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = start, end
+
+
+lead_codes = BlockAllocator(LEAD_CODE_SEQUENCE, LEAD_CODE_BLOCK_SIZE, first_lead_code_value)
+
+
+def next_lead_code():
+    """A lead code no other worker has been or will be given"""
+    return format_lead_code(lead_codes.allocate())
@@ -0,0 +1,138 @@
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import get_model_versions
+from .models import Lead, CallHistory, StageHistory, Meeting, Quotation
+
+
+# Lead, requirement / regret / future row: rows a detail page shows directly
+STATE_TIMESTAMPS = (
+    'updated_at', 'requirementyes__updated_at', 'regret_data__updated_at', 'future_data__updated_at',
+)
+
+# Child rows a detail page shows through its timeline:
+# annotation -> (model, link field, outer reference, timestamp)
+# Each is answered by an index on (link field, timestamp).
+CHILD_TIMESTAMPS = {
+    'call_at': (CallHistory, 'lead', 'pk', 'created_at'),
+    'stage_at': (StageHistory, 'lead', 'pk', 'changed_at'),
+    'meeting_at': (Meeting, 'requirement', 'requirementyes', 'created_at'),
+    'quotation_at': (Quotation, 'requirement', 'requirementyes', 'updated_at'),
+}
+
+
+# ===========================================
+# FRESHNESS
+# ===========================================
+def freshness_queryset(lead_id):
+    """The lead's state timestamps and latest child timestamps as one row"""
+    latest = {
+        name: Subquery(
+            model.objects.filter(**{link: OuterRef(outer)}).order_by(f'-{column}').values(column)[:1]
+        )
+        for name, (model, link, outer, column) in CHILD_TIMESTAMPS.items()
+    }
+    return Lead.objects.filter(pk=lead_id).annotate(**latest).values_list(*STATE_TIMESTAMPS, *latest)
+
+
+def lead_last_modified(lead_id):
+    """When a lead or anything on its detail pages last changed, or None if there's no such lead"""
+    row = freshness_queryset(lead_id).first()
+    if row is None:
+        return None
+    return max(stamp for stamp in row if stamp is not None)
+
+
+def _etag(*parts):
+    key = ':'.join(map(str, parts))
+    return '"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+# ===========================================
+# HELPER: 304 or the view's response
+# ===========================================
+def _cacheable(request):
+    # A pending flash message is shown once; a 304 would leave it
+    # unseen, and caching the page would show it again later
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def _respond(request, view, etag, last_modified, args, kwargs):
+    """
+    Answer from the browser's copy when its validators still match,
+    otherwise run the view and attach fresh validators. etag is a
+    callable: it's asked again after the view, which may have set the
+    CSRF cookie the page embeds.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(request, etag=etag(), last_modified=timestamp)
+    if not_modified is not None:
+        return not_modified
+
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200 and not response.streaming:
+        response['ETag'] = etag()
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        # Revalidate on every use rather than guessing a lifetime
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# ===========================================
+# DECORATORS
+# ===========================================
+def conditional_lead_page(view):
+    """
+    304 Not Modified for a lead detail page the browser already has.
+
+    The ETag covers the lead's freshness, the user, the CSRF token in
+    the page's forms and today's date (for "overdue" style badges).
+    """
+    @wraps(view)
+    def wrapper(request, lead_id, *args, **kwargs):
+        if not _cacheable(request):
+            return view(request, lead_id, *args, **kwargs)
+        last_modified = lead_last_modified(lead_id)
+        if last_modified is None:
+            # Let the view answer 404
+            return view(request, lead_id, *args, **kwargs)
+
+        def etag():
+            return _etag(
+                'lead', lead_id, last_modified.isoformat(), request.user.pk,
+                request.META.get('CSRF_COOKIE', ''), timezone.localdate(),
+            )
+
+        return _respond(request, view, etag, last_modified, (lead_id, *args), kwargs)
+    return wrapper
+
+
+def conditional_on(*models):
+    """
+    304 Not Modified for a JSON API whose answer only changes when these
+    models do.
+
+    The ETag covers the models' ModelVersion rows rather than the cache
+    generations, which are per process and miss writes made elsewhere
+    (management commands, other workers).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+            versions = get_model_versions(*models)
+
+            def etag():
+                return _etag(request.get_full_path(), *versions)
+
+            return _respond(request, view, etag, None, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,203 @@
+from collections import Counter
+from datetime import date, datetime
+from functools import reduce
+from operator import or_
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+# ===========================================
+# HELPER: Normalize date-ish values
+# ===========================================
+def _as_date(value):
+    """Views assign raw POST strings to date fields, so accept str/date/datetime"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    if isinstance(value, date):
+        return value
+    parsed = parse_datetime(value)
+    if parsed:
+        return _as_date(parsed)
+    return parse_date(value)
+
+
+# ===========================================
+# COUNTER KEYS PER MODEL
+# ===========================================
+# Each tracked model maps a dict of field values to the
+# (metric, key, day) counters the row contributes +1 to.
+
+def _lead_keys(row):
+    return [
+        ('lead_stage', row['stage'], None),
+        ('lead_created', '', _as_date(row['created_at'])),
+    ]
+
+
+def _requirement_keys(row):
+    keys = [('sales_stage', row['sales_stage'], None)]
+    if row['sales_stage'] == 'order_completed':
+        keys.append(('order_completed', '', _as_date(row['updated_at'])))
+    return keys
+
+
+def _future_keys(row):
+    return [('future_followup', '', _as_date(row['followup_date']))]
+
+
+def _regret_keys(row):
+    return [('regret_followup', '', _as_date(row['followup_date']))]
+
+
+def _meeting_keys(row):
+    meeting_date = _as_date(row['meeting_date'])
+    keys = [
+        ('meeting', '', meeting_date),
+        ('meeting_created', '', _as_date(row['created_at'])),
+    ]
+    if row['outcome'] is None:
+        keys.append(('meeting_no_outcome', '', meeting_date))
+    return keys
+
+
+def _stage_history_keys(row):
+    return [('stage_change', row['to_stage'], _as_date(row['changed_at']))]
+
+
+COUNTER_SOURCES = {
+    'Lead': (('stage', 'created_at'), _lead_keys),
+    'RequirementYes': (('sales_stage', 'updated_at'), _requirement_keys),
+    'FutureRequirement': (('followup_date',), _future_keys),
+    'RegretOffer': (('followup_date',), _regret_keys),
+    'Meeting': (('meeting_date', 'outcome', 'created_at'), _meeting_keys),
+    'StageHistory': (('to_stage', 'changed_at'), _stage_history_keys),
+}
+
+
+def counter_keys(model_name, row):
+    """Counters contributed by one row (a dict of the tracked field values)"""
+    _, keys_fn = COUNTER_SOURCES[model_name]
+    return keys_fn(row)
+
+
+def snapshot(instance):
+    """
+    Capture the tracked field values of a model instance.
+
+    Returns None if any of them is deferred, so callers know to re-read the row.
+    """
+    fields, _ = COUNTER_SOURCES[instance.__class__.__name__]
+    values = instance.__dict__
+    if any(field not in values for field in fields):
+        return None
+    return {field: values[field] for field in fields}
+
+
+# ===========================================
+# WRITE PATH
+# ===========================================
+def adjust_counter(metric, key='', day=None, delta=1):
+    """Atomically add delta to one counter row, creating it on first use"""
+    from .models import DashboardCounter
+
+    if not delta:
+        return
+    counter = DashboardCounter.objects.filter(metric=metric, key=key, day=day)
+    if counter.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            DashboardCounter.objects.create(metric=metric, key=key, day=day, value=delta)
+    except IntegrityError:
+        # Another request created the row first
+        counter.update(value=F('value') + delta)
+
+
+def apply_counter_diff(old_keys, new_keys):
+    """Decrement counters the row left, increment the ones it joined"""
+    diff = Counter(new_keys)
+    diff.subtract(Counter(old_keys))
+    for (metric, key, day), delta in diff.items():
+        adjust_counter(metric, key, day, delta)
+
+
+def bulk_apply_counter_diff(old_keys, new_keys):
+    """
+    apply_counter_diff for bulk writes: at most three queries however
+    many counters change. Must run inside the writing transaction,
+    which holds the counter rows it reads until commit.
+    """
+    from .models import DashboardCounter
+
+    diff = Counter(new_keys)
+    diff.subtract(Counter(old_keys))
+    diff = {counter: delta for counter, delta in diff.items() if delta}
+    if not diff:
+        return
+
+    match = reduce(or_, (Q(metric=metric, key=key, day=day) for metric, key, day in diff))
+    counters = list(DashboardCounter.objects.select_for_update().filter(match))
+    for counter in counters:
+        counter.value += diff.pop((counter.metric, counter.key, counter.day))
+    if counters:
+        DashboardCounter.objects.bulk_update(counters, ['value'])
+    if diff:
+        DashboardCounter.objects.bulk_create([
+            DashboardCounter(metric=metric, key=key, day=day, value=delta)
+            for (metric, key, day), delta in diff.items()
+        ])
+
+
+# ===========================================
+# REBUILD (RECONCILE DRIFT)
+# ===========================================
+def compute_counters(apps=None):
+    """Recompute every counter from the source tables"""
+    apps = apps or global_apps
+    totals = Counter()
+    for model_name, (fields, _) in COUNTER_SOURCES.items():
+        model = apps.get_model('leads', model_name)
+        rows = model.objects.order_by().values(*fields).iterator(chunk_size=2000)
+        for row in rows:
+            totals.update(counter_keys(model_name, row))
+    return totals
+
+
+def rebuild_counters(apps=None, dry_run=False):
+    """
+    Replace the counter table with freshly computed values.
+
+    Returns the number of counters whose stored value was wrong.
+    With dry_run=True nothing is written.
+    """
+    apps = apps or global_apps
+    DashboardCounter = apps.get_model('leads', 'DashboardCounter')
+
+    expected = {key: value for key, value in compute_counters(apps).items() if value}
+    with transaction.atomic():
+        stored = {
+            (metric, key, day): value
+            for metric, key, day, value in DashboardCounter.objects.values_list('metric', 'key', 'day', 'value')
+        }
+        drifted = sum(
+            1 for counter in set(expected) | set(stored)
+            if expected.get(counter, 0) != stored.get(counter, 0)
+        )
+        if dry_run:
+            return drifted
+
+        DashboardCounter.objects.all().delete()
+        DashboardCounter.objects.bulk_create(
+            [
+                DashboardCounter(metric=metric, key=key, day=day, value=value)
+                for (metric, key, day), value in expected.items()
+            ],
+            batch_size=1000,
+        )
+    return drifted
@@ -0,0 +1,239 @@
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import (
+    Lead, RequirementYes, StageHistory, Meeting,
+    RegretOffer, FutureRequirement, DashboardCounter
+)
+
+
+LOST_SALES_STAGES = ['not_converted', 'order_lost']
+
+
+# ===========================================
+# HELPER: Follow-up window aggregates
+# ===========================================
+def _followup_window_counts(model, today, upcoming_end):
+    """Overdue / today / next 7 days counts for a followup_date table in one query"""
+    return model.objects.aggregate(
+        overdue=Count('id', filter=Q(followup_date__lt=today)),
+        today=Count('id', filter=Q(followup_date=today)),
+        upcoming=Count('id', filter=Q(followup_date__gt=today, followup_date__lte=upcoming_end)),
+    )
+
+
+# ===========================================
+# DASHBOARD METRICS (FROM COUNTERS)
+# ===========================================
+def get_dashboard_metrics(today=None):
+    """
+    Read every dashboard tile from the DashboardCounter table in one query.
+
+    Returns a dict with the same keys the dashboard template expects.
+    """
+    today = today or timezone.now().date()
+    month_start = today.replace(day=1)
+    upcoming_end = today + timedelta(days=7)
+
+    rows = (
+        DashboardCounter.objects
+        .order_by()
+        .values('metric', 'key')
+        .annotate(
+            total=Sum('value'),
+            overdue=Sum('value', filter=Q(day__lt=today)),
+            today=Sum('value', filter=Q(day=today)),
+            upcoming=Sum('value', filter=Q(day__gt=today, day__lte=upcoming_end)),
+            this_month=Sum('value', filter=Q(day__gte=month_start)),
+        )
+    )
+    counters = {(row['metric'], row['key']): row for row in rows}
+
+    def count(metric, key='', window='total'):
+        row = counters.get((metric, key))
+        return (row[window] or 0) if row else 0
+
+    lead_stages = {stage: count('lead_stage', stage) for stage, _ in Lead.STAGE_CHOICES}
+    pipeline_stages = {
+        stage: count('sales_stage', stage)
+        for stage, _ in RequirementYes.SALES_STAGE_CHOICES
+    }
+
+    prospect_leads = lead_stages['prospect']
+    requirement_yes_leads = lead_stages['requirement_yes']
+    if prospect_leads > 0:
+        conversion_rate = round((requirement_yes_leads / (prospect_leads + requirement_yes_leads)) * 100, 1)
+    else:
+        conversion_rate = 0
+
+    return {
+        # Lead Overview
+        'total_leads': sum(row['total'] for (metric, _), row in counters.items() if metric == 'lead_stage'),
+        'prospect_leads': prospect_leads,
+        'requirement_yes_leads': requirement_yes_leads,
+        'future_leads': lead_stages['future'],
+        'regret_leads': lead_stages['regret'],
+        'converted_customers': pipeline_stages['order_completed'],
+        'lost_orders': sum(count('sales_stage', stage) for stage in LOST_SALES_STAGES),
+
+        # Follow-up Insights
+        'overdue_followups': count('future_followup', window='overdue') + count('regret_followup', window='overdue'),
+        'today_followups': count('future_followup', window='today') + count('regret_followup', window='today'),
+        'upcoming_followups': count('future_followup', window='upcoming') + count('regret_followup', window='upcoming'),
+        'overdue_future': count('future_followup', window='overdue'),
+        'overdue_regret': count('regret_followup', window='overdue'),
+
+        # Meeting Insights
+        'meetings_today': count('meeting', window='today'),
+        'upcoming_meetings': count('meeting', window='upcoming'),
+        'past_meetings_no_outcome': count('meeting_no_outcome', window='overdue'),
+
+        # Sales Pipeline
+        'pipeline_stages': pipeline_stages,
+
+        # Performance
+        'leads_added_this_month': count('lead_created', window='this_month'),
+        'conversions_this_month': count('stage_change', 'requirement_yes', window='this_month'),
+        'conversion_rate': conversion_rate,
+        'meetings_this_month': count('meeting_created', window='this_month'),
+        'orders_this_month': count('order_completed', window='this_month'),
+    }
+
+
+def counter_total(metric, keys=None, exclude=()):
+    """Sum of one counter metric over all days, optionally for some keys only"""
+    counters = DashboardCounter.objects.filter(metric=metric).exclude(key__in=exclude)
+    if keys is not None:
+        counters = counters.filter(key__in=keys)
+    return counters.aggregate(total=Sum('value'))['total'] or 0
+
+
+# ===========================================
+# DASHBOARD METRICS (FROM SOURCE TABLES)
+# ===========================================
+def scan_dashboard_metrics(today=None):
+    """
+    Compute every dashboard tile with one conditional-aggregate query per table.
+
+    Same result as get_dashboard_metrics(), but read straight from the source
+    tables. Used to verify the counters.
+    """
+    today = today or timezone.now().date()
+    month_start = today.replace(day=1)
+    upcoming_end = today + timedelta(days=7)
+
+    # ============================================
+    # 1️⃣ LEAD OVERVIEW + PERFORMANCE (Lead table)
+    # ============================================
+    lead_counts = Lead.objects.aggregate(
+        total=Count('id'),
+        prospect=Count('id', filter=Q(stage='prospect')),
+        requirement_yes=Count('id', filter=Q(stage='requirement_yes')),
+        future=Count('id', filter=Q(stage='future')),
+        regret=Count('id', filter=Q(stage='regret')),
+        added_this_month=Count('id', filter=Q(created_at__gte=month_start)),
+    )
+
+    # ============================================
+    # 2️⃣ SALES PIPELINE (RequirementYes table)
+    # ============================================
+    pipeline_aggregates = {
+        stage: Count('id', filter=Q(sales_stage=stage))
+        for stage, _ in RequirementYes.SALES_STAGE_CHOICES
+    }
+    requirement_counts = RequirementYes.objects.aggregate(
+        lost_orders=Count('id', filter=Q(sales_stage__in=LOST_SALES_STAGES)),
+        orders_this_month=Count(
+            'id', filter=Q(sales_stage='order_completed', updated_at__gte=month_start)
+        ),
+        **pipeline_aggregates
+    )
+    pipeline_stages = {stage: requirement_counts[stage] for stage in pipeline_aggregates}
+
+    # ============================================
+    # 3️⃣ FOLLOW-UP INSIGHTS (Future + Regret tables)
+    # ============================================
+    future_counts = _followup_window_counts(FutureRequirement, today, upcoming_end)
+    regret_counts = _followup_window_counts(RegretOffer, today, upcoming_end)
+
+    # ============================================
+    # 4️⃣ MEETING INSIGHTS (Meeting table)
+    # ============================================
+    meeting_counts = Meeting.objects.aggregate(
+        today=Count('id', filter=Q(meeting_date=today)),
+        upcoming=Count('id', filter=Q(meeting_date__gt=today, meeting_date__lte=upcoming_end)),
+        past_no_outcome=Count('id', filter=Q(meeting_date__lt=today, outcome__isnull=True)),
+        this_month=Count('id', filter=Q(created_at__gte=month_start)),
+    )
+
+    # Conversions this month (moved to requirement_yes)
+    conversions_this_month = StageHistory.objects.filter(
+        to_stage='requirement_yes',
+        changed_at__gte=month_start
+    ).count()
+
+    prospect_leads = lead_counts['prospect']
+    requirement_yes_leads = lead_counts['requirement_yes']
+    if prospect_leads > 0:
+        conversion_rate = round((requirement_yes_leads / (prospect_leads + requirement_yes_leads)) * 100, 1)
+    else:
+        conversion_rate = 0
+
+    return {
+        # Lead Overview
+        'total_leads': lead_counts['total'],
+        'prospect_leads': prospect_leads,
+        'requirement_yes_leads': requirement_yes_leads,
+        'future_leads': lead_counts['future'],
+        'regret_leads': lead_counts['regret'],
+        'converted_customers': pipeline_stages['order_completed'],
+        'lost_orders': requirement_counts['lost_orders'],
+
+        # Follow-up Insights
+        'overdue_followups': future_counts['overdue'] + regret_counts['overdue'],
+        'today_followups': future_counts['today'] + regret_counts['today'],
+        'upcoming_followups': future_counts['upcoming'] + regret_counts['upcoming'],
+        'overdue_future': future_counts['overdue'],
+        'overdue_regret': regret_counts['overdue'],
+
+        # Meeting Insights
+        'meetings_today': meeting_counts['today'],
+        'upcoming_meetings': meeting_counts['upcoming'],
+        'past_meetings_no_outcome': meeting_counts['past_no_outcome'],
+
+        # Sales Pipeline
+        'pipeline_stages': pipeline_stages,
+
+        # Performance
+        'leads_added_this_month': lead_counts['added_this_month'],
+        'conversions_this_month': conversions_this_month,
+        'conversion_rate': conversion_rate,
+        'meetings_this_month': meeting_counts['this_month'],
+        'orders_this_month': requirement_counts['orders_this_month'],
+    }
+
+
+# ===========================================
+# DASHBOARD ACTIVITY FEEDS
+# ===========================================
+def get_dashboard_activity():
+    """Recent activity and top performer querysets (lazy, evaluated by the template)"""
+    top_converters = (
+        Lead.objects
+        .filter(created_by__isnull=False)
+        .values('created_by__username')
+        .annotate(
+            total_leads=Count('id'),
+            converted=Count('id', filter=Q(stage='requirement_yes'))
+        )
+        .order_by('-converted')[:5]
+    )
+
+    return {
+        'recent_leads': Lead.objects.order_by('-created_at')[:5],
+        'recent_meetings': Meeting.objects.select_related('requirement__lead').order_by('-meeting_date')[:5],
+        'recent_stage_changes': StageHistory.objects.select_related('lead', 'changed_by').order_by('-changed_at')[:10],
+        'top_converters': top_converters,
+    }
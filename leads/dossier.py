@@ -0,0 +1,79 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+from django.http import Http404
+
+from .models import Lead, StageHistory
+from .timeline import timeline_page
+
+
+# Stage changes that close a requirement; the customer and lost order
+# pages show who made them and why
+CLOSING_STAGES = ('order_completed', 'order_lost', 'not_converted')
+
+# Attribute name on Lead -> the one-to-one state row it points at
+STATE_RELATIONS = {
+    'requirement': 'requirementyes',
+    'regret_offer': 'regret_data',
+    'future_requirement': 'future_data',
+}
+
+
+# ===========================================
+# LEAD DOSSIER
+# ===========================================
+class LeadDossier:
+    """
+    Everything a lead detail page shows, in a fixed number of queries:
+
+    1. the lead joined to its requirement / regret / future rows
+    2. the stage changes that closed its requirement (Prefetch)
+    3. the first page of its activity timeline (on context())
+    """
+
+    def __init__(self, lead):
+        self.lead = lead
+        for name, relation in STATE_RELATIONS.items():
+            try:
+                setattr(self, name, getattr(lead, relation))
+            except ObjectDoesNotExist:
+                setattr(self, name, None)
+
+    @classmethod
+    def load(cls, lead_id, require=None):
+        """
+        The dossier of a lead. Raises Http404 when the lead, or the
+        state row named by require ('requirement', 'regret_offer',
+        'future_requirement'), doesn't exist.
+        """
+        lead = (
+            Lead.objects
+            .select_related(*STATE_RELATIONS.values())
+            .prefetch_related(Prefetch(
+                'stage_history',
+                queryset=StageHistory.objects.filter(to_stage__in=CLOSING_STAGES)
+                .select_related('changed_by').order_by('-changed_at'),
+                to_attr='closing_changes',
+            ))
+            .filter(pk=lead_id)
+            .first()
+        )
+        if lead is None:
+            raise Http404('No Lead matches the given query.')
+        dossier = cls(lead)
+        if require and getattr(dossier, require) is None:
+            raise Http404(f'Lead {lead_id} has no {require.replace("_", " ")}.')
+        return dossier
+
+    def closing_record(self, to_stage):
+        """Latest stage change of the lead into to_stage (one of CLOSING_STAGES)"""
+        return next((change for change in self.lead.closing_changes if change.to_stage == to_stage), None)
+
+    def context(self, **extra):
+        """Template context: the lead and the first page of its timeline"""
+        timeline, timeline_cursor = timeline_page(self.lead.id)
+        return {
+            'lead': self.lead,
+            'timeline': timeline,
+            'timeline_cursor': timeline_cursor,
+            **extra,
+        }
@@ -0,0 +1,188 @@
+import csv
+import os
+import tempfile
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from .duplicates import NameMatcher
+from .models import Lead, AdditionalContact
+from .normalize import normalize_company_name
+
+
+# Leads whose normalized names (spaces removed) share this many leading
+# characters end up in the same block and get compared pairwise
+NAME_BLOCK_PREFIX = 4
+
+# Blocks larger than this are compared with a sliding window over the
+# sorted names instead of all pairs
+MAX_PAIRWISE_BLOCK = 300
+SLIDING_WINDOW = 50
+
+# Default similarity needed for two names to be clustered
+DEFAULT_NAME_THRESHOLD = 0.85
+
+ITERATOR_CHUNK_SIZE = 5000
+
+
+# ===========================================
+# UNION-FIND
+# ===========================================
+class UnionFind:
+    """Disjoint sets over lead ids, remembering why sets were merged"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.reasons = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b, reason):
+        root_a, root_b = self.find(a), self.find(b)
+        for root in (root_a, root_b):
+            if root not in self.parent:
+                self.parent[root] = root
+                self.size[root] = 1
+                self.reasons[root] = set()
+        if root_a != root_b:
+            if self.size[root_a] < self.size[root_b]:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+            self.size[root_a] += self.size.pop(root_b)
+            self.reasons[root_a] |= self.reasons.pop(root_b)
+        self.reasons[root_a].add(reason)
+
+    def clusters(self):
+        """[(lead ids, reasons)] for every set with more than one lead"""
+        members = defaultdict(list)
+        for node in self.parent:
+            members[self.find(node)].append(node)
+        return [
+            (sorted(ids), sorted(self.reasons[root]))
+            for root, ids in members.items() if len(ids) > 1
+        ]
+
+
+# ===========================================
+# BLOCKING (SPILLED TO DISK PARTITIONS)
+# ===========================================
+def _block_rows():
+    """(kind, block key, lead id, normalized name) for every blocking key"""
+    leads = Lead.objects.order_by().values_list('id', 'email_key', 'phone_key', 'company_name')
+    for lead_id, email_key, phone_key, company_name in leads.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        if email_key:
+            yield 'email', email_key, lead_id, ''
+        if phone_key:
+            yield 'phone', phone_key, lead_id, ''
+        name = normalize_company_name(company_name)
+        prefix = name.replace(' ', '')[:NAME_BLOCK_PREFIX]
+        if len(prefix) == NAME_BLOCK_PREFIX:
+            yield 'name', prefix, lead_id, name
+
+    contacts = AdditionalContact.objects.order_by().values_list('lead_id', 'email_key', 'phone_key')
+    for lead_id, email_key, phone_key in contacts.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        if email_key:
+            yield 'email', email_key, lead_id, ''
+        if phone_key:
+            yield 'phone', phone_key, lead_id, ''
+
+
+def _partition_rows(directory, partitions):
+    """Hash every row to one of N files so each block lands wholly in one file"""
+    paths = [os.path.join(directory, f'part-{n}.csv') for n in range(partitions)]
+    files = [open(path, 'w', newline='', encoding='utf-8') for path in paths]
+    try:
+        writers = [csv.writer(f) for f in files]
+        count = 0
+        for kind, key, lead_id, name in _block_rows():
+            bucket = zlib.crc32(f'{kind}:{key}'.encode()) % partitions
+            writers[bucket].writerow((kind, key, lead_id, name))
+            count += 1
+    finally:
+        for f in files:
+            f.close()
+    return paths, count
+
+
+def _read_blocks(path):
+    """{(kind, key): [(lead id, name)]} for one partition file"""
+    blocks = defaultdict(dict)
+    with open(path, newline='', encoding='utf-8') as f:
+        for kind, key, lead_id, name in csv.reader(f):
+            blocks[kind, key][int(lead_id)] = name
+    return blocks
+
+
+# ===========================================
+# SCORING
+# ===========================================
+def score_name_block(block, threshold=DEFAULT_NAME_THRESHOLD):
+    """
+    Pairs of lead ids in a name block whose names are similar enough.
+
+    Top-level so it can run in a process pool.
+    """
+    block = sorted(block, key=lambda item: item[1])
+    pairwise = len(block) <= MAX_PAIRWISE_BLOCK
+    pairs = []
+    for i, (lead_id, name) in enumerate(block):
+        matcher = NameMatcher(name, threshold=threshold)
+        end = len(block) if pairwise else min(len(block), i + 1 + SLIDING_WINDOW)
+        for other_id, other_name in block[i + 1:end]:
+            if matcher.score(other_name) is not None:
+                pairs.append((lead_id, other_id))
+    return pairs
+
+
+def find_duplicate_clusters(threshold=DEFAULT_NAME_THRESHOLD, workers=0, partitions=64, log=None):
+    """
+    Cluster the whole lead base into groups of likely duplicates.
+
+    Leads are blocked by email key, phone key (own and additional
+    contacts) and normalized name prefix. Shared email/phone blocks are
+    merged outright; name blocks are scored pairwise, optionally in a
+    process pool. Returns [(lead ids, reasons)].
+    """
+    log = log or (lambda message: None)
+    clusters = UnionFind()
+
+    with tempfile.TemporaryDirectory(prefix='leadspot-dupes-') as directory:
+        paths, row_count = _partition_rows(directory, partitions)
+        log(f'Blocked {row_count} keys into {partitions} partitions')
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for path in paths:
+                name_blocks = []
+                for (kind, _), members in _read_blocks(path).items():
+                    if len(members) < 2:
+                        continue
+                    if kind == 'name':
+                        name_blocks.append(list(members.items()))
+                        continue
+                    first, *rest = members
+                    for lead_id in rest:
+                        clusters.union(first, lead_id, kind)
+
+                if executor:
+                    scored = executor.map(
+                        score_name_block, name_blocks, [threshold] * len(name_blocks), chunksize=16
+                    )
+                else:
+                    scored = (score_name_block(block, threshold) for block in name_blocks)
+                for pairs in scored:
+                    for a, b in pairs:
+                        clusters.union(a, b, 'company_name')
+        finally:
+            if executor:
+                executor.shutdown()
+
+    return clusters.clusters()
@@ -0,0 +1,366 @@
+import heapq
+import itertools
+import json
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Lead, LeadNameGram, AdditionalContact
+from .normalize import normalize_company_name, normalize_email, normalize_phone, phone_search_prefixes
+
+
+# A candidate must share at least this fraction of the query's trigrams
+MIN_SHARED_GRAMS = 0.3
+
+# Upper bound on candidates handed to the (expensive) similarity scoring
+MAX_NAME_CANDIDATES = 200
+
+# Fuzzy company-name matches need a similarity above this
+NAME_MATCH_THRESHOLD = 0.7
+
+# How many matches the duplicate check returns
+MAX_MATCHES = 5
+
+# Largest number of records one batch duplicate check accepts
+MAX_BATCH_RECORDS = 200
+
+
+# ===========================================
+# TRIGRAMS
+# ===========================================
+def name_trigrams(name):
+    """Distinct trigrams of the normalized name, padded so word starts count"""
+    normalized = normalize_company_name(name)
+    if not normalized:
+        return set()
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ===========================================
+# INDEX MAINTENANCE
+# ===========================================
+def index_lead_name(lead):
+    """Bring a lead's trigram rows in line with its current company name"""
+    wanted = name_trigrams(lead.company_name)
+    existing = set(
+        LeadNameGram.objects.filter(lead_id=lead.id).values_list('gram', flat=True)
+    )
+
+    stale = existing - wanted
+    if stale:
+        LeadNameGram.objects.filter(lead_id=lead.id, gram__in=stale).delete()
+    missing = wanted - existing
+    if missing:
+        LeadNameGram.objects.bulk_create(
+            [LeadNameGram(lead_id=lead.id, gram=gram) for gram in missing]
+        )
+
+
+def build_name_index(leads, model=LeadNameGram, batch_size=2000):
+    """Insert trigram rows for (lead_id, company_name) pairs, e.g. for a backfill"""
+    batch = []
+    for lead_id, company_name in leads:
+        batch.extend(model(lead_id=lead_id, gram=gram) for gram in name_trigrams(company_name))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+# ===========================================
+# CANDIDATE LOOKUP
+# ===========================================
+def find_name_candidates(company_name, limit=MAX_NAME_CANDIDATES):
+    """
+    Lead ids sharing enough trigrams with company_name, best overlap first.
+
+    Uses the (gram, lead) index, so the cost depends on how common the
+    query's trigrams are, not on the size of the lead table.
+    """
+    grams = name_trigrams(company_name)
+    if not grams:
+        return []
+    min_shared = max(1, int(len(grams) * MIN_SHARED_GRAMS))
+
+    return list(
+        LeadNameGram.objects
+        .filter(gram__in=grams)
+        .values('lead_id')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=min_shared)
+        .order_by('-shared', 'lead_id')
+        .values_list('lead_id', flat=True)[:limit]
+    )
+
+
+# ===========================================
+# CONTACT KEY LOOKUPS
+# ===========================================
+def _contact_key_match(field, key):
+    """Leads whose own key, or one of whose additional contacts' key, equals key"""
+    return Q(**{field: key}) | Q(
+        id__in=AdditionalContact.objects.filter(**{field: key}).values('lead_id')
+    )
+
+
+def leads_by_email(email):
+    key = normalize_email(email)
+    if not key:
+        return Lead.objects.none()
+    return Lead.objects.filter(_contact_key_match('email_key', key))
+
+
+def leads_by_phone(phone):
+    key = normalize_phone(phone)
+    if not key:
+        return Lead.objects.none()
+    return Lead.objects.filter(_contact_key_match('phone_key', key))
+
+
+def _prefix_range(field, prefix):
+    # A range instead of startswith, so SQLite's case-insensitive LIKE
+    # doesn't stop it from using the index
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'})
+
+
+def contact_prefix_filter(query):
+    """Q matching leads whose email or phone key (own or additional) starts with query"""
+    contact_q = Q()
+    email_prefix = normalize_email(query)
+    if email_prefix:
+        contact_q |= _prefix_range('email_key', email_prefix)
+    for phone_prefix in phone_search_prefixes(query):
+        contact_q |= _prefix_range('phone_key', phone_prefix)
+    if not contact_q:
+        return contact_q
+
+    contact_lead_ids = AdditionalContact.objects.filter(contact_q).values('lead_id')
+    return contact_q | Q(id__in=contact_lead_ids)
+
+
+# ===========================================
+# MATCH RESULTS
+# ===========================================
+def lead_match(lead, match_type, match_score):
+    """JSON shape of one duplicate match"""
+    return {
+        'id': lead.id,
+        'company_name': lead.company_name,
+        'contact_email': lead.contact_email,
+        'contact_phone': lead.contact_phone,
+        'stage': lead.get_stage_display(),
+        'stage_code': lead.stage,
+        'lead_code': lead.lead_code,
+        'match_type': match_type,
+        'match_score': match_score,
+    }
+
+
+class TopMatches:
+    """
+    Keeps the k best matches seen so far in a min-heap.
+
+    Ties on match_score go to the match added first, as with a stable sort.
+    """
+
+    def __init__(self, k=MAX_MATCHES):
+        self.k = k
+        self._heap = []
+        self._ids = set()
+        self._order = itertools.count()
+
+    def __contains__(self, lead_id):
+        return lead_id in self._ids
+
+    def floor(self):
+        """Score a new match must beat to get in, or None while there is room"""
+        if len(self._heap) < self.k:
+            return None
+        return self._heap[0][0]
+
+    def add(self, match):
+        if match['id'] in self._ids:
+            return
+        self._ids.add(match['id'])
+        entry = (match['match_score'], -next(self._order), match)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def results(self):
+        """Matches, best first"""
+        return [match for _, _, match in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+
+# ===========================================
+# FUZZY NAME MATCHER
+# ===========================================
+class NameMatcher:
+    """
+    SequenceMatcher similarity against one query, with cheap early rejection.
+
+    Candidates are checked against the length bound and quick_ratio()
+    (both upper bounds of ratio()) before the full ratio() is computed.
+    """
+
+    def __init__(self, query, threshold=NAME_MATCH_THRESHOLD):
+        self.query = query.lower()
+        self.threshold = threshold
+        self._matcher = SequenceMatcher(None, self.query)
+
+    def _passes(self, upper_bound, floor):
+        if upper_bound <= self.threshold:
+            return False
+        return floor is None or int(upper_bound * 100) > floor
+
+    def score(self, name, floor=None):
+        """
+        ratio() of query vs name, or None if it is not above the threshold.
+
+        floor is a match_score (0-100) the result must beat, e.g. TopMatches.floor().
+        """
+        name = name.lower()
+        total = len(self.query) + len(name)
+        if not total:
+            return None
+        if not self._passes(2.0 * min(len(self.query), len(name)) / total, floor):
+            return None
+
+        self._matcher.set_seq2(name)
+        if not self._passes(self._matcher.quick_ratio(), floor):
+            return None
+        similarity = self._matcher.ratio()
+        return similarity if self._passes(similarity, floor) else None
+
+
+# ===========================================
+# BATCH DUPLICATE CHECK
+# ===========================================
+def _leads_by_keys(field, keys):
+    """{key: lead ids} for leads whose own or additional-contact key is in keys"""
+    hits = defaultdict(set)
+    if not keys:
+        return hits
+    own = Lead.objects.filter(**{f'{field}__in': keys}).values_list('id', field)
+    extra = AdditionalContact.objects.filter(**{f'{field}__in': keys}).values_list('lead_id', field)
+    for lead_id, key in itertools.chain(own, extra):
+        hits[key].add(lead_id)
+    return hits
+
+
+def known_contact_keys(emails, phones):
+    """(emails, phones): the normalized keys that a lead or additional contact already has"""
+    return set(_leads_by_keys('email_key', set(emails))), set(_leads_by_keys('phone_key', set(phones)))
+
+
+# (record_no, min_shared, gram) rows unpacked from one JSON parameter;
+# a VALUES list would bind three parameters per gram and overrun the
+# backend's limit on a full batch of long names
+_GRAM_ROWS = {
+    'sqlite': (
+        "SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]') "
+        'FROM json_each(%s)'
+    ),
+    'postgresql': (
+        "SELECT (item->>0)::int, (item->>1)::int, item->>2 FROM jsonb_array_elements(%s::jsonb) AS item"
+    ),
+}
+
+
+def _batch_name_candidates(record_grams, limit=MAX_NAME_CANDIDATES):
+    """
+    find_name_candidates() for many names in one query: the database
+    counts shared trigrams per (record, lead) and keeps each record's
+    top `limit`, so only candidate ids come back.
+    """
+    rows = [
+        (record_no, max(1, int(len(grams) * MIN_SHARED_GRAMS)), gram)
+        for record_no, grams in enumerate(record_grams)
+        for gram in sorted(grams)
+    ]
+    candidates = [[] for _ in record_grams]
+    if not rows:
+        return candidates
+
+    if connection.vendor in _GRAM_ROWS:
+        source, params = _GRAM_ROWS[connection.vendor], [json.dumps(rows)]
+    else:
+        source = 'VALUES ' + ', '.join(['(%s, %s, %s)'] * len(rows))
+        params = [value for row in rows for value in row]
+
+    sql = (
+        f'WITH grams(record_no, min_shared, gram) AS ({source}), '
+        'shared AS ('
+        '  SELECT grams.record_no, postings.lead_id, '
+        '         ROW_NUMBER() OVER (PARTITION BY grams.record_no ORDER BY COUNT(*) DESC, postings.lead_id) AS position '
+        f' FROM grams JOIN {LeadNameGram._meta.db_table} postings ON postings.gram = grams.gram '
+        '  GROUP BY grams.record_no, postings.lead_id '
+        '  HAVING COUNT(*) >= MAX(grams.min_shared)'
+        ') '
+        'SELECT record_no, lead_id FROM shared WHERE position <= %s ORDER BY record_no, position'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        for record_no, lead_id in cursor.fetchall():
+            candidates[record_no].append(lead_id)
+    return candidates
+
+
+def find_duplicates_batch(records):
+    """
+    Duplicate matches for many {company_name, email, phone} records at once.
+
+    Uses a fixed number of queries whatever the number of records: one IN
+    lookup per key type (leads + additional contacts), one trigram
+    overlap query shared by all names, and one query loading the leads.
+    Returns one match list per record, in the check_duplicates format.
+    """
+    records = [
+        {
+            'company_name': str(record.get('company_name') or '').strip(),
+            'email': normalize_email(str(record.get('email') or '')),
+            'phone': normalize_phone(str(record.get('phone') or '')),
+        }
+        for record in records
+    ]
+
+    email_hits = _leads_by_keys('email_key', {r['email'] for r in records if r['email']})
+    phone_hits = _leads_by_keys('phone_key', {r['phone'] for r in records if r['phone']})
+
+    record_grams = [
+        name_trigrams(r['company_name']) if len(r['company_name']) >= 3 else set()
+        for r in records
+    ]
+    name_candidates = _batch_name_candidates(record_grams)
+
+    lead_ids = set(itertools.chain(*email_hits.values(), *phone_hits.values(), *name_candidates))
+    leads = Lead.objects.in_bulk(lead_ids)
+
+    def newest_first(ids):
+        return sorted((leads[i] for i in ids if i in leads), key=lambda lead: (lead.created_at, lead.id), reverse=True)
+
+    results = []
+    for record, candidates in zip(records, name_candidates):
+        top_matches = TopMatches()
+        for lead in newest_first(email_hits.get(record['email'], ())):
+            top_matches.add(lead_match(lead, 'email', 100))
+        for lead in newest_first(phone_hits.get(record['phone'], ())):
+            top_matches.add(lead_match(lead, 'phone', 100))
+
+        if candidates:
+            matcher = NameMatcher(record['company_name'])
+            # Scored newest first, like check_duplicates, so ties resolve the same way
+            for lead in newest_first(candidates):
+                if lead.id in top_matches:
+                    continue
+                similarity = matcher.score(lead.company_name, floor=top_matches.floor())
+                if similarity is not None:
+                    top_matches.add(lead_match(lead, 'company_name', int(similarity * 100)))
+
+        results.append(top_matches.results())
+    return results
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+from .lists import LISTS
+
+
+ITERATOR_CHUNK_SIZE = 2000
+
+# Rows encoded per yielded chunk; keeps the per-chunk overhead low
+# without holding more than a few hundred KB at a time
+ROWS_PER_CHUNK = 500
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+LEAD_COLUMNS = (
+    ('lead_code', 'lead__lead_code'),
+    ('company_name', 'lead__company_name'),
+    ('city', 'lead__city'),
+    ('state', 'lead__state'),
+    ('contact_name', 'lead__contact_name'),
+    ('contact_email', 'lead__contact_email'),
+    ('contact_phone', 'lead__contact_phone'),
+)
+
+REQUIREMENT_COLUMNS = LEAD_COLUMNS + (
+    ('client_type_main', 'client_type_main'),
+    ('client_type_detail', 'client_type_detail'),
+    ('tank_application', 'tank_application'),
+    ('tank_location', 'tank_location'),
+    ('tanks', 'tanks_json'),
+    ('assigned_sales_person', 'assigned_sales_person'),
+    ('sales_stage', 'sales_stage'),
+    ('expected_delivery_date', 'expected_delivery_date'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+# list name -> ((column header, values_list field), ...)
+EXPORT_COLUMNS = {
+    'prospects': (
+        ('lead_code', 'lead_code'),
+        ('company_name', 'company_name'),
+        ('city', 'city'),
+        ('state', 'state'),
+        ('sector', 'sector'),
+        ('source', 'source'),
+        ('contact_name', 'contact_name'),
+        ('contact_email', 'contact_email'),
+        ('contact_phone', 'contact_phone'),
+        ('stage', 'stage'),
+        ('last_call_date', 'last_call_date'),
+        ('last_remark', 'last_remark'),
+        ('created_at', 'created_at'),
+    ),
+    'requirement-yes': REQUIREMENT_COLUMNS,
+    'customers': REQUIREMENT_COLUMNS,
+    'lost-orders': REQUIREMENT_COLUMNS,
+    'future-requirements': LEAD_COLUMNS + (
+        ('client_type_main', 'client_type_main'),
+        ('client_type_detail', 'client_type_detail'),
+        ('followup_date', 'followup_date'),
+        ('expected_timeline', 'expected_timeline'),
+        ('remark', 'remark'),
+        ('created_at', 'created_at'),
+    ),
+    'regret-offers': LEAD_COLUMNS + (
+        ('client_type_main', 'client_type_main'),
+        ('client_type_detail', 'client_type_detail'),
+        ('tank_type', 'tank_type'),
+        ('tank_type_other', 'tank_type_other'),
+        ('followup_date', 'followup_date'),
+        ('remark', 'remark'),
+        ('created_at', 'created_at'),
+    ),
+}
+
+
+# ===========================================
+# HELPER: Flatten values
+# ===========================================
+def flatten_tanks(tanks):
+    """[{'tank_type': 'GFS', 'capacity': '500', 'quantity': 2}] -> '2 x GFS (500)'"""
+    return '; '.join(
+        f"{tank.get('quantity', '')} x {tank.get('tank_type', '')} ({tank.get('capacity', '')})"
+        for tank in tanks or []
+    )
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return flatten_tanks(value)
+    if value is None:
+        return ''
+    return value
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+# ===========================================
+# STREAMING EXPORT
+# ===========================================
+def _rows(list_name, role, params):
+    fields = [field for _, field in EXPORT_COLUMNS[list_name]]
+    rows = LISTS[list_name].rows(role, params).values_list(*fields)
+    return rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def _csv_chunks(list_name, role, params):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS[list_name]])
+    for n, row in enumerate(_rows(list_name, role, params), 1):
+        writer.writerow([_csv_value(value) for value in row])
+        if n % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _jsonl_chunks(list_name, role, params):
+    headers = [header for header, _ in EXPORT_COLUMNS[list_name]]
+    lines = []
+    for row in _rows(list_name, role, params):
+        record = {header: _json_value(value) for header, value in zip(headers, row)}
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) == ROWS_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(list_name, fmt='csv', role=None, compress=False, params=None):
+    """
+    Byte chunks of a whole stage list as CSV or JSON lines, filtered and
+    sorted by the list's GET params.
+
+    Rows are read with a chunked iterator and encoded a few hundred at a
+    time, so memory stays flat however long the list is. With
+    compress=True the stream is gzipped on the fly.
+    """
+    chunks = _csv_chunks(list_name, role, params) if fmt == 'csv' else _jsonl_chunks(list_name, role, params)
+    return _gzip(chunks) if compress else chunks
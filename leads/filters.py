@@ -0,0 +1,137 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+
+# ===========================================
+# DECLARATIVE LIST FILTERS
+# ===========================================
+# Each filter reads its own GET parameter(s) and turns them into a Q on
+# an indexed column (see the Meta.indexes of the list models).
+
+class ExactFilter:
+    """?param=value -> field = value (a <select> when choices are given)"""
+
+    def __init__(self, param, field, label, choices=None):
+        self.param = param
+        self.field = field
+        self.label = label
+        self.choices = choices
+
+    def params(self):
+        return (self.param,)
+
+    def condition(self, params):
+        value = params.get(self.param, '').strip()
+        if not value:
+            return None
+        if self.choices is not None and value not in dict(self.choices):
+            raise ValueError(f'Invalid {self.param}')
+        return Q(**{self.field: value})
+
+    def form_fields(self, params):
+        return [{
+            'param': self.param,
+            'label': self.label,
+            'type': 'select' if self.choices is not None else 'text',
+            'choices': self.choices,
+            'value': params.get(self.param, ''),
+        }]
+
+
+class PresetFilter:
+    """?param=name -> a named condition, e.g. ?reconnect=due"""
+
+    def __init__(self, param, label, presets):
+        self.param = param
+        self.label = label
+        self.presets = presets
+        self.choices = [(name, preset_label) for name, (preset_label, _) in presets.items()]
+
+    def params(self):
+        return (self.param,)
+
+    def condition(self, params):
+        value = params.get(self.param, '').strip()
+        if not value:
+            return None
+        if value not in self.presets:
+            raise ValueError(f'Invalid {self.param}')
+        return self.presets[value][1]
+
+    def form_fields(self, params):
+        return [{
+            'param': self.param,
+            'label': self.label,
+            'type': 'select',
+            'choices': self.choices,
+            'value': params.get(self.param, ''),
+        }]
+
+
+class DateRangeFilter:
+    """?param_from=YYYY-MM-DD&param_to=YYYY-MM-DD, both inclusive"""
+
+    def __init__(self, param, field, label, is_datetime=False):
+        self.param = param
+        self.field = field
+        self.label = label
+        self.is_datetime = is_datetime
+
+    def params(self):
+        return (f'{self.param}_from', f'{self.param}_to')
+
+    def _bound(self, params, suffix):
+        value = params.get(f'{self.param}_{suffix}', '').strip()
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f'Invalid {self.param}_{suffix}')
+        return parsed
+
+    def condition(self, params):
+        start, end = self._bound(params, 'from'), self._bound(params, 'to')
+        lookups = {}
+        if self.is_datetime:
+            # Compare against local midnights so the column index is used
+            # (a __date lookup would wrap the column in a function)
+            if start:
+                lookups[f'{self.field}__gte'] = timezone.make_aware(datetime.combine(start, time.min))
+            if end:
+                lookups[f'{self.field}__lt'] = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        else:
+            if start:
+                lookups[f'{self.field}__gte'] = start
+            if end:
+                lookups[f'{self.field}__lte'] = end
+        return Q(**lookups) if lookups else None
+
+    def form_fields(self, params):
+        return [
+            {'param': param, 'label': f'{self.label} {suffix}', 'type': 'date', 'choices': None,
+             'value': params.get(param, '')}
+            for param, suffix in zip(self.params(), ('from', 'to'))
+        ]
+
+
+def apply_filters(filters, params):
+    """
+    (Q, [(param, value)]) for the filters set in params.
+
+    The pairs are sorted, so they can key a cache entry or rebuild the
+    query string. Raises ValueError for a malformed value.
+    """
+    condition = Q()
+    used = []
+    for list_filter in filters:
+        filter_condition = list_filter.condition(params)
+        if filter_condition is not None:
+            condition &= filter_condition
+            used += [
+                (param, params[param].strip())
+                for param in list_filter.params() if params.get(param, '').strip()
+            ]
+    return condition, sorted(used)
@@ -22,3 +22,43 @@ class LeadCreateForm(forms.ModelForm):
             'source',
             'department',
         ]
+
+
+class BulkTransitionForm(forms.Form):
+    """Call outcome applied to every lead picked on the prospect list"""
+    CLIENT_TYPE_CHOICES = (
+        ('EPC', 'EPC'),
+        ('CONSULTANT', 'Consultant'),
+        ('CONTRACTOR', 'Contractor'),
+        ('END_CLIENT', 'End Client'),
+    )
+    TANK_TYPE_CHOICES = (
+        ('', '-- Competitor tank --'),
+        ('GRP Tank', 'GRP Tank'),
+        ('FRP Tank', 'FRP Tank'),
+        ('Smaller Capacity Tank', 'Smaller Capacity Tank'),
+        ('Concrete Tank', 'Concrete Tank'),
+        ('MS Tank', 'MS (Mild Steel) Tank'),
+        ('SS Tank', 'SS (Stainless Steel) Tank'),
+        ('HDPE Tank', 'HDPE Tank'),
+    )
+
+    to_stage = forms.ChoiceField(choices=(('regret', 'Regret Offer'), ('future', 'Future Requirement')))
+    actual_call_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    client_type_main = forms.ChoiceField(choices=CLIENT_TYPE_CHOICES)
+    tank_type = forms.ChoiceField(choices=TANK_TYPE_CHOICES, required=False)
+    followup_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    remark = forms.CharField(widget=forms.TextInput(attrs={'placeholder': 'Remark'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('to_stage') == 'regret' and not cleaned_data.get('tank_type'):
+            self.add_error('tank_type', 'A regret offer needs the competitor tank type')
+        return cleaned_data
+
+    def state_fields(self):
+        """Field values for the RegretOffer / FutureRequirement rows"""
+        names = ['client_type_main', 'followup_date', 'remark']
+        if self.cleaned_data['to_stage'] == 'regret':
+            names.append('tank_type')
+        return {name: self.cleaned_data[name] for name in names}
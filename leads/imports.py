@@ -0,0 +1,297 @@
+import csv
+import itertools
+import logging
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .autocomplete import index_lead
+from .cache import bump_generation
+from .codes import LEAD_CODE_SEQUENCE, first_lead_code_value, format_lead_code, reserve_block
+from .counters import apply_counter_diff, counter_keys
+from .duplicates import build_name_index, known_contact_keys
+from .forms import LeadCreateForm
+from .models import Lead, ImportJob
+from .normalize import normalize_email, normalize_phone
+
+
+logger = logging.getLogger(__name__)
+
+# Rows validated, deduplicated and inserted per transaction
+IMPORT_BATCH_SIZE = getattr(settings, 'LEADS_IMPORT_BATCH_SIZE', 1000)
+
+IMPORT_FORMATS = ('.csv', '.xlsx')
+
+# Rejected rows kept on the job for the report
+MAX_IMPORT_ERRORS = 200
+
+# Common sheet headings -> LeadCreateForm field. Headings are matched
+# lower-cased with spaces and dashes as underscores, so "Company Name"
+# needs no alias.
+HEADER_ALIASES = {
+    'company': 'company_name',
+    'organisation': 'company_name',
+    'organization': 'company_name',
+    'name': 'contact_name',
+    'contact': 'contact_name',
+    'contact_person': 'contact_name',
+    'email': 'contact_email',
+    'email_id': 'contact_email',
+    'e_mail': 'contact_email',
+    'phone': 'contact_phone',
+    'mobile': 'contact_phone',
+    'phone_number': 'contact_phone',
+    'contact_number': 'contact_phone',
+}
+
+# A running job whose process died stays 'running'; resuming it needs force
+RESUMABLE_STATUSES = ('pending', 'failed')
+
+
+def import_dir():
+    return Path(getattr(settings, 'LEADS_IMPORT_DIR', Path(settings.BASE_DIR) / 'imports'))
+
+
+# ===========================================
+# READING SHEETS
+# ===========================================
+def _field_name(heading):
+    key = re.sub(r'[\s-]+', '_', str(heading or '').strip().lower())
+    return HEADER_ALIASES.get(key, key)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # phone numbers typed into Excel
+    return str(value).strip()
+
+
+def _csv_rows(path):
+    # utf-8-sig drops the byte order mark Excel writes
+    with open(path, newline='', encoding='utf-8-sig') as sheet:
+        yield from csv.reader(sheet)
+
+
+def _open_workbook(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Reading .xlsx files needs openpyxl (pip install openpyxl)')
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def _xlsx_rows(path):
+    workbook = _open_workbook(path)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _sheet_rows(path):
+    suffix = Path(path).suffix.lower()
+    if suffix not in IMPORT_FORMATS:
+        raise ValueError(f'Only {" and ".join(IMPORT_FORMATS)} files can be imported')
+    return _csv_rows(path) if suffix == '.csv' else _xlsx_rows(path)
+
+
+def read_rows(path):
+    """
+    Stream the data rows of a CSV / XLSX sheet as (line number, {field: text}).
+    Blank rows are skipped; the first row holds the headings.
+    """
+    rows = _sheet_rows(path)
+    header = next(rows, None)
+    if header is None:
+        return
+    fields = [_field_name(heading) for heading in header]
+    for line, row in enumerate(rows, 2):
+        values = [_cell(value) for value in row]
+        if any(values):
+            yield line, dict(zip(fields, values))
+
+
+def count_rows(path):
+    """Data rows in a sheet, for progress. Raises ValueError for a sheet that can't be read."""
+    if Path(path).suffix.lower() == '.xlsx':
+        workbook = _open_workbook(path)
+        try:
+            # read_only mode takes this from the sheet's dimension record
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    try:
+        return sum(1 for _, _ in read_rows(path))
+    except csv.Error as exc:
+        raise ValueError(str(exc))
+
+
+# ===========================================
+# BATCHES
+# ===========================================
+def _form_error(form):
+    return '; '.join(f'{field}: {errors[0]}' for field, errors in form.errors.items())
+
+
+def _index_new_leads(leads):
+    """What Lead's post_save signals would have done; bulk_create skips them"""
+    apply_counter_diff([], [
+        key for lead in leads
+        for key in counter_keys('Lead', {'stage': lead.stage, 'created_at': lead.created_at})
+    ])
+    build_name_index((lead.pk, lead.company_name) for lead in leads)
+    bump_generation(Lead)
+
+    def add_to_autocomplete():
+        for lead in leads:
+            index_lead(lead)
+
+    transaction.on_commit(add_to_autocomplete)
+
+
+def import_batch(job, rows):
+    """
+    Validate, deduplicate and insert one batch of (line, data) rows.
+    The leads and the job's progress commit together.
+    """
+    valid, rejected = [], []
+    for line, data in rows:
+        form = LeadCreateForm(data)
+        if not form.is_valid():
+            rejected.append({'row': line, 'reason': _form_error(form)})
+            continue
+        lead = form.save(commit=False)
+        lead.email_key = normalize_email(lead.contact_email)
+        lead.phone_key = normalize_phone(lead.contact_phone)
+        lead.created_by_id = job.created_by_id
+        valid.append((line, lead))
+
+    with transaction.atomic():
+        known_emails, known_phones = known_contact_keys(
+            {lead.email_key for _, lead in valid if lead.email_key},
+            {lead.phone_key for _, lead in valid if lead.phone_key},
+        )
+        leads, duplicates = [], 0
+        for line, lead in valid:
+            if lead.email_key in known_emails or lead.phone_key in known_phones:
+                key = 'email' if lead.email_key in known_emails else 'phone'
+                rejected.append({'row': line, 'reason': f'Duplicate {key}'})
+                duplicates += 1
+                continue
+            # Later rows of the same sheet are duplicates of this one
+            if lead.email_key:
+                known_emails.add(lead.email_key)
+            if lead.phone_key:
+                known_phones.add(lead.phone_key)
+            leads.append(lead)
+
+        if leads:
+            start, _ = reserve_block(LEAD_CODE_SEQUENCE, len(leads), first_lead_code_value)
+            for offset, lead in enumerate(leads):
+                lead.lead_code = format_lead_code(start + offset)
+            Lead.objects.bulk_create(leads)
+            _index_new_leads(leads)
+
+        job.next_row += len(rows)
+        job.created_count += len(leads)
+        job.duplicate_count += duplicates
+        job.invalid_count += len(rejected) - duplicates
+        job.errors = (job.errors + sorted(rejected, key=lambda error: error['row']))[:MAX_IMPORT_ERRORS]
+        job.save(update_fields=[
+            'next_row', 'created_count', 'duplicate_count', 'invalid_count', 'errors', 'updated_at',
+        ])
+
+
+# ===========================================
+# JOBS
+# ===========================================
+def run_import(job, batch_size=None, progress=None, force=False):
+    """
+    Import a job's sheet from its next_row on, batch_size rows per
+    transaction; progress(job) is called after each committed batch.
+
+    If a batch fails the job is marked failed and the error re-raised;
+    running it again resumes after the last committed batch. force also
+    resumes a job left 'running' by a process that died.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    statuses = RESUMABLE_STATUSES + (('running',) if force else ())
+    if not ImportJob.objects.filter(pk=job.pk, status__in=statuses).update(status='running', last_error=''):
+        job.refresh_from_db(fields=['status'])
+        raise ValueError(f'Import {job.pk} is {job.get_status_display().lower()}')
+    job.refresh_from_db()
+
+    try:
+        if job.total_rows is None:
+            job.total_rows = count_rows(job.path)
+            job.save(update_fields=['total_rows', 'updated_at'])
+        rows = itertools.islice(read_rows(job.path), job.next_row, None)
+        while batch := list(itertools.islice(rows, batch_size)):
+            import_batch(job, batch)
+            if progress:
+                progress(job)
+    except Exception as exc:
+        # Back to what the last committed batch saved
+        job.refresh_from_db()
+        job.status = 'failed'
+        job.last_error = f'{exc.__class__.__name__}: {exc}'
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        raise
+
+    job.status = 'completed'
+    job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def save_upload(upload, user):
+    """Store an uploaded sheet under import_dir() and create its job. Raises ValueError for unreadable sheets."""
+    name = Path(upload.name).name
+    if Path(name).suffix.lower() not in IMPORT_FORMATS:
+        raise ValueError(f'Only {" and ".join(IMPORT_FORMATS)} files can be imported')
+
+    directory = import_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    path = directory / f'{stamp}-{re.sub(r"[^A-Za-z0-9_.-]", "_", name)}'
+    with open(path, 'wb') as stored:
+        for chunk in upload.chunks():
+            stored.write(chunk)
+
+    try:
+        total_rows = count_rows(path)
+    except ValueError:
+        path.unlink(missing_ok=True)
+        raise
+    return ImportJob.objects.create(file_name=name[:255], path=str(path), total_rows=total_rows, created_by=user)
+
+
+def _run(job_id):
+    try:
+        run_import(ImportJob.objects.get(pk=job_id))
+    except Exception:
+        # The job row records the failure for the import page
+        logger.exception('Lead import %s failed', job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        _run(job_id)
+    finally:
+        connection.close()
+
+
+def start_import(job):
+    """
+    Run a job outside the request, in a background thread; with
+    LEADS_IMPORT_IN_BACKGROUND = False it runs before returning.
+    """
+    if not getattr(settings, 'LEADS_IMPORT_IN_BACKGROUND', True):
+        _run(job.pk)
+        return
+    threading.Thread(target=_run_in_thread, args=(job.pk,), name=f'lead-import-{job.pk}', daemon=True).start()
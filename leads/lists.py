@@ -0,0 +1,247 @@
+from datetime import date, datetime
+from functools import reduce
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db.models import Q
+
+from .cache import cached_context
+from .models import Lead, RequirementYes, FutureRequirement, RegretOffer, MAX_RECONNECT_FOLLOWUPS
+from .filters import ExactFilter, PresetFilter, DateRangeFilter, apply_filters
+from .pagination import encode_cursor, decode_cursor
+
+
+# Rows per page for the stage lists and their JSON API
+PAGE_SIZE = getattr(settings, 'LEADS_LIST_PAGE_SIZE', 50)
+
+
+# ===========================================
+# HELPER: Keyset filters
+# ===========================================
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after values in ordering.
+
+    ('-created_at', '-id'), [t, 7] -> created_at < t OR (created_at = t AND id < 7)
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {f.lstrip('-'): value for f, value in zip(ordering[:i], values)}
+        condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+    return condition
+
+
+def _attr_path(obj, path):
+    return reduce(getattr, path.split('__'), obj)
+
+
+def _json_value(value):
+    # isoformat keeps microseconds, so a datetime cursor matches exactly
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+# ===========================================
+# KEYSET-PAGED LISTS
+# ===========================================
+class KeysetList:
+    """
+    One stage list: its queryset, whitelisted sort orders, filters,
+    row template and JSON fields.
+
+    sorts maps a ?sort= name to an index-backed ordering ending in the
+    primary key; the first one is the default.
+    """
+
+    def __init__(self, name, queryset, sorts, context_name, rows_template, depends_on, fields, filters=()):
+        self.name = name
+        self.queryset = queryset
+        self.sorts = sorts
+        self.ordering = next(iter(sorts.values()))
+        self.context_name = context_name
+        self.rows_template = rows_template
+        self.depends_on = depends_on
+        self.fields = fields
+        self.filters = filters
+
+    def query(self, params=None):
+        """
+        (filter Q, sort name, [(param, value)]) from request GET params.
+
+        Raises ValueError for an unknown sort or a malformed filter value.
+        """
+        params = params or {}
+        sort = params.get('sort') or next(iter(self.sorts))
+        if sort not in self.sorts:
+            raise ValueError('Invalid sort')
+        condition, used = apply_filters(self.filters, params)
+        if sort != next(iter(self.sorts)):
+            used.append(('sort', sort))
+        return condition, sort, used
+
+    def rows(self, role=None, params=None):
+        """Filtered, sorted queryset (unpaged)"""
+        condition, sort, _ = self.query(params)
+        return self.queryset(role).filter(condition).order_by(*self.sorts[sort])
+
+    def page(self, role=None, cursor=None, page_size=PAGE_SIZE, params=None):
+        """
+        (rows, next cursor or None) for the page after cursor.
+
+        The cursor carries the sort name, so it can't be replayed
+        against a different order. Raises ValueError for a malformed
+        cursor, sort or filter.
+        """
+        condition, sort, used = self.query(params)
+        ordering = self.sorts[sort]
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None and (len(after) != len(ordering) + 1 or after[0] != sort):
+            raise ValueError('Invalid cursor')
+
+        def build():
+            rows = self.queryset(role).filter(condition).order_by(*ordering)
+            if after is not None:
+                rows = rows.filter(keyset_filter(ordering, after[1:]))
+            rows = list(rows[:page_size + 1])
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                last = rows[-1]
+                next_cursor = encode_cursor([
+                    sort, *(_json_value(_attr_path(last, field.lstrip('-'))) for field in ordering)
+                ])
+            return rows, next_cursor
+
+        return cached_context(
+            f'list:{self.name}', self.depends_on, build, role, urlencode(used), cursor or ''
+        )
+
+    def filter_form(self, params=None):
+        """Fields for the filter bar, with their current values"""
+        params = params or {}
+        fields = []
+        for list_filter in self.filters:
+            fields += list_filter.form_fields(params)
+        return fields
+
+    def sort_choices(self):
+        return [(sort, SORT_LABELS.get(sort, sort)) for sort in self.sorts]
+
+    def serialize(self, row):
+        return {field: _json_value(_attr_path(row, field)) for field in self.fields}
+
+
+def _leads_for_role(role):
+    # Marketing works the prospects, sales the requirement_yes leads
+    stage = 'prospect' if role == 'marketing' else 'requirement_yes'
+    return Lead.objects.filter(stage=stage)
+
+
+LEAD_FIELDS = ('lead__id', 'lead__lead_code', 'lead__company_name', 'lead__city', 'lead__state')
+
+NEWEST_FIRST = {'newest': ('-created_at', '-id'), 'oldest': ('created_at', 'id')}
+FOLLOWUP_ORDER = {'followup_desc': ('-followup_date', '-id'), 'followup_asc': ('followup_date', 'id')}
+
+SORT_LABELS = {
+    'newest': 'Newest first',
+    'oldest': 'Oldest first',
+    'followup_desc': 'Latest follow-up first',
+    'followup_asc': 'Earliest follow-up first',
+}
+
+LOCATION_FILTERS = (
+    ExactFilter('city', 'lead__city', 'City'),
+    ExactFilter('state', 'lead__state', 'State'),
+)
+
+REQUIREMENT_FILTERS = LOCATION_FILTERS + (
+    ExactFilter('client_type', 'client_type_main', 'Client type'),
+    ExactFilter('sales_person', 'assigned_sales_person', 'Sales person'),
+    DateRangeFilter('created', 'created_at', 'Created', is_datetime=True),
+)
+
+FOLLOWUP_FILTERS = LOCATION_FILTERS + (
+    ExactFilter('client_type', 'client_type_main', 'Client type'),
+    DateRangeFilter('followup', 'followup_date', 'Follow-up'),
+)
+
+OPEN_SALES_STAGES = [
+    (stage, label) for stage, label in RequirementYes.SALES_STAGE_CHOICES
+    if stage not in ('not_converted', 'order_lost', 'order_completed')
+]
+LOST_SALES_STAGE_CHOICES = [
+    (stage, label) for stage, label in RequirementYes.SALES_STAGE_CHOICES
+    if stage in ('not_converted', 'order_lost')
+]
+
+LISTS = {
+    'prospects': KeysetList(
+        'prospects', _leads_for_role, NEWEST_FIRST,
+        'leads', 'leads/partials/lead_list_rows.html', (Lead,),
+        ('id', 'lead_code', 'company_name', 'city', 'state', 'stage',
+         'last_call_date', 'last_remark', 'created_at'),
+        filters=(
+            ExactFilter('city', 'city', 'City'),
+            ExactFilter('state', 'state', 'State'),
+            ExactFilter('sector', 'sector', 'Sector'),
+            ExactFilter('source', 'source', 'Source'),
+            DateRangeFilter('created', 'created_at', 'Created', is_datetime=True),
+            DateRangeFilter('last_call', 'last_call_date', 'Last call'),
+            PresetFilter('reconnect', 'Reconnect', {
+                'due': ('Follow-up due', Q(
+                    reconnect_cycle_start__isnull=False, reconnect_followups__lt=MAX_RECONNECT_FOLLOWUPS
+                )),
+                'done': ('All follow-ups sent', Q(reconnect_followups__gte=MAX_RECONNECT_FOLLOWUPS)),
+            }),
+        ),
+    ),
+    'requirement-yes': KeysetList(
+        'requirement-yes',
+        lambda role: (
+            RequirementYes.objects.select_related('lead')
+            .filter(lead__stage='requirement_yes')
+            .exclude(sales_stage__in=['not_converted', 'order_lost', 'order_completed'])
+        ),
+        NEWEST_FIRST,
+        'requirements', 'leads/partials/requirement_yes_list_rows.html', (RequirementYes, Lead),
+        ('id', *LEAD_FIELDS, 'client_type_main', 'sales_stage', 'assigned_sales_person', 'created_at'),
+        filters=(ExactFilter('stage', 'sales_stage', 'Stage', OPEN_SALES_STAGES),) + REQUIREMENT_FILTERS,
+    ),
+    'customers': KeysetList(
+        'customers',
+        lambda role: RequirementYes.objects.select_related('lead').filter(
+            sales_stage='order_completed', lead__isnull=False
+        ),
+        NEWEST_FIRST,
+        'customers', 'leads/partials/customers_list_rows.html', (RequirementYes, Lead),
+        ('id', *LEAD_FIELDS, 'client_type_main', 'tank_application', 'assigned_sales_person', 'updated_at'),
+        filters=REQUIREMENT_FILTERS,
+    ),
+    'lost-orders': KeysetList(
+        'lost-orders',
+        lambda role: RequirementYes.objects.select_related('lead').filter(
+            sales_stage__in=['not_converted', 'order_lost']
+        ),
+        NEWEST_FIRST,
+        'lost_orders', 'leads/partials/lost_orders_list_rows.html', (RequirementYes, Lead),
+        ('id', *LEAD_FIELDS, 'client_type_main', 'tank_application', 'assigned_sales_person', 'updated_at'),
+        filters=(ExactFilter('stage', 'sales_stage', 'Stage', LOST_SALES_STAGE_CHOICES),) + REQUIREMENT_FILTERS,
+    ),
+    'future-requirements': KeysetList(
+        'future-requirements',
+        lambda role: FutureRequirement.objects.select_related('lead'),
+        FOLLOWUP_ORDER,
+        'future_requirements', 'leads/partials/future_requirement_list_rows.html', (FutureRequirement, Lead),
+        ('id', *LEAD_FIELDS, 'client_type_main', 'followup_date', 'remark', 'created_at'),
+        filters=FOLLOWUP_FILTERS,
+    ),
+    'regret-offers': KeysetList(
+        'regret-offers',
+        lambda role: RegretOffer.objects.select_related('lead'),
+        FOLLOWUP_ORDER,
+        'regret_offers', 'leads/partials/regret_offers_list_rows.html', (RegretOffer, Lead),
+        ('id', *LEAD_FIELDS, 'client_type_main', 'tank_type', 'followup_date', 'remark'),
+        filters=FOLLOWUP_FILTERS,
+    ),
+}
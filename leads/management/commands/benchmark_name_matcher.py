@@ -0,0 +1,83 @@
+import random
+import time
+from difflib import SequenceMatcher
+
+from django.core.management.base import BaseCommand
+from leads.duplicates import NameMatcher, TopMatches, NAME_MATCH_THRESHOLD, MAX_MATCHES
+
+
+WORDS = [
+    'reliance', 'tata', 'larsen', 'toubro', 'adani', 'mahindra', 'godrej', 'bharat',
+    'hindustan', 'indian', 'national', 'eastern', 'western', 'global', 'sunrise', 'apex',
+    'steel', 'chemicals', 'petroleum', 'infra', 'engineering', 'tanks', 'water', 'agro',
+    'pharma', 'textiles', 'cement', 'power', 'energy', 'foods', 'logistics', 'systems',
+]
+SUFFIXES = ['Pvt Ltd', 'Ltd', 'Limited', 'Industries', 'Enterprises', 'LLP', '']
+
+
+class Command(BaseCommand):
+    help = 'Compare the bounded NameMatcher against a full SequenceMatcher scan on synthetic company names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Number of synthetic company names')
+        parser.add_argument('--queries', type=int, default=5, help='Number of queries to time')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = [self.company_name(rng) for _ in range(options['count'])]
+        queries = [self.misspell(rng, rng.choice(names)) for _ in range(options['queries'])]
+
+        naive_total = bounded_total = 0.0
+        for query in queries:
+            started = time.perf_counter()
+            expected = self.naive_top(query, names)
+            naive_total += time.perf_counter() - started
+
+            started = time.perf_counter()
+            actual = self.bounded_top(query, names)
+            bounded_total += time.perf_counter() - started
+
+            if actual != expected:
+                self.stderr.write(f'Result mismatch for {query!r}: {actual} != {expected}')
+
+        count = len(queries)
+        self.stdout.write(f'{len(names)} names, {count} queries')
+        self.stdout.write(f'  full scan : {naive_total / count * 1000:8.1f} ms/query')
+        self.stdout.write(f'  bounded   : {bounded_total / count * 1000:8.1f} ms/query')
+        self.stdout.write(
+            self.style.SUCCESS(f'Speedup: {naive_total / max(bounded_total, 1e-9):.1f}x')
+        )
+
+    def company_name(self, rng):
+        words = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 3)))
+        return f'{words} {rng.choice(SUFFIXES)}'.strip()
+
+    def misspell(self, rng, name):
+        chars = list(name)
+        position = rng.randrange(len(chars))
+        chars[position] = rng.choice('aeiourstn')
+        return ''.join(chars)
+
+    def naive_top(self, query, names):
+        """The original check_duplicates loop: full ratio for every name, sort, cut"""
+        matches = []
+        for lead_id, name in enumerate(names):
+            if any(m[0] == lead_id for m in matches):
+                continue
+            similarity = SequenceMatcher(None, query.lower(), name.lower()).ratio()
+            if similarity > NAME_MATCH_THRESHOLD:
+                matches.append((lead_id, int(similarity * 100)))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches[:MAX_MATCHES]
+
+    def bounded_top(self, query, names):
+        matcher = NameMatcher(query)
+        top_matches = TopMatches()
+        for lead_id, name in enumerate(names):
+            if lead_id in top_matches:
+                continue
+            similarity = matcher.score(name, floor=top_matches.floor())
+            if similarity is not None:
+                top_matches.add({'id': lead_id, 'match_score': int(similarity * 100)})
+        return [(m['id'], m['match_score']) for m in top_matches.results()]
@@ -0,0 +1,84 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from leads.duplicate_scan import find_duplicate_clusters, DEFAULT_NAME_THRESHOLD
+from leads.models import Lead
+
+
+REPORT_FIELDS = ['lead_code', 'company_name', 'contact_email', 'contact_phone', 'stage', 'created_at']
+
+
+class Command(BaseCommand):
+    help = 'Scan the whole lead base for clusters of likely duplicate leads and write a report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Report path (.csv or .jsonl)')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Report format (default: from the output file extension)',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=DEFAULT_NAME_THRESHOLD,
+            help='Company name similarity needed to cluster two leads (0-1)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Score name blocks in a process pool of this size',
+        )
+        parser.add_argument('--partitions', type=int, default=64, help='Number of on-disk blocking partitions')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        report_format = options['format'] or output.rsplit('.', 1)[-1].lower()
+        if report_format not in ('csv', 'jsonl'):
+            raise CommandError('Use a .csv or .jsonl output path, or pass --format')
+
+        started = time.monotonic()
+        clusters = find_duplicate_clusters(
+            threshold=options['threshold'],
+            workers=options['workers'],
+            partitions=options['partitions'],
+            log=lambda message: self.stdout.write(message),
+        )
+
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            if report_format == 'csv':
+                self.write_csv(f, clusters)
+            else:
+                self.write_jsonl(f, clusters)
+
+        lead_count = sum(len(ids) for ids, _ in clusters)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Found {len(clusters)} duplicate clusters covering {lead_count} leads '
+                f'in {time.monotonic() - started:.1f}s, report written to {output}'
+            )
+        )
+
+    def iter_clusters(self, clusters, batch_size=500):
+        """Yield (cluster number, reasons, lead rows), loading leads a batch of clusters at a time"""
+        for start in range(0, len(clusters), batch_size):
+            batch = clusters[start:start + batch_size]
+            ids = [lead_id for lead_ids, _ in batch for lead_id in lead_ids]
+            rows = {row['id']: row for row in Lead.objects.filter(id__in=ids).values('id', *REPORT_FIELDS)}
+            for number, (lead_ids, reasons) in enumerate(batch, start=start + 1):
+                yield number, reasons, [rows[lead_id] for lead_id in lead_ids if lead_id in rows]
+
+    def write_csv(self, f, clusters):
+        writer = csv.writer(f)
+        writer.writerow(['cluster', 'cluster_size', 'reasons', 'lead_id', *REPORT_FIELDS])
+        for number, reasons, rows in self.iter_clusters(clusters):
+            for row in rows:
+                writer.writerow([
+                    number, len(rows), '|'.join(reasons), row['id'],
+                    *(row[field] for field in REPORT_FIELDS),
+                ])
+
+    def write_jsonl(self, f, clusters):
+        for number, reasons, rows in self.iter_clusters(clusters):
+            f.write(json.dumps(
+                {'cluster': number, 'size': len(rows), 'reasons': reasons, 'leads': rows},
+                default=str,
+            ) + '\n')
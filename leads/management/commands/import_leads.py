@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from leads.imports import count_rows, run_import
+from leads.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV / XLSX lead sheet in batches, or resume an import that failed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Sheet to import (.csv or .xlsx)')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='Resume this import from its last committed batch')
+        parser.add_argument('--force', action='store_true', help='Resume a job still marked running (its process died)')
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction (default: LEADS_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--user', help='Username recorded as the creator of the imported leads')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = ImportJob.objects.get(pk=options['resume'])
+            except ImportJob.DoesNotExist:
+                raise CommandError(f'No import job {options["resume"]}')
+        elif options['path']:
+            job = self.create_job(Path(options['path']), options['user'])
+        else:
+            raise CommandError('Give a sheet to import or --resume JOB_ID')
+
+        self.stdout.write(f'Import {job.pk}: {job.file_name}')
+        try:
+            run_import(job, batch_size=options['batch_size'], progress=self.progress, force=options['force'])
+        except Exception as exc:
+            raise CommandError(
+                f'Import {job.pk} stopped after row {job.next_row}: {exc}\n'
+                f'Fix the cause and run: manage.py import_leads --resume {job.pk}'
+            )
+
+        for error in job.errors:
+            self.stdout.write(f'  line {error["row"]}: {error["reason"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {job.created_count} leads '
+            f'({job.duplicate_count} duplicates, {job.invalid_count} invalid rows skipped)'
+        ))
+
+    def create_job(self, path, username):
+        if not path.is_file():
+            raise CommandError(f'{path} does not exist')
+        user = None
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'No user {username}')
+        try:
+            total_rows = count_rows(path)
+        except ValueError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        return ImportJob.objects.create(
+            file_name=path.name, path=str(path.resolve()), total_rows=total_rows, created_by=user,
+        )
+
+    def progress(self, job):
+        self.stdout.write(
+            f'{job.next_row}/{job.total_rows} rows ({job.percent}%): {job.created_count} created, '
+            f'{job.duplicate_count} duplicates, {job.invalid_count} invalid'
+        )
@@ -0,0 +1,36 @@
+import io
+import pstats
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from leads.middleware import profile_dir
+
+
+class Command(BaseCommand):
+    help = 'Summarize the top functions across the pstats files captured by ProfilerMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Profile directory (default: LEADS_PROFILE_DIR)')
+        parser.add_argument('--view', help='Only profiles whose view name contains this')
+        parser.add_argument('--limit', type=int, default=30, help='Number of functions to show')
+        parser.add_argument(
+            '--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+            help='Sort key for the function table',
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir']) if options['dir'] else profile_dir()
+        # <timestamp>-<view name>-<ms>ms.prof
+        files = [
+            str(path) for path in sorted(directory.glob('*.prof'))
+            if not options['view'] or options['view'] in path.name
+        ]
+        if not files:
+            raise CommandError(f'No profiles found in {directory}')
+
+        # pstats writes line fragments, which self.stdout would each end with a newline
+        output = io.StringIO()
+        stats = pstats.Stats(*files, stream=output)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(f'{len(files)} profiles, {stats.total_tt:.2f}s total')
+        self.stdout.write(output.getvalue())
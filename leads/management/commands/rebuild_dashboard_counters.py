@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from leads.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counter table from the source tables to fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report how many counters have drifted, do not rewrite them',
+        )
+
+    def handle(self, *args, **options):
+        drifted = rebuild_counters(dry_run=options['check'])
+
+        if options['check']:
+            self.stdout.write(f'{drifted} dashboard counters have drifted')
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully rebuilt dashboard counters ({drifted} had drifted)'
+            )
+        )
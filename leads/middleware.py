@@ -0,0 +1,183 @@
+import cProfile
+import logging
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """A request went over its query budget or repeated a query shape"""
+
+
+# ===========================================
+# HELPER: Query shapes
+# ===========================================
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def sql_shape(sql):
+    """
+    SQL with the literals that vary between N+1 siblings folded away.
+
+    Parameters are already %s placeholders; this also folds IN lists of
+    any length and inline numbers (LIMIT / OFFSET).
+    """
+    return _NUMBER.sub('N', _IN_LIST.sub('IN (...)', sql))
+
+
+def query_budget(limit):
+    """Per-view override of LEADS_QUERY_BUDGET"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+# ===========================================
+# QUERY COUNTING
+# ===========================================
+class QueryStats:
+    """connection.execute_wrapper that counts, times and groups queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold):
+        """(shape, times) for every shape run at least threshold times"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the queries and DB time of each request.
+
+    Adds a Server-Timing header (db / app / total) and flags requests
+    over LEADS_QUERY_BUDGET queries or repeating one query shape
+    LEADS_N_PLUS_ONE_THRESHOLD times. Flagged requests are logged, or
+    raise QueryBudgetExceeded when LEADS_QUERY_BUDGET_RAISE is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = getattr(settings, 'LEADS_QUERY_BUDGET', None)
+        self.repeat_threshold = getattr(settings, 'LEADS_N_PLUS_ONE_THRESHOLD', 10)
+        self.strict = getattr(settings, 'LEADS_QUERY_BUDGET_RAISE', False)
+
+    def __call__(self, request):
+        request.query_budget = self.budget
+        stats = QueryStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        total = (time.perf_counter() - start) * 1000
+        db = stats.duration * 1000
+
+        # Streamed bodies run their queries after this point; only the
+        # view's own queries are counted for them
+        response['Server-Timing'] = (
+            f'db;dur={db:.1f};desc="{stats.count} queries", '
+            f'app;dur={total - db:.1f}, total;dur={total:.1f}'
+        )
+        self.check(request, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', self.budget)
+
+    def check(self, request, stats):
+        problems = []
+        if request.query_budget is not None and stats.count > request.query_budget:
+            problems.append(f'{stats.count} queries (budget {request.query_budget})')
+        for shape, n in stats.repeated(self.repeat_threshold):
+            problems.append(f'{n}x {shape[:200]}')
+        if not problems:
+            return
+
+        message = f'{request.method} {request.path}: ' + '; '.join(problems)
+        if self.strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+# ===========================================
+# SAMPLING PROFILER
+# ===========================================
+def profile_dir():
+    return Path(getattr(settings, 'LEADS_PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class ProfilerMiddleware:
+    """
+    Runs a sample of requests under cProfile and saves their pstats.
+
+    LEADS_PROFILE_SAMPLE_RATE (0-1) picks requests at random;
+    LEADS_PROFILE_SLOW_MS also keeps any request slower than that, which
+    means profiling every request, so only set it while chasing a slow
+    view. Files are named <timestamp>-<view>-<ms>ms.prof and only the
+    newest LEADS_PROFILE_KEEP are kept. Disabled when neither is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'LEADS_PROFILE_SAMPLE_RATE', 0)
+        self.slow_ms = getattr(settings, 'LEADS_PROFILE_SLOW_MS', None)
+        self.keep = getattr(settings, 'LEADS_PROFILE_KEEP', 200)
+        if not self.sample_rate and self.slow_ms is None:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if sampled or elapsed >= self.slow_ms:
+            self.save(request, profiler, elapsed)
+        return response
+
+    def save(self, request, profiler, elapsed):
+        match = request.resolver_match
+        view_name = re.sub(r'[^\w.-]', '_', match.view_name if match else 'unresolved')
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        profiler.dump_stats(directory / f'{stamp}-{view_name}-{elapsed:.0f}ms.prof')
+
+        # Rotate: names start with the timestamp, so they sort oldest first
+        files = sorted(directory.glob('*.prof'))
+        for old in files[:max(len(files) - self.keep, 0)]:
+            old.unlink(missing_ok=True)
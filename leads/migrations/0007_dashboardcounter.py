@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from leads.counters import rebuild_counters
+    rebuild_counters(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0006_alter_meeting_meeting_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('key', models.CharField(blank=True, default='', max_length=50)),
+                ('day', models.DateField(blank=True, null=True)),
+                ('value', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'key', 'day'), name='unique_dashboard_counter'), models.UniqueConstraint(condition=models.Q(('day__isnull', True)), fields=('metric', 'key'), name='unique_undated_dashboard_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
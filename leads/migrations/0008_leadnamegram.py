@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_name_index(apps, schema_editor):
+    from leads.duplicates import build_name_index
+    Lead = apps.get_model('leads', 'Lead')
+    LeadNameGram = apps.get_model('leads', 'LeadNameGram')
+    leads = Lead.objects.order_by().values_list('id', 'company_name').iterator(chunk_size=2000)
+    build_name_index(leads, model=LeadNameGram)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0007_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadNameGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_grams', to='leads.lead')),
+            ],
+            options={
+                'unique_together': {('gram', 'lead')},
+            },
+        ),
+        migrations.RunPython(backfill_name_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+def _backfill(queryset, fields, set_keys):
+    batch = []
+    for obj in queryset.only(*fields).iterator(chunk_size=2000):
+        set_keys(obj)
+        batch.append(obj)
+        if len(batch) >= 1000:
+            queryset.model.objects.bulk_update(batch, ['email_key', 'phone_key'])
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, ['email_key', 'phone_key'])
+
+
+def backfill_contact_keys(apps, schema_editor):
+    from leads.normalize import normalize_email, normalize_phone
+    Lead = apps.get_model('leads', 'Lead')
+    AdditionalContact = apps.get_model('leads', 'AdditionalContact')
+
+    def set_lead_keys(lead):
+        lead.email_key = normalize_email(lead.contact_email)
+        lead.phone_key = normalize_phone(lead.contact_phone)
+
+    def set_contact_keys(contact):
+        if contact.contact_type == 'email':
+            contact.email_key = normalize_email(contact.contact_value)
+        else:
+            contact.phone_key = normalize_phone(contact.contact_value)
+
+    _backfill(Lead.objects.all(), ['contact_email', 'contact_phone'], set_lead_keys)
+    _backfill(AdditionalContact.objects.all(), ['contact_type', 'contact_value'], set_contact_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0008_leadnamegram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='additionalcontact',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='additionalcontact',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_contact_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-17 09:00
+
+from django.db import migrations
+
+
+FTS_COLUMNS = ['company_name', 'contact_name', 'contact_email', 'contact_phone', 'lead_code', 'city', 'state']
+
+
+def create_lead_fts(apps, schema_editor):
+    """SQLite only: FTS5 index over leads_lead, kept in sync by triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+    statements = [
+        f"""CREATE VIRTUAL TABLE leads_lead_fts USING fts5(
+            {columns}, content='leads_lead', content_rowid='id', tokenize='unicode61'
+        )""",
+        f"""CREATE TRIGGER leads_lead_fts_ai AFTER INSERT ON leads_lead BEGIN
+            INSERT INTO leads_lead_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER leads_lead_fts_ad AFTER DELETE ON leads_lead BEGIN
+            INSERT INTO leads_lead_fts(leads_lead_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER leads_lead_fts_au AFTER UPDATE OF {columns} ON leads_lead BEGIN
+            INSERT INTO leads_lead_fts(leads_lead_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO leads_lead_fts(rowid, {columns}) VALUES (new.id, {new_values});
+        END""",
+        "INSERT INTO leads_lead_fts(leads_lead_fts) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_lead_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for trigger in ('leads_lead_fts_ai', 'leads_lead_fts_ad', 'leads_lead_fts_au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS leads_lead_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0009_contact_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_lead_fts, drop_lead_fts),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-17 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_document_fts(apps, schema_editor):
+    """SQLite only: FTS5 index over leads_searchdocument.body, kept in sync by triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    statements = [
+        """CREATE VIRTUAL TABLE leads_searchdocument_fts USING fts5(
+            body, content='leads_searchdocument', content_rowid='id', tokenize='unicode61'
+        )""",
+        """CREATE TRIGGER leads_searchdocument_fts_ai AFTER INSERT ON leads_searchdocument BEGIN
+            INSERT INTO leads_searchdocument_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+        """CREATE TRIGGER leads_searchdocument_fts_ad AFTER DELETE ON leads_searchdocument BEGIN
+            INSERT INTO leads_searchdocument_fts(leads_searchdocument_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        END""",
+        """CREATE TRIGGER leads_searchdocument_fts_au AFTER UPDATE OF body ON leads_searchdocument BEGIN
+            INSERT INTO leads_searchdocument_fts(leads_searchdocument_fts, rowid, body) VALUES ('delete', old.id, old.body);
+            INSERT INTO leads_searchdocument_fts(rowid, body) VALUES (new.id, new.body);
+        END""",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_document_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for trigger in ('leads_searchdocument_fts_ai', 'leads_searchdocument_fts_ad', 'leads_searchdocument_fts_au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS leads_searchdocument_fts')
+
+
+def backfill_documents(apps, schema_editor):
+    from leads.search import build_search_documents
+
+    build_search_documents(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0010_lead_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('call', 'Call Remark'), ('stage', 'Stage Note'), ('regret', 'Regret Remark'), ('future', 'Future Remark'), ('meeting', 'Meeting Note'), ('contact', 'Additional Contact')], max_length=20)),
+                ('source_id', models.BigIntegerField()),
+                ('body', models.TextField()),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='leads.lead')),
+            ],
+            options={
+                'unique_together': {('source', 'source_id')},
+            },
+        ),
+        # Triggers first, so the backfill below is indexed as it is inserted
+        migrations.RunPython(create_document_fts, drop_document_fts),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 11:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0011_searchdocument'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callhistory',
+            index=models.Index(fields=['lead', 'actual_call_date'], name='call_lead_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='futurerequirement',
+            index=models.Index(fields=['followup_date'], name='future_followup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'created_at'], name='lead_stage_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['created_at'], name='lead_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['requirement', 'meeting_date'], name='meeting_req_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['meeting_date'], name='meeting_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regretoffer',
+            index=models.Index(fields=['followup_date'], name='regret_followup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirementyes',
+            index=models.Index(fields=['sales_stage', 'created_at'], name='req_stage_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stagehistory',
+            index=models.Index(fields=['to_stage', 'changed_at'], name='stage_hist_to_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stagehistory',
+            index=models.Index(fields=['lead', 'changed_at'], name='stage_hist_lead_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stagehistory',
+            index=models.Index(fields=['changed_at'], name='stage_hist_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0012_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='futurerequirement',
+            index=models.Index(fields=['client_type_main', 'followup_date'], name='future_client_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'city', 'created_at'], name='lead_stage_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'state', 'created_at'], name='lead_stage_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'sector', 'created_at'], name='lead_stage_sector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'source', 'created_at'], name='lead_stage_source_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'last_call_date'], name='lead_stage_last_call_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['city'], name='lead_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['state'], name='lead_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regretoffer',
+            index=models.Index(fields=['client_type_main', 'followup_date'], name='regret_client_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirementyes',
+            index=models.Index(fields=['client_type_main', 'created_at'], name='req_client_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requirementyes',
+            index=models.Index(fields=['assigned_sales_person', 'created_at'], name='req_sales_person_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-17 13:00
+
+from django.conf import settings
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+lead_fts = import_module('leads.migrations.0010_lead_fts')
+
+
+def recreate_lead_fts(apps, schema_editor):
+    """
+    Adding a NOT NULL column makes SQLite rebuild leads_lead, which drops
+    the FTS triggers created in 0010; put them back and reindex.
+    """
+    lead_fts.drop_lead_fts(apps, schema_editor)
+    lead_fts.create_lead_fts(apps, schema_editor)
+
+
+def backfill_reconnect_cycles(apps, schema_editor):
+    from leads.reconnect import rebuild_reconnect_cycles
+
+    rebuild_reconnect_cycles(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0013_list_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Reverse order: runs after the fields are removed again
+        migrations.RunPython(migrations.RunPython.noop, recreate_lead_fts),
+        migrations.AddField(
+            model_name='lead',
+            name='reconnect_cycle_start',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='reconnect_followups',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['stage', 'reconnect_followups', 'reconnect_cycle_start'], name='lead_reconnect_idx'),
+        ),
+        migrations.RunPython(recreate_lead_fts, migrations.RunPython.noop),
+        migrations.RunPython(backfill_reconnect_cycles, migrations.RunPython.noop),
+    ]
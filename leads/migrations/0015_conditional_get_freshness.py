@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_quotation_updated_at(apps, schema_editor):
+    """Date existing quotations from their creation, not from this migration"""
+    Quotation = apps.get_model('leads', 'Quotation')
+    Quotation.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0014_lead_reconnect_cycle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quotation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_quotation_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='callhistory',
+            index=models.Index(fields=['lead', 'created_at'], name='call_lead_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['requirement', 'created_at'], name='meeting_req_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['requirement', 'updated_at'], name='quotation_req_updated_idx'),
+        ),
+    ]
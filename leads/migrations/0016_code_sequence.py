@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-17 15:00
+
+from django.db import migrations, models
+
+
+def seed_lead_code_sequence(apps, schema_editor):
+    """Continue after the highest lead code already handed out"""
+    from leads.codes import LEAD_CODE_SEQUENCE, first_lead_code_value
+
+    alias = schema_editor.connection.alias
+    CodeSequence = apps.get_model('leads', 'CodeSequence')
+    CodeSequence.objects.using(alias).create(
+        name=LEAD_CODE_SEQUENCE, next_value=first_lead_code_value(apps, using=alias),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0015_conditional_get_freshness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_lead_code_sequence, migrations.RunPython.noop),
+    ]
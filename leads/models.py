@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .normalize import normalize_email, normalize_phone
+
 
 # --------------------
 # USER ROLE PROFILE
@@ -45,6 +47,10 @@ class Lead(models.Model):
     contact_phone = models.CharField(max_length=15, null=True, blank=True)
     department = models.CharField(max_length=100, null=True, blank=True)
 
+    # Normalized contact keys for exact-match lookups (set in save())
+    email_key = models.CharField(max_length=254, blank=True, default='', db_index=True, editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+
     # Stage Management
     stage = models.CharField(max_length=30, choices=STAGE_CHOICES, default='prospect')
     
@@ -60,17 +66,56 @@ class Lead(models.Model):
     #recconect
     last_call_date = models.DateField(null=True, blank=True)  # Last time someone called
     last_remark = models.TextField(null=True, blank=True)
+
+    # Current reconnect cycle, kept in step with CallHistory (see signals.py)
+    reconnect_cycle_start = models.DateField(null=True, blank=True, editable=False)
+    reconnect_followups = models.PositiveSmallIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Stage lists: WHERE stage = ? ORDER BY created_at, id
+            models.Index(fields=['stage', 'created_at'], name='lead_stage_created_idx'),
+            # Recent leads on the dashboard
+            models.Index(fields=['created_at'], name='lead_created_idx'),
+            # Prospect list filters: WHERE stage = ? AND <column> = ? ORDER BY created_at
+            models.Index(fields=['stage', 'city', 'created_at'], name='lead_stage_city_idx'),
+            models.Index(fields=['stage', 'state', 'created_at'], name='lead_stage_state_idx'),
+            models.Index(fields=['stage', 'sector', 'created_at'], name='lead_stage_sector_idx'),
+            models.Index(fields=['stage', 'source', 'created_at'], name='lead_stage_source_idx'),
+            models.Index(fields=['stage', 'last_call_date'], name='lead_stage_last_call_idx'),
+            # City / state filters on the lists joined to Lead
+            models.Index(fields=['city'], name='lead_city_idx'),
+            models.Index(fields=['state'], name='lead_state_idx'),
+            # Prospects in a reconnect cycle with follow-ups left to send
+            models.Index(fields=['stage', 'reconnect_followups', 'reconnect_cycle_start'], name='lead_reconnect_idx'),
+        ]
 
     def __str__(self):
         return f"{self.lead_code} - {self.company_name}"
 
+    def save(self, *args, **kwargs):
+        self.email_key = normalize_email(self.contact_email)
+        self.phone_key = normalize_phone(self.contact_phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'contact_email' in update_fields:
+                update_fields.add('email_key')
+            if 'contact_phone' in update_fields:
+                update_fields.add('phone_key')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 
 # --------------------
 # CALL HISTORY
 # --------------------
+# Follow-ups are reconnect calls whose remark starts with this
+FOLLOWUP_REMARK_PREFIX = 'Followup Sent'
+MAX_RECONNECT_FOLLOWUPS = 3
+
+
 class CallHistory(models.Model):
     OUTCOME_CHOICES = (
         ('yes', 'Requirement Yes'),
@@ -96,10 +141,20 @@ class CallHistory(models.Model):
     class Meta:
         ordering = ['-actual_call_date']
         verbose_name_plural = "Call Histories"
+        indexes = [
+            # A lead's call history, newest first
+            models.Index(fields=['lead', 'actual_call_date'], name='call_lead_date_idx'),
+            # A lead's latest call (conditional GET freshness)
+            models.Index(fields=['lead', 'created_at'], name='call_lead_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.lead.company_name} - {self.outcome} on {self.actual_call_date}"
 
+    @property
+    def is_followup(self):
+        return self.outcome == 'reconnect' and (self.remark or '').startswith(FOLLOWUP_REMARK_PREFIX)
+
 
 # --------------------
 # REQUIREMENT YES DATA
@@ -141,6 +196,15 @@ class RequirementYes(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Customer / lost order / pipeline lists: WHERE sales_stage ... ORDER BY created_at, id
+            models.Index(fields=['sales_stage', 'created_at'], name='req_stage_created_idx'),
+            # Requirement list filters
+            models.Index(fields=['client_type_main', 'created_at'], name='req_client_type_idx'),
+            models.Index(fields=['assigned_sales_person', 'created_at'], name='req_sales_person_idx'),
+        ]
+
 # --------------------
 # QUOTATION TRACKING
 # --------------------
@@ -156,6 +220,13 @@ class Quotation(models.Model):
     notes = models.TextField(null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # A requirement's latest quotation change (conditional GET freshness)
+            models.Index(fields=['requirement', 'updated_at'], name='quotation_req_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Quotation for {self.requirement.lead.company_name}"
@@ -187,6 +258,13 @@ class Meeting(models.Model):
 
     class Meta:
         ordering = ['-meeting_date']
+        indexes = [
+            # A requirement's meetings, and the dashboard's recent meetings
+            models.Index(fields=['requirement', 'meeting_date'], name='meeting_req_date_idx'),
+            models.Index(fields=['meeting_date'], name='meeting_date_idx'),
+            # A requirement's latest meeting (conditional GET freshness)
+            models.Index(fields=['requirement', 'created_at'], name='meeting_req_created_idx'),
+        ]
 
     def __str__(self):
         return f"Meeting - {self.requirement.lead.company_name} on {self.meeting_date}"
@@ -209,6 +287,13 @@ class StageHistory(models.Model):
     class Meta:
         ordering = ['-changed_at']
         verbose_name_plural = "Stage Histories"
+        indexes = [
+            # Conversions per stage and month
+            models.Index(fields=['to_stage', 'changed_at'], name='stage_hist_to_changed_idx'),
+            # A lead's stage history, and the dashboard's recent changes
+            models.Index(fields=['lead', 'changed_at'], name='stage_hist_lead_idx'),
+            models.Index(fields=['changed_at'], name='stage_hist_changed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.lead.company_name}: {self.from_stage} → {self.to_stage}"
@@ -238,6 +323,13 @@ class RegretOffer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Regret list order and follow-up windows
+            models.Index(fields=['followup_date'], name='regret_followup_idx'),
+            models.Index(fields=['client_type_main', 'followup_date'], name='regret_client_type_idx'),
+        ]
+
     def __str__(self):
         return f"{self.lead.company_name} - Regret Offer"
 
@@ -264,6 +356,13 @@ class FutureRequirement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Future list order and follow-up windows
+            models.Index(fields=['followup_date'], name='future_followup_idx'),
+            models.Index(fields=['client_type_main', 'followup_date'], name='future_client_type_idx'),
+        ]
+
     def __str__(self):
         return f"{self.lead.company_name} - Future Requirement"
 
@@ -282,8 +381,178 @@ class AdditionalContact(models.Model):
     contact_type = models.CharField(max_length=10, choices=CONTACT_TYPE_CHOICES)
     contact_value = models.CharField(max_length=255)
     is_primary = models.BooleanField(default=False)
+
+    # Normalized key of contact_value, filled for the matching contact_type
+    email_key = models.CharField(max_length=254, blank=True, default='', db_index=True, editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.lead.company_name} - {self.contact_type}: {self.contact_value}"
\ No newline at end of file
+        return f"{self.lead.company_name} - {self.contact_type}: {self.contact_value}"
+
+    def save(self, *args, **kwargs):
+        is_email = self.contact_type == 'email'
+        self.email_key = normalize_email(self.contact_value) if is_email else ''
+        self.phone_key = '' if is_email else normalize_phone(self.contact_value)
+        super().save(*args, **kwargs)
+
+# --------------------
+# DASHBOARD COUNTERS
+# --------------------
+class DashboardCounter(models.Model):
+    """
+    Pre-aggregated dashboard numbers, kept up to date by signals.
+
+    Undated counters (e.g. leads per stage) have day=None; dated ones
+    (e.g. follow-ups per followup_date) have one row per day.
+    """
+
+    metric = models.CharField(max_length=50)
+    key = models.CharField(max_length=50, blank=True, default='')
+    day = models.DateField(null=True, blank=True)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'key', 'day'], name='unique_dashboard_counter'),
+            models.UniqueConstraint(
+                fields=['metric', 'key'],
+                condition=models.Q(day__isnull=True),
+                name='unique_undated_dashboard_counter',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.metric}:{self.key} ({self.day or 'all time'}) = {self.value}"
+
+
+# --------------------
+# COMPANY NAME TRIGRAM INDEX
+# --------------------
+class LeadNameGram(models.Model):
+    """One row per distinct trigram of a lead's normalized company name"""
+
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='name_grams')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('gram', 'lead')
+
+    def __str__(self):
+        return f"{self.lead_id}: {self.gram!r}"
+
+
+# --------------------
+# SEARCH TEXT STORE
+# --------------------
+class SearchDocument(models.Model):
+    """
+    Free text attached to a lead (call remarks, notes, contacts), copied
+    here by signals so universal search can index it in one place.
+    """
+    SOURCE_CHOICES = (
+        ('call', 'Call Remark'),
+        ('stage', 'Stage Note'),
+        ('regret', 'Regret Remark'),
+        ('future', 'Future Remark'),
+        ('meeting', 'Meeting Note'),
+        ('contact', 'Additional Contact'),
+    )
+
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='search_documents')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.BigIntegerField()
+    body = models.TextField()
+
+    class Meta:
+        unique_together = ('source', 'source_id')
+
+    def __str__(self):
+        return f"{self.lead_id} {self.source}#{self.source_id}"
+
+
+# --------------------
+# CODE SEQUENCES
+# --------------------
+class CodeSequence(models.Model):
+    """
+    Next unused value of a named counter (e.g. lead codes).
+
+    Only moved forward by leads.codes.reserve_block, which takes values
+    in blocks with a single atomic UPDATE.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+# --------------------
+# MODEL VERSIONS
+# --------------------
+class ModelVersion(models.Model):
+    """
+    Write counter of one model, shared by every process.
+
+    Bumped with the cache generations by leads.cache.bump_generation;
+    read where a per-process generation would miss writes made by other
+    workers or management commands (search API ETags).
+    """
+
+    model = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.model}: {self.version}"
+
+
+# --------------------
+# LEAD SHEET IMPORTS
+# --------------------
+class ImportJob(models.Model):
+    """
+    One lead sheet import (see leads/imports.py).
+
+    next_row and the counts are saved in the transaction of each batch,
+    so a failed import resumes right after the last committed batch.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+        ('completed', 'Completed'),
+    )
+
+    file_name = models.CharField(max_length=255)
+    path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    # Data rows read so far (header excluded) and their outcome
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    next_row = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    duplicate_count = models.PositiveIntegerField(default=0)
+    invalid_count = models.PositiveIntegerField(default=0)
+
+    # First rows rejected: [{"row": n, "reason": ...}]
+    errors = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status}, {self.next_row} rows)"
+
+    @property
+    def percent(self):
+        if not self.total_rows:
+            return 100 if self.status == 'completed' else 0
+        return min(100, self.next_row * 100 // self.total_rows)
@@ -0,0 +1,53 @@
+import re
+
+from django.conf import settings
+
+
+# Country code assumed for 10-digit local numbers
+DEFAULT_COUNTRY_CODE = getattr(settings, 'LEADS_DEFAULT_COUNTRY_CODE', '91')
+
+# Legal suffixes appear in most company names, so they carry no signal
+# when comparing names.
+NAME_STOPWORDS = {
+    'pvt', 'private', 'ltd', 'limited', 'llp', 'inc', 'co', 'company',
+    'corp', 'corporation', 'the', 'and',
+}
+
+
+def normalize_email(email):
+    """'  Ramesh@Example.COM ' -> 'ramesh@example.com'"""
+    return (email or '').strip().lower()
+
+
+def normalize_phone(phone):
+    """
+    Digits-only, country-code-prefixed phone key.
+
+    '+91 98765-43210', '098765 43210' and '9876543210' all become '919876543210'.
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('00'):
+        digits = digits[2:]  # international dialling prefix
+    elif len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]  # trunk prefix
+    if len(digits) == 10:
+        digits = DEFAULT_COUNTRY_CODE + digits
+    return digits
+
+
+def phone_search_prefixes(query):
+    """Key prefixes a partially typed phone number can match"""
+    digits = re.sub(r'\D', '', query or '')
+    if not digits:
+        return []
+    prefixes = [normalize_phone(digits) if len(digits) >= 10 else digits]
+    if len(digits) < 10 and not digits.startswith(DEFAULT_COUNTRY_CODE):
+        prefixes.append(DEFAULT_COUNTRY_CODE + digits)
+    return prefixes
+
+
+def normalize_company_name(name):
+    """'Reliance Industries Pvt. Ltd.' -> 'reliance industries'"""
+    words = re.findall(r'\w+', (name or '').lower())
+    kept = [word for word in words if word not in NAME_STOPWORDS]
+    return ' '.join(kept or words)
@@ -0,0 +1,60 @@
+from itertools import groupby
+
+from .models import FOLLOWUP_REMARK_PREFIX
+
+
+# ===========================================
+# RECONNECT CYCLE FROM CALL HISTORY
+# ===========================================
+def reconnect_cycle(calls):
+    """
+    (cycle start, follow-ups sent) from a lead's calls, newest first,
+    as (outcome, remark, actual_call_date) tuples.
+
+    The cycle starts at the latest plain reconnect call, as long as no
+    other outcome came after it; follow-ups from that day on count.
+    """
+    start = None
+    for outcome, remark, call_date in calls:
+        if outcome != 'reconnect':
+            break
+        if not (remark or '').startswith(FOLLOWUP_REMARK_PREFIX):
+            start = call_date
+            break
+    if start is None:
+        return None, 0
+
+    followups = sum(
+        1 for outcome, remark, call_date in calls
+        if outcome == 'reconnect' and (remark or '').startswith(FOLLOWUP_REMARK_PREFIX)
+        and call_date >= start
+    )
+    return start, followups
+
+
+def rebuild_reconnect_cycles(apps=None, batch_size=2000):
+    """
+    Recompute Lead.reconnect_cycle_start / reconnect_followups from the
+    call history. Pass the migration's apps to run it from a migration.
+    """
+    if apps is None:
+        from django.apps import apps
+
+    Lead = apps.get_model('leads', 'Lead')
+    CallHistory = apps.get_model('leads', 'CallHistory')
+
+    calls = (
+        CallHistory.objects.order_by('lead_id', '-actual_call_date', '-created_at', '-id')
+        .values_list('lead_id', 'outcome', 'remark', 'actual_call_date')
+        .iterator(chunk_size=batch_size)
+    )
+    batch = []
+    for lead_id, rows in groupby(calls, key=lambda row: row[0]):
+        start, followups = reconnect_cycle([row[1:] for row in rows])
+        if start is not None:
+            batch.append(Lead(pk=lead_id, reconnect_cycle_start=start, reconnect_followups=followups))
+        if len(batch) >= batch_size:
+            Lead.objects.bulk_update(batch, ['reconnect_cycle_start', 'reconnect_followups'])
+            batch = []
+    if batch:
+        Lead.objects.bulk_update(batch, ['reconnect_cycle_start', 'reconnect_followups'])
@@ -0,0 +1,249 @@
+import re
+from collections import defaultdict
+from functools import reduce
+
+from django.apps import apps as global_apps
+from django.db import connection, OperationalError
+from django.db.models import Q
+
+from .duplicates import contact_prefix_filter
+from .models import Lead, SearchDocument
+
+
+# Free-text fields copied into SearchDocument:
+# model name -> (source, path to the lead id, text field)
+SEARCH_SOURCES = {
+    'CallHistory': ('call', 'lead_id', 'remark'),
+    'StageHistory': ('stage', 'lead_id', 'notes'),
+    'RegretOffer': ('regret', 'lead_id', 'remark'),
+    'FutureRequirement': ('future', 'lead_id', 'remark'),
+    'Meeting': ('meeting', 'requirement__lead_id', 'notes'),
+    'AdditionalContact': ('contact', 'lead_id', 'contact_value'),
+}
+
+# Rank given to exact email/phone key matches, ahead of any bm25 score
+CONTACT_MATCH_RANK = -1e9
+
+# Contact key matches considered per query
+MAX_CONTACT_MATCHES = 50
+
+SNIPPETS_PER_LEAD = 3
+
+# Snippet highlight markers (control characters never typed by users)
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+# ===========================================
+# TEXT STORE MAINTENANCE
+# ===========================================
+def _lead_id_of(instance, path):
+    return reduce(getattr, path.split('__'), instance)
+
+
+def index_search_document(instance, created=False):
+    """
+    Copy an instance's free text into SearchDocument (or drop it if
+    empty). A row just created has no document yet: one INSERT.
+    """
+    source, lead_path, body_field = SEARCH_SOURCES[instance.__class__.__name__]
+    body = (getattr(instance, body_field) or '').strip()
+    if created:
+        if body:
+            SearchDocument.objects.create(
+                source=source, source_id=instance.pk, lead_id=_lead_id_of(instance, lead_path), body=body,
+            )
+        return
+    documents = SearchDocument.objects.filter(source=source, source_id=instance.pk)
+    if not body:
+        documents.delete()
+        return
+    if not documents.update(lead_id=_lead_id_of(instance, lead_path), body=body):
+        SearchDocument.objects.create(
+            source=source, source_id=instance.pk,
+            lead_id=_lead_id_of(instance, lead_path), body=body,
+        )
+
+
+def unindex_search_document(instance):
+    source, _, _ = SEARCH_SOURCES[instance.__class__.__name__]
+    SearchDocument.objects.filter(source=source, source_id=instance.pk).delete()
+
+
+def bulk_index_search_documents(instances):
+    """
+    index_search_document for rows written with bulk_create / upserts,
+    in one query. Instances with no text are skipped, not unindexed.
+    """
+    documents = []
+    for instance in instances:
+        source, lead_path, body_field = SEARCH_SOURCES[instance.__class__.__name__]
+        body = (getattr(instance, body_field) or '').strip()
+        if body:
+            documents.append(SearchDocument(
+                source=source, source_id=instance.pk, lead_id=_lead_id_of(instance, lead_path), body=body,
+            ))
+    if documents:
+        SearchDocument.objects.bulk_create(
+            documents, update_conflicts=True,
+            unique_fields=['source', 'source_id'], update_fields=['lead', 'body'],
+        )
+
+
+def build_search_documents(apps=None, batch_size=2000):
+    """Fill SearchDocument from every source table, e.g. for a backfill"""
+    apps = apps or global_apps
+    document_model = apps.get_model('leads', 'SearchDocument')
+    for model_name, (source, lead_path, body_field) in SEARCH_SOURCES.items():
+        rows = (
+            apps.get_model('leads', model_name).objects
+            .order_by()
+            .exclude(**{f'{body_field}__isnull': True})
+            .values_list('id', lead_path, body_field)
+        )
+        batch = []
+        for source_id, lead_id, body in rows.iterator(chunk_size=batch_size):
+            if body.strip():
+                batch.append(document_model(source=source, source_id=source_id, lead_id=lead_id, body=body.strip()))
+            if len(batch) >= batch_size:
+                document_model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        document_model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+# ===========================================
+# HELPER: FTS5 query building
+# ===========================================
+def fts_prefix_query(query):
+    """'Relia  ind' -> '"relia"* "ind"*' (every token, as a prefix, must match)"""
+    tokens = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _contact_match_ids(query):
+    return list(
+        Lead.objects.order_by()
+        .filter(contact_prefix_filter(query))
+        .values_list('id', flat=True)[:MAX_CONTACT_MATCHES]
+    )
+
+
+# ===========================================
+# RANKED, KEYSET-PAGED SEARCH
+# ===========================================
+def _fts_page(query, after, limit):
+    """[(lead id, rank)] from both FTS5 indexes, grouped per lead, best rank first"""
+    match = fts_prefix_query(query)
+    contact_ids = _contact_match_ids(query)
+    if not match and not contact_ids:
+        return []
+
+    hits = []
+    params = []
+    if match:
+        hits.append('SELECT rowid, bm25(leads_lead_fts) FROM leads_lead_fts WHERE leads_lead_fts MATCH %s')
+        hits.append(
+            'SELECT d.lead_id, bm25(leads_searchdocument_fts) '
+            'FROM leads_searchdocument_fts '
+            'JOIN leads_searchdocument d ON d.id = leads_searchdocument_fts.rowid '
+            'WHERE leads_searchdocument_fts MATCH %s'
+        )
+        params += [match, match]
+    if contact_ids:
+        hits.append(
+            f'SELECT id, %s FROM leads_lead WHERE id IN ({", ".join(["%s"] * len(contact_ids))})'
+        )
+        params += [CONTACT_MATCH_RANK, *contact_ids]
+
+    where = ''
+    if after:
+        where = 'WHERE rank > %s OR (rank = %s AND lead_id > %s)'
+        params += [after[0], after[0], after[1]]
+
+    sql = (
+        f'WITH hits(lead_id, rank) AS ({" UNION ALL ".join(hits)}), '
+        'ranked AS (SELECT lead_id, MIN(rank) AS rank FROM hits GROUP BY lead_id) '
+        f'SELECT lead_id, rank FROM ranked {where} ORDER BY rank, lead_id LIMIT %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return cursor.fetchall()
+
+
+def _fts_snippets(query, lead_ids):
+    """{lead id: [(source, snippet)]} for the documents that matched"""
+    match = fts_prefix_query(query)
+    snippets = defaultdict(list)
+    if not match or not lead_ids:
+        return snippets
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT d.lead_id, d.source, '
+            "snippet(leads_searchdocument_fts, 0, %s, %s, '…', 12) "
+            'FROM leads_searchdocument_fts '
+            'JOIN leads_searchdocument d ON d.id = leads_searchdocument_fts.rowid '
+            'WHERE leads_searchdocument_fts MATCH %s '
+            f'AND d.lead_id IN ({", ".join(["%s"] * len(lead_ids))}) '
+            'ORDER BY bm25(leads_searchdocument_fts)',
+            [HIGHLIGHT_START, HIGHLIGHT_END, match, *lead_ids],
+        )
+        for lead_id, source, snippet in cursor.fetchall():
+            if len(snippets[lead_id]) < SNIPPETS_PER_LEAD:
+                snippets[lead_id].append((source, snippet))
+    return snippets
+
+
+def _orm_page(query, after, limit):
+    """Backend-agnostic fallback: icontains scan, ordered by lead id"""
+    document_lead_ids = SearchDocument.objects.filter(body__icontains=query).values('lead_id')
+    leads = Lead.objects.order_by('id').filter(
+        Q(company_name__icontains=query) |
+        Q(contact_name__icontains=query) |
+        Q(lead_code__icontains=query) |
+        Q(id__in=document_lead_ids) |
+        contact_prefix_filter(query)
+    )
+    if after:
+        leads = leads.filter(id__gt=after[1])
+    return [(lead_id, 0) for lead_id in leads.values_list('id', flat=True)[:limit]]
+
+
+def _orm_snippets(query, lead_ids):
+    snippets = defaultdict(list)
+    documents = SearchDocument.objects.filter(lead_id__in=lead_ids, body__icontains=query)
+    for lead_id, source, body in documents.values_list('lead_id', 'source', 'body'):
+        if len(snippets[lead_id]) < SNIPPETS_PER_LEAD:
+            snippets[lead_id].append((source, body[:160]))
+    return snippets
+
+
+def search_leads(query, after=None, limit=20):
+    """
+    One page of leads matching query across lead fields and their notes.
+
+    after is the (rank, lead id) of the last lead on the previous page.
+    Returns (leads, snippets per lead id, cursor for the next page or None).
+
+    On SQLite this reads the FTS5 indexes (prefix matching, bm25 rank,
+    exact contact-key matches first). Other backends, or a database
+    without the indexes, fall back to an ORM scan ordered by id.
+    """
+    use_fts = connection.vendor == 'sqlite'
+    try:
+        rows = _fts_page(query, after, limit + 1) if use_fts else None
+    except OperationalError:
+        use_fts = False
+    if not use_fts:
+        rows = _orm_page(query, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_id, last_rank = rows[limit - 1]
+        next_cursor = [last_rank, last_id]
+    rows = rows[:limit]
+    ids = [lead_id for lead_id, _ in rows]
+
+    leads = Lead.objects.in_bulk(ids)
+    snippets = _fts_snippets(query, ids) if use_fts else _orm_snippets(query, ids)
+    return [leads[lead_id] for lead_id in ids if lead_id in leads], snippets, next_cursor
@@ -1,9 +1,164 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_init, pre_save, post_delete
 from django.dispatch import receiver
-from .models import Profile
+from .models import (
+    Profile, Lead, CallHistory, RequirementYes, StageHistory, Quotation,
+    Meeting, RegretOffer, FutureRequirement, AdditionalContact
+)
+from .counters import COUNTER_SOURCES, snapshot, counter_keys, apply_counter_diff
+from .cache import bump_generation
+from .duplicates import index_lead_name
+from .autocomplete import index_lead, unindex_lead
+from .search import SEARCH_SOURCES, index_search_document, unindex_search_document
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance, role='marketing')
+
+
+# ===========================================
+# DASHBOARD COUNTERS
+# ===========================================
+COUNTED_MODELS = (Lead, RequirementYes, StageHistory, Meeting, RegretOffer, FutureRequirement)
+
+
+def remember_counted_fields(sender, instance, **kwargs):
+    """Keep the values the row was loaded with so saves can be diffed"""
+    instance._counter_snapshot = snapshot(instance) if instance.pk else None
+
+
+def load_counted_fields(sender, instance, raw=False, **kwargs):
+    """Re-read the stored row if its tracked fields were deferred at load time"""
+    if raw or instance._state.adding or instance._counter_snapshot is not None:
+        return
+    fields, _ = COUNTER_SOURCES[sender.__name__]
+    instance._counter_snapshot = sender._base_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+def update_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else instance._counter_snapshot
+    new = snapshot(instance)
+    if new is None:
+        fields, _ = COUNTER_SOURCES[sender.__name__]
+        instance.refresh_from_db(fields=fields)
+        new = snapshot(instance)
+
+    apply_counter_diff(
+        counter_keys(sender.__name__, old) if old else [],
+        counter_keys(sender.__name__, new),
+    )
+    instance._counter_snapshot = new
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    old = instance._counter_snapshot or snapshot(instance)
+    if old:
+        apply_counter_diff(counter_keys(sender.__name__, old), [])
+
+
+for model in COUNTED_MODELS:
+    uid = model.__name__
+    post_init.connect(remember_counted_fields, sender=model, dispatch_uid=f'counters_init_{uid}')
+    pre_save.connect(load_counted_fields, sender=model, dispatch_uid=f'counters_pre_save_{uid}')
+    post_save.connect(update_counters_on_save, sender=model, dispatch_uid=f'counters_save_{uid}')
+    post_delete.connect(update_counters_on_delete, sender=model, dispatch_uid=f'counters_delete_{uid}')
+
+
+# ===========================================
+# CACHE INVALIDATION
+# ===========================================
+CACHED_MODELS = (
+    Lead, CallHistory, RequirementYes, StageHistory, Quotation,
+    Meeting, RegretOffer, FutureRequirement, AdditionalContact,
+)
+
+
+def bump_cache_generation(sender, raw=False, **kwargs):
+    if not raw:
+        bump_generation(sender)
+
+
+for model in CACHED_MODELS:
+    uid = model.__name__
+    post_save.connect(bump_cache_generation, sender=model, dispatch_uid=f'cache_save_{uid}')
+    post_delete.connect(bump_cache_generation, sender=model, dispatch_uid=f'cache_delete_{uid}')
+
+
+# ===========================================
+# RECONNECT CYCLE
+# ===========================================
+RECONNECT_FIELDS = ['reconnect_cycle_start', 'reconnect_followups']
+
+
+@receiver(post_save, sender=CallHistory)
+def update_reconnect_cycle(sender, instance, created, raw=False, **kwargs):
+    """
+    Move the lead's reconnect cycle along with each new call, in the
+    transaction that wrote the call: a plain reconnect starts a cycle,
+    a follow-up counts against it, any other outcome ends it.
+    """
+    if raw or not created:
+        return
+    leads = Lead.objects.filter(pk=instance.lead_id)
+    if instance.is_followup:
+        leads.filter(reconnect_cycle_start__isnull=False).update(
+            reconnect_followups=F('reconnect_followups') + 1
+        )
+    elif instance.outcome == 'reconnect':
+        leads.update(reconnect_cycle_start=instance.actual_call_date, reconnect_followups=0)
+    else:
+        leads.update(reconnect_cycle_start=None, reconnect_followups=0)
+
+    # The caller usually saves the lead next; don't let it write stale values back
+    if CallHistory.lead.is_cached(instance):
+        instance.lead.refresh_from_db(fields=RECONNECT_FIELDS)
+    bump_generation(Lead)
+
+
+# ===========================================
+# COMPANY NAME TRIGRAM INDEX
+# ===========================================
+@receiver(post_save, sender=Lead)
+def update_lead_name_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'company_name' not in update_fields):
+        return
+    index_lead_name(instance)
+
+
+# ===========================================
+# SEARCH TEXT STORE
+# ===========================================
+def update_search_document(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        index_search_document(instance, created=created)
+
+
+def remove_search_document(sender, instance, **kwargs):
+    unindex_search_document(instance)
+
+
+for model in (CallHistory, StageHistory, RegretOffer, FutureRequirement, Meeting, AdditionalContact):
+    assert model.__name__ in SEARCH_SOURCES
+    uid = model.__name__
+    post_save.connect(update_search_document, sender=model, dispatch_uid=f'search_save_{uid}')
+    post_delete.connect(remove_search_document, sender=model, dispatch_uid=f'search_delete_{uid}')
+
+
+# ===========================================
+# AUTOCOMPLETE PREFIX INDEX
+# ===========================================
+@receiver(post_save, sender=Lead)
+def update_autocomplete_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: index_lead(instance))
+
+
+@receiver(post_delete, sender=Lead)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    lead_id = instance.pk
+    transaction.on_commit(lambda: unindex_lead(lead_id))
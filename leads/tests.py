@@ -1,3 +1,1423 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
 
-# Create your tests here.
+import openpyxl
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+from unittest.mock import patch
+from django.urls import reverse
+from django.utils import timezone
+
+from leads.autocomplete import PrefixIndex, lead_tokens, query_terms, reset_index
+from leads.cache import cached_context, cache_stats, get_model_versions, versions_queryset
+from leads.counters import rebuild_counters
+from leads.dashboard import get_dashboard_metrics, scan_dashboard_metrics
+from leads.duplicate_scan import find_duplicate_clusters
+from leads.export import export_chunks
+from leads.filters import DateRangeFilter
+from leads.lists import LISTS, PAGE_SIZE, keyset_filter
+from leads.codes import LEAD_CODE_BLOCK_SIZE, lead_codes, next_lead_code, reserve_block
+from leads.conditional import freshness_queryset, lead_last_modified
+from leads.dossier import LeadDossier
+from leads.reconnect import rebuild_reconnect_cycles
+from leads.search import search_leads
+from leads.timeline import timeline_page, timeline_queryset
+from leads.transitions import BULK_CHUNK_SIZE, bulk_transition, transition
+from leads.middleware import (
+    ProfilerMiddleware, QueryBudgetExceeded, QueryBudgetMiddleware, query_budget, sql_shape,
+)
+from leads.duplicates import _batch_name_candidates, find_name_candidates, name_trigrams, NameMatcher, TopMatches
+from leads.normalize import normalize_phone
+from leads.views import get_current_reconnect_followup_count
+from leads.models import (
+    Lead, CallHistory, RequirementYes, StageHistory, Meeting, Quotation,
+    RegretOffer, FutureRequirement, AdditionalContact, CodeSequence, ImportJob
+)
+
+
+def make_lead(n, stage='prospect', company_name=None, **extra):
+    return Lead.objects.create(
+        lead_code=f"EP{n:05d}",
+        company_name=company_name or f"Company {n}",
+        city='Pune',
+        state='Maharashtra',
+        stage=stage,
+        **extra
+    )
+
+
+# ===========================================
+# DASHBOARD
+# ===========================================
+class DashboardMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        today = timezone.now().date()
+
+        for i, stage in enumerate(['prospect', 'prospect', 'requirement_yes', 'requirement_yes', 'future', 'regret']):
+            make_lead(i + 1, stage=stage, created_by=cls.user)
+
+        for lead, sales_stage in zip(
+            Lead.objects.filter(stage='requirement_yes'),
+            ['order_completed', 'order_lost'],
+        ):
+            requirement = RequirementYes.objects.create(
+                lead=lead, client_type_main='END_CLIENT', sales_stage=sales_stage
+            )
+            Meeting.objects.create(requirement=requirement, meeting_date=today)
+            StageHistory.objects.create(lead=lead, from_stage='prospect', to_stage='requirement_yes')
+
+        FutureRequirement.objects.create(
+            lead=Lead.objects.get(stage='future'), client_type_main='END_CLIENT',
+            followup_date=today - timedelta(days=1), remark='Call back'
+        )
+        RegretOffer.objects.create(
+            lead=Lead.objects.get(stage='regret'), client_type_main='END_CLIENT',
+            tank_type='GFS', followup_date=today + timedelta(days=3), remark='Went elsewhere'
+        )
+
+    def test_metrics_values(self):
+        metrics = get_dashboard_metrics()
+
+        self.assertEqual(metrics['total_leads'], 6)
+        self.assertEqual(metrics['prospect_leads'], 2)
+        self.assertEqual(metrics['requirement_yes_leads'], 2)
+        self.assertEqual(metrics['converted_customers'], 1)
+        self.assertEqual(metrics['lost_orders'], 1)
+        self.assertEqual(metrics['pipeline_stages']['order_lost'], 1)
+        self.assertEqual(metrics['pipeline_stages']['costing_created'], 0)
+        self.assertEqual(metrics['overdue_followups'], 1)
+        self.assertEqual(metrics['overdue_future'], 1)
+        self.assertEqual(metrics['upcoming_followups'], 1)
+        self.assertEqual(metrics['meetings_today'], 2)
+        self.assertEqual(metrics['conversions_this_month'], 2)
+        self.assertEqual(metrics['conversion_rate'], 50.0)
+        self.assertEqual(metrics, scan_dashboard_metrics())
+
+    def test_counters_follow_updates_and_deletes(self):
+        lead = Lead.objects.get(stage='future')
+        lead.stage = 'regret'
+        lead.save()
+
+        future_req = FutureRequirement.objects.get(lead=lead)
+        future_req.followup_date = (timezone.now().date() + timedelta(days=2)).isoformat()
+        future_req.save()
+
+        RequirementYes.objects.filter(sales_stage='order_lost').delete()
+        Lead.objects.filter(stage='prospect').first().delete()
+
+        metrics = get_dashboard_metrics()
+        self.assertEqual(metrics['regret_leads'], 2)
+        self.assertEqual(metrics['lost_orders'], 0)
+        self.assertEqual(metrics['total_leads'], 5)
+        self.assertEqual(metrics, scan_dashboard_metrics())
+
+    def test_rebuild_fixes_drift(self):
+        Lead.objects.filter(stage='prospect').update(stage='future')
+        self.assertNotEqual(get_dashboard_metrics(), scan_dashboard_metrics())
+
+        self.assertEqual(rebuild_counters(dry_run=True), 2)
+        self.assertEqual(rebuild_counters(), 2)
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+        self.assertEqual(get_dashboard_metrics(), scan_dashboard_metrics())
+
+    def test_dashboard_query_count(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        # session + user + profile, one counter query, four activity feeds
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+        # Cached: only session + user + profile
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_leads'], 6)
+
+
+# ===========================================
+# PAGE CACHE
+# ===========================================
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_write_invalidates_cached_context(self):
+        build = lambda: list(Lead.objects.values_list('company_name', flat=True))
+        self.assertEqual(cached_context('names', (Lead,), build), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_lead(1)
+        self.assertEqual(cached_context('names', (Lead,), build), ['Company 1'])
+
+        with self.assertNumQueries(0):
+            cached_context('names', (Lead,), build)
+
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 2, 'waits': 0, 'builds': 2})
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        threads = [
+            threading.Thread(target=cached_context, args=('slow', (Lead,), build))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(cache_stats()['waits'], 4)
+
+
+# ===========================================
+# DUPLICATE DETECTION
+# ===========================================
+class DuplicateCheckTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        cls.reliance = make_lead(
+            1, company_name='Reliance Industries Pvt Ltd',
+            contact_email='Mukesh@Reliance.com', contact_phone='+91 98765-43210',
+        )
+        tata = make_lead(2, company_name='Tata Motors Ltd')
+        make_lead(3, company_name='Larsen & Toubro Limited')
+        AdditionalContact.objects.create(lead=tata, contact_type='phone', contact_value='022 2222 3333')
+
+    def test_trigrams_ignore_legal_suffixes(self):
+        self.assertEqual(name_trigrams('Tata Motors Pvt. Ltd.'), name_trigrams('tata  motors'))
+
+    def test_index_follows_renames(self):
+        self.assertEqual(find_name_candidates('Reliance Industries'), [self.reliance.id])
+
+        self.reliance.company_name = 'Adani Green'
+        self.reliance.save()
+        self.assertEqual(find_name_candidates('Reliance Industries'), [])
+        self.assertEqual(find_name_candidates('Adani Green Energy'), [self.reliance.id])
+
+    def test_check_duplicates_fuzzy_match(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('check_duplicates'), {'company_name': 'Reliance Industry'})
+
+        matches = response.json()['matches']
+        self.assertEqual([m['lead_code'] for m in matches], ['EP00001'])
+        self.assertEqual(matches[0]['match_type'], 'company_name')
+
+    def test_phone_normalization(self):
+        for phone in ['+91 98765-43210', '09876543210', '9876543210', '0091 9876543210']:
+            self.assertEqual(normalize_phone(phone), '919876543210')
+
+    def test_check_duplicates_exact_contact_keys(self):
+        self.client.force_login(self.user)
+        url = reverse('check_duplicates')
+
+        matches = self.client.get(url, {'email': ' mukesh@reliance.COM'}).json()['matches']
+        self.assertEqual([(m['lead_code'], m['match_type']) for m in matches], [('EP00001', 'email')])
+
+        matches = self.client.get(url, {'phone': '98765 43210'}).json()['matches']
+        self.assertEqual([(m['lead_code'], m['match_type']) for m in matches], [('EP00001', 'phone')])
+
+        # Additional contacts are matched too
+        matches = self.client.get(url, {'phone': '02222223333'}).json()['matches']
+        self.assertEqual([m['lead_code'] for m in matches], ['EP00002'])
+
+    def test_universal_search_contact_prefix(self):
+        self.client.force_login(self.user)
+        url = reverse('universal_search')
+
+        results = self.client.get(url, {'q': 'Mukesh@'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00001'])
+
+        results = self.client.get(url, {'q': '98765'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00001'])
+
+    def test_bounded_matcher_keeps_best_k(self):
+        names = ['Acme Tanks', 'Acme Tank', 'Acme Tankz', 'Acme', 'Zenith Tanks', 'Acme Tanks Co']
+        matcher = NameMatcher('acme tanks')
+        top_matches = TopMatches(k=2)
+        for lead_id, name in enumerate(names):
+            similarity = matcher.score(name, floor=top_matches.floor())
+            if similarity is not None:
+                top_matches.add({'id': lead_id, 'match_score': int(similarity * 100)})
+
+        # 'Acme Tank' and 'Acme Tankz' tie at 94; the first one seen wins
+        self.assertEqual([m['id'] for m in top_matches.results()], [0, 1])
+
+    def test_batch_check_matches_single_check(self):
+        self.client.force_login(self.user)
+        records = [
+            {'company_name': 'Reliance Industry', 'email': '', 'phone': ''},
+            {'company_name': '', 'email': 'mukesh@reliance.com', 'phone': '+91 9876543210'},
+            {'company_name': 'Tata Motor', 'email': '', 'phone': '022 2222 3333'},
+            {'company_name': 'Nothing Alike', 'email': 'x@y.z', 'phone': '1'},
+        ]
+
+        with self.assertNumQueries(8):  # session + user + 6 lookups
+            response = self.client.post(
+                reverse('check_duplicates_batch'),
+                json.dumps({'records': records * 10}),
+                content_type='application/json',
+            )
+        results = response.json()['results']
+        self.assertEqual(len(results), 40)
+
+        for record, result in zip(records, results):
+            single = self.client.get(reverse('check_duplicates'), {
+                'company_name': record['company_name'], 'email': record['email'], 'phone': record['phone'],
+            }).json()['matches']
+            self.assertEqual(result['matches'], single)
+
+    def test_batch_check_breaks_ties_like_single_check(self):
+        self.client.force_login(self.user)
+        acme = [make_lead(n, company_name='Acme Tanks') for n in range(10, 17)]
+        # Same score and same creation time: only the id order tells them apart
+        Lead.objects.filter(id__in=[lead.id for lead in acme]).update(created_at=timezone.now())
+        records = [{'company_name': 'Acme Tanks', 'email': '', 'phone': ''},
+                   {'company_name': 'Acme Tank', 'email': '', 'phone': ''}]
+
+        results = self.client.post(
+            reverse('check_duplicates_batch'), json.dumps({'records': records}), content_type='application/json',
+        ).json()['results']
+        for record, result in zip(records, results):
+            single = self.client.get(reverse('check_duplicates'), record).json()['matches']
+            self.assertEqual(len(single), 5)
+            self.assertEqual(result['matches'], single)
+
+        # The shared candidate query cuts ties at the limit by lead id, as the single one does
+        self.assertEqual(
+            _batch_name_candidates([name_trigrams('Acme Tanks'), set()], limit=3),
+            [find_name_candidates('Acme Tanks', limit=3), []],
+        )
+
+    def test_batch_check_rejects_bad_body(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('check_duplicates_batch'), '{"records": "nope"}', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_offline_scan_clusters_duplicates(self):
+        make_lead(4, company_name='Reliance Industries Ltd.')
+        make_lead(5, company_name='Tata Motor Co', contact_phone='02222223333')
+        make_lead(6, company_name='Unrelated Name')
+
+        clusters = {
+            tuple(Lead.objects.get(id=i).lead_code for i in ids): tuple(reasons)
+            for ids, reasons in find_duplicate_clusters(partitions=4)
+        }
+        self.assertEqual(clusters, {
+            ('EP00001', 'EP00004'): ('company_name',),
+            ('EP00002', 'EP00005'): ('company_name', 'phone'),
+        })
+
+    def test_universal_search_full_text(self):
+        self.client.force_login(self.user)
+        url = reverse('universal_search')
+
+        results = self.client.get(url, {'q': 'relia ind'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00001'])
+
+        # Triggers keep the index in sync with edits
+        self.reliance.company_name = 'Adani Green'
+        self.reliance.save()
+        self.assertEqual(self.client.get(url, {'q': 'relia ind'}).json()['count'], 0)
+        results = self.client.get(url, {'q': 'adani'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00001'])
+
+    def test_universal_search_notes_paged(self):
+        self.client.force_login(self.user)
+        url = reverse('universal_search')
+        today = timezone.now().date()
+        for n in range(4, 29):
+            lead = make_lead(n)
+            CallHistory.objects.create(
+                lead=lead, actual_call_date=today, outcome='future',
+                remark=f'Asked about boiler retrofit, call {n}',
+            )
+
+        first = self.client.get(url, {'q': 'boiler'}).json()
+        self.assertEqual(first['count'], 20)
+        self.assertIn('\x02boiler\x03', first['results'][0]['matches'][0]['snippet'])
+        self.assertEqual(first['results'][0]['matches'][0]['source'], 'call')
+
+        second = self.client.get(url, {'q': 'boiler', 'cursor': first['next_cursor']}).json()
+        self.assertEqual(second['count'], 5)
+        self.assertIsNone(second['next_cursor'])
+        seen = [r['id'] for r in first['results'] + second['results']]
+        self.assertEqual(len(set(seen)), 25)
+
+        # Deleting the remark drops it from the index
+        CallHistory.objects.filter(lead__lead_code='EP00004').delete()
+        codes = [r['lead_code'] for r in self.client.get(url, {'q': 'boiler'}).json()['results']]
+        self.assertNotIn('EP00004', codes)
+
+        self.assertEqual(self.client.get(url, {'q': 'boiler', 'cursor': '!!'}).status_code, 400)
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        cls.reliance = make_lead(
+            1, company_name='Reliance Industries Pvt Ltd',
+            contact_name='Mukesh Ambani', contact_phone='+91 98765-43210',
+        )
+        make_lead(2, company_name='Reliable Pumps')
+
+    def setUp(self):
+        # The index is process-wide; don't let it outlive the test transaction
+        reset_index()
+        self.addCleanup(reset_index)
+
+    def test_prefix_index_updates_in_place(self):
+        index = PrefixIndex.build([
+            (1, 'EP00001', 'Reliance Industries', 'Mukesh', '', '919876543210'),
+            (2, 'EP00002', 'Reliable Pumps', '', '', ''),
+        ])
+        self.assertEqual(index.search(query_terms('reli')), [2, 1])
+        self.assertEqual(index.search(query_terms('reli muk')), [1])
+        self.assertEqual(index.search(query_terms('98765')), [1])
+
+        index.update(1, lead_tokens('EP00001', 'Adani Green', '', '', ''))
+        self.assertEqual(index.search(query_terms('reli')), [2])
+        self.assertEqual(index.search(query_terms('adani')), [1])
+
+        index.remove(2)
+        self.assertEqual(index.search(query_terms('reli')), [])
+        self.assertEqual(len(index), len(lead_tokens('EP00001', 'Adani Green', '', '', '')))
+
+    def test_prefix_index_memory_ceiling(self):
+        rows = [(n, f'EP{n:05d}', f'Company {n}', '', '', '') for n in range(10)]
+        self.assertTrue(PrefixIndex.build(rows, max_entries=11).overflowed)
+
+        index = PrefixIndex.build(rows[:5], max_entries=11)
+        self.assertFalse(index.overflowed)
+        index.update(99, lead_tokens('EP00099', 'Acme Tanks Co', '', '', ''))
+        self.assertTrue(index.overflowed)
+
+    def test_autocomplete_api(self):
+        self.client.force_login(self.user)
+        url = reverse('autocomplete')
+
+        results = self.client.get(url, {'q': 'reli'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00002', 'EP00001'])
+
+        # Once built, only the matched leads are loaded (plus session/user)
+        with self.assertNumQueries(3):
+            results = self.client.get(url, {'q': '+91 98765'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00001'])
+
+        # Committed writes update the index in place
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reliance.company_name = 'Adani Green'
+            self.reliance.save()
+        results = self.client.get(url, {'q': 'reli'}).json()['results']
+        self.assertEqual([r['lead_code'] for r in results], ['EP00002'])
+
+
+# ===========================================
+# KEYSET-PAGED LISTS
+# ===========================================
+class KeysetListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        Lead.objects.bulk_create([
+            Lead(lead_code=f"EP{n:05d}", company_name=f"Company {n}", city='Pune',
+                 state='Maharashtra', stage='prospect')
+            for n in range(1, 121)
+        ])
+        # Many rows share a created_at, so the id tiebreak matters
+        Lead.objects.filter(id__lte=60).update(created_at=timezone.now() - timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_api_walks_every_row_once(self):
+        url = reverse('list_api', args=['prospects'])
+        seen, cursor = [], None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            # session + user + profile + one page query, whatever the page
+            with self.assertNumQueries(4):
+                data = self.client.get(url, params).json()
+            seen += [row['lead_code'] for row in data['results']]
+            self.assertEqual(data['html'].count('<tr'), data['count'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(Lead.objects.order_by('-created_at', '-id').values_list('lead_code', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_list_page_renders_first_page(self):
+        response = self.client.get(reverse('lead_list'))
+        self.assertEqual(len(response.context['leads']), 50)
+        self.assertContains(response, 'data-infinite-scroll')
+
+    def test_invalid_cursor_and_list(self):
+        self.assertEqual(self.client.get(reverse('list_api', args=['prospects']), {'cursor': 'bad'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('list_api', args=['nope'])).status_code, 404)
+
+    def test_filtered_sorted_api_pages(self):
+        Lead.objects.filter(id__gt=100).update(city='Nashik')
+        url = reverse('list_api', args=['prospects'])
+        seen, cursor = [], None
+        while True:
+            params = {'city': 'Pune', 'sort': 'oldest', **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(url, params).json()
+            seen += [row['lead_code'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        expected = list(
+            Lead.objects.filter(city='Pune').order_by('created_at', 'id').values_list('lead_code', flat=True)
+        )
+        self.assertEqual(len(seen), 100)
+        self.assertEqual(seen, expected)
+
+    def test_invalid_sort_filter_and_mixed_cursor(self):
+        url = reverse('list_api', args=['prospects'])
+        self.assertEqual(self.client.get(url, {'sort': 'company_name'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'created_from': 'yesterday'}).status_code, 400)
+        # A cursor only pages the sort it was issued for
+        cursor = self.client.get(url).json()['next_cursor']
+        self.assertEqual(self.client.get(url, {'cursor': cursor, 'sort': 'oldest'}).status_code, 400)
+
+    def test_list_page_filter_bar(self):
+        response = self.client.get(reverse('lead_list'), {'city': 'Nashik'})
+        self.assertEqual(len(response.context['leads']), 0)
+        self.assertEqual(response.context['export_query'], 'city=Nashik')
+        self.assertContains(response, 'name="city" value="Nashik"')
+        # A bad filter falls back to the full list instead of erroring
+        response = self.client.get(reverse('lead_list'), {'sort': 'bogus'})
+        self.assertEqual(len(response.context['leads']), 50)
+        self.assertEqual(response.context['filter_error'], 'Invalid sort')
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        for n in range(1, 4):
+            lead = make_lead(n, stage='requirement_yes')
+            RequirementYes.objects.create(
+                lead=lead, client_type_main='Contractor', sales_stage='order_completed',
+                tanks_json=[{'tank_type': 'GFS', 'capacity': '500', 'quantity': 2}],
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_csv_export_streams_flattened_rows(self):
+        response = self.client.get(reverse('export_list', args=['customers']))
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][rows[0].index('tanks')], '2 x GFS (500)')
+
+    def test_gzipped_jsonl_export(self):
+        response = self.client.get(reverse('export_list', args=['customers']), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(sorted(r['lead_code'] for r in records), ['EP00001', 'EP00002', 'EP00003'])
+        self.assertEqual(records[0]['tanks'][0]['quantity'], 2)
+
+    def test_export_applies_filters(self):
+        RequirementYes.objects.filter(lead__lead_code='EP00002').update(client_type_main='Consultant')
+        response = self.client.get(reverse('export_list', args=['customers']), {'client_type': 'Consultant'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row[0] for row in rows[1:]], ['EP00002'])
+
+    def test_export_memory_is_flat(self):
+        # Chunks are bounded by ROWS_PER_CHUNK, not by the table size
+        with patch('leads.export.ROWS_PER_CHUNK', 1):
+            chunks = list(export_chunks('customers'))
+        self.assertEqual(len(chunks), 3)
+
+
+# ===========================================
+# LEAD DETAIL PAGES
+# ===========================================
+class ReconnectCycleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        cls.lead = make_lead(1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def call(self, lead, outcome, remark, days_ago=0):
+        CallHistory.objects.create(
+            lead=lead, outcome=outcome, remark=remark, created_by=self.user,
+            actual_call_date=timezone.now().date() - timedelta(days=days_ago),
+        )
+
+    def test_followups_are_counted_on_the_lead(self):
+        self.call(self.lead, 'reconnect', 'Call back next week')
+        url = reverse('send_followup', args=[self.lead.id])
+        for _ in range(4):
+            self.client.post(url)
+
+        self.lead.refresh_from_db()
+        self.assertEqual(self.lead.reconnect_cycle_start, timezone.now().date())
+        self.assertEqual(self.lead.reconnect_followups, 3)
+        # The fourth click was refused
+        self.assertEqual(CallHistory.objects.filter(lead=self.lead, remark__startswith='Followup Sent').count(), 3)
+
+        with self.assertNumQueries(0):
+            status = get_current_reconnect_followup_count(self.lead)
+        self.assertFalse(status['can_send_followup'])
+
+        # Any other outcome closes the cycle
+        self.call(self.lead, 'future', 'Budget next year')
+        self.lead.refresh_from_db()
+        self.assertEqual((self.lead.reconnect_cycle_start, self.lead.reconnect_followups), (None, 0))
+
+    def test_rebuild_matches_signals(self):
+        second, third = make_lead(2), make_lead(3)
+        self.call(self.lead, 'reconnect', 'Busy', days_ago=5)
+        self.call(self.lead, 'reconnect', 'Followup Sent 1', days_ago=4)
+        self.call(second, 'future', 'Later', days_ago=3)
+        self.call(second, 'reconnect', 'Call back', days_ago=2)
+        self.call(second, 'reconnect', 'Followup Sent 1', days_ago=1)
+        self.call(second, 'reconnect', 'Followup Sent 2')
+        self.call(third, 'reconnect', 'Followup Sent 1', days_ago=1)
+        self.call(third, 'regret', 'Bought elsewhere')
+
+        fields = ('id', 'reconnect_cycle_start', 'reconnect_followups')
+        maintained = list(Lead.objects.order_by('id').values_list(*fields))
+        Lead.objects.update(reconnect_cycle_start=None, reconnect_followups=0)
+        rebuild_reconnect_cycles()
+        self.assertEqual(list(Lead.objects.order_by('id').values_list(*fields)), maintained)
+        self.assertEqual([row[2] for row in maintained], [1, 2, 0])
+
+    def test_prospects_with_followups_due(self):
+        done = make_lead(2)
+        self.call(self.lead, 'reconnect', 'Call back')
+        self.call(done, 'reconnect', 'Call back')
+        Lead.objects.filter(pk=done.pk).update(reconnect_followups=3)
+
+        rows, _ = LISTS['prospects'].page('marketing', params={'reconnect': 'due'})
+        self.assertEqual([lead.lead_code for lead in rows], ['EP00001'])
+
+
+class LeadDossierTests(TestCase):
+    """Every detail page loads in the same number of queries however long the history"""
+
+    # session + user + freshness + profile + lead with state rows + closing stage changes + timeline page
+    DETAIL_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        today = timezone.now().date()
+        cls.pages = {}
+        for n, (view, stage, state) in enumerate([
+            ('lead_detail', 'prospect', None),
+            ('requirement_yes_detail', 'requirement_yes', {'sales_stage': 'quotation_sent'}),
+            ('customer_detail', 'requirement_yes', {'sales_stage': 'order_completed'}),
+            ('lost_order_detail', 'requirement_yes', {'sales_stage': 'order_lost'}),
+            ('future_requirement_detail', 'future', 'future'),
+            ('regret_offer_detail', 'regret', 'regret'),
+        ], 1):
+            lead = make_lead(n, stage=stage)
+            if isinstance(state, dict):
+                requirement = RequirementYes.objects.create(lead=lead, client_type_main='Contractor', **state)
+                Meeting.objects.create(requirement=requirement, meeting_date=today)
+                Quotation.objects.create(requirement=requirement, expected_date=today)
+                StageHistory.objects.create(lead=lead, from_stage='quotation_sent', to_stage=state['sales_stage'],
+                                            changed_by=cls.user, notes='Closed')
+            elif state == 'future':
+                FutureRequirement.objects.create(lead=lead, client_type_main='Contractor', followup_date=today)
+            elif state == 'regret':
+                RegretOffer.objects.create(lead=lead, client_type_main='Contractor', followup_date=today)
+            cls.pages[view] = lead
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_history(self, lead, count):
+        CallHistory.objects.bulk_create([
+            CallHistory(lead=lead, actual_call_date=timezone.now().date(), outcome='reconnect', remark=f'Call {n}')
+            for n in range(count)
+        ])
+        StageHistory.objects.bulk_create([
+            StageHistory(lead=lead, from_stage='prospect', to_stage='prospect') for _ in range(count)
+        ])
+
+    def test_detail_pages_use_a_fixed_number_of_queries(self):
+        for view, lead in self.pages.items():
+            with self.subTest(view):
+                url = reverse(view, args=[lead.id])
+                with self.assertNumQueries(self.DETAIL_QUERIES):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.add_history(lead, 30)
+                with self.assertNumQueries(self.DETAIL_QUERIES):
+                    self.client.get(url)
+
+    def test_closing_record_and_missing_state(self):
+        dossier = LeadDossier.load(self.pages['customer_detail'].id, require='requirement')
+        self.assertEqual(dossier.closing_record('order_completed').changed_by, self.user)
+        self.assertIsNone(dossier.regret_offer)
+        response = self.client.get(reverse('regret_offer_detail', args=[self.pages['lead_detail'].id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_prospect_page_checks_the_role_before_loading(self):
+        url = reverse('lead_detail', args=[self.pages['lead_detail'].id])
+        self.user.profile.role = 'sales'
+        self.user.profile.save()
+        with patch('leads.views.LeadDossier.load') as load:
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.post(url, {'action': 'send_followup'}).status_code, 403)
+        load.assert_not_called()
+
+
+class ConditionalGetTests(TestCase):
+    """Detail pages and search APIs answer 304 while nothing they show has changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sales', password='pass')
+        cls.lead = make_lead(1, stage='requirement_yes')
+        cls.requirement = RequirementYes.objects.create(lead=cls.lead, client_type_main='Contractor')
+        cls.quotation = Quotation.objects.create(requirement=cls.requirement, expected_date=timezone.now().date())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('requirement_yes_detail', args=[self.lead.id])
+
+    def revalidate(self, url, response, params=None):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_detail_page_not_modified_until_a_child_row_changes(self):
+        self.client.get(self.url)  # sets the CSRF cookie the page's ETag covers
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        # session + user + freshness: no lead, timeline or template work
+        with self.assertNumQueries(3):
+            self.assertEqual(self.revalidate(self.url, first).status_code, 304)
+
+        CallHistory.objects.create(lead=self.lead, actual_call_date=timezone.now().date(),
+                                   outcome='yes', remark='Called')
+        second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+        self.quotation.quotation_number = 'Q-2'
+        self.quotation.save()
+        self.assertEqual(self.revalidate(self.url, second).status_code, 200)
+
+    def test_validators_are_per_user_and_skipped_with_pending_messages(self):
+        self.client.get(self.url)
+        first = self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('other', password='pass'))
+        self.assertEqual(self.revalidate(self.url, first).status_code, 200)
+
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.client.post(self.url, {'action': 'schedule_meeting'})  # flashes an error, changes nothing
+        flashed = self.revalidate(self.url, response)
+        self.assertEqual(flashed.status_code, 200)
+        self.assertFalse(flashed.has_header('ETag'))
+
+    def test_last_modified_and_missing_lead(self):
+        latest = Quotation.objects.get().updated_at
+        with self.assertNumQueries(1):
+            self.assertEqual(lead_last_modified(self.lead.id), latest)
+        self.assertIsNone(lead_last_modified(999))
+        self.assertEqual(self.client.get(reverse('requirement_yes_detail', args=[999])).status_code, 404)
+
+    def test_search_apis_not_modified_until_leads_change(self):
+        for n, (url, params) in enumerate([
+            (reverse('universal_search'), {'q': 'Company'}),
+            (reverse('check_duplicates'), {'company_name': 'Company 1'}),
+        ], 2):
+            with self.subTest(url):
+                first = self.client.get(url, params)
+                self.assertEqual(first.status_code, 200)
+                # session + user + table versions
+                with self.assertNumQueries(3):
+                    self.assertEqual(self.revalidate(url, first, params).status_code, 304)
+                self.assertEqual(self.revalidate(url, first, {**params, 'extra': 1}).status_code, 200)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    make_lead(n)
+                self.assertEqual(self.revalidate(url, first, params).status_code, 200)
+
+    def test_search_apis_see_writes_from_other_processes(self):
+        url, params = reverse('check_duplicates'), {'company_name': 'Company 1'}
+        first = self.client.get(url, params)
+        # As from another worker: this process's cache generations don't move
+        with patch('leads.cache._bump'), self.captureOnCommitCallbacks(execute=True):
+            AdditionalContact.objects.create(lead=self.lead, contact_type='email', contact_value='ops@example.com')
+        self.assertEqual(self.revalidate(url, first, params).status_code, 200)
+        self.assertEqual(get_model_versions(Lead, AdditionalContact), [0, 1])
+
+
+class TimelineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('sales', password='pass')
+        cls.lead = make_lead(1, stage='requirement_yes')
+        for n in range(5):
+            CallHistory.objects.create(
+                lead=cls.lead, actual_call_date=timezone.now().date(), outcome='reconnect',
+                remark=f'Call {n}', created_by=cls.user,
+            )
+        StageHistory.objects.create(lead=cls.lead, from_stage='prospect', to_stage='requirement_yes', changed_by=cls.user)
+        requirement = RequirementYes.objects.create(lead=cls.lead, client_type_main='Contractor', sales_stage='order_completed')
+        Meeting.objects.create(requirement=requirement, meeting_date=timezone.now().date(), notes='Site visit')
+        Quotation.objects.create(requirement=requirement, expected_date=timezone.now().date(), quotation_number='Q-1')
+        # Rows saved in the same instant must still page in a stable order
+        CallHistory.objects.filter(remark__in=['Call 1', 'Call 2']).update(created_at=timezone.now() - timedelta(days=1))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_api_walks_every_entry_once(self):
+        url = reverse('lead_timeline', args=[self.lead.id])
+        seen, cursor = [], None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            with patch('leads.timeline.TIMELINE_PAGE_SIZE', 3):
+                data = self.client.get(url, params).json()
+            seen += [(entry['kind'], entry['row_id']) for entry in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(len(seen), 8)
+        self.assertEqual(len(set(seen)), 8)
+        self.assertEqual(seen[0], ('quotation', 1))
+        self.assertEqual({kind for kind, _ in seen}, {'call', 'stage', 'meeting', 'quotation'})
+
+    def test_one_query_per_page(self):
+        with self.assertNumQueries(1):
+            entries, cursor = timeline_page(self.lead.id, limit=4)
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(entries[0]['label'], 'Quotation Q-1')
+        self.assertIsNotNone(cursor)
+
+    def test_calls_sort_by_the_day_they_were_made(self):
+        today = timezone.localdate()
+        backdated = CallHistory.objects.create(
+            lead=self.lead, actual_call_date=today - timedelta(days=3), expected_call_date=today - timedelta(days=4),
+            outcome='yes', remark='Logged late', created_by=self.user,
+        )
+        entries, _ = timeline_page(self.lead.id, limit=20)
+        self.assertEqual(entries[-1]['row_id'], backdated.id)
+        self.assertEqual(entries[-1]['expected_on'], today - timedelta(days=4))
+
+        # Paging across the day boundary still visits every entry once
+        seen, cursor = [], None
+        while True:
+            page, cursor = timeline_page(self.lead.id, cursor, limit=2)
+            seen += [(entry['kind'], entry['row_id']) for entry in page]
+            if not cursor:
+                break
+        self.assertEqual(seen, [(entry['kind'], entry['row_id']) for entry in entries])
+
+        response = self.client.get(reverse('customer_detail', args=[self.lead.id]))
+        self.assertContains(response, f'Expected: {(today - timedelta(days=4)):%d %b %Y}')
+
+    def test_detail_page_renders_first_page(self):
+        with patch('leads.timeline.TIMELINE_PAGE_SIZE', 4):
+            response = self.client.get(reverse('customer_detail', args=[self.lead.id]))
+        self.assertContains(response, 'Site visit')
+        self.assertContains(response, 'data-timeline-more')
+
+    def test_invalid_cursor(self):
+        url = reverse('lead_timeline', args=[self.lead.id])
+        self.assertEqual(self.client.get(url, {'cursor': 'bad'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('lead_timeline', args=[999])).status_code, 404)
+
+
+# ===========================================
+# STAGE TRANSITIONS
+# ===========================================
+class TransitionTests(TestCase):
+    """Stage moves go through one service that writes only what changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        cls.followup = timezone.localdate() + timedelta(days=30)
+
+    def regret(self, **extra):
+        return {'client_type_main': 'EPC', 'tank_type': 'GRP Tank', 'followup_date': self.followup,
+                'remark': 'Went with GRP', **extra}
+
+    def warm_counters(self, *moves):
+        # Counter rows are created on first use; count queries once they exist
+        warm = make_lead(999)
+        for to_stage, state in moves:
+            transition(warm.id, to_stage, self.user, notes='warm', state=state)
+
+    def test_prospect_to_regret_query_count(self):
+        self.warm_counters(('regret', self.regret()))
+        lead = make_lead(1)
+        # savepoint, locked read, lead UPDATE, 2 stage counters, regret INSERT
+        # + counter + text, history INSERT + counter + text, release
+        with self.assertNumQueries(12):
+            transition(lead.id, 'regret', self.user, notes='Lost to GRP', state=self.regret())
+
+        lead.refresh_from_db()
+        self.assertEqual(lead.stage, 'regret')
+        regret = RegretOffer.objects.get(lead=lead)
+        self.assertEqual(
+            (regret.client_type_main, regret.client_type_detail, regret.tank_type, regret.tank_type_other, regret.remark),
+            ('EPC', None, 'GRP Tank', None, 'Went with GRP'),
+        )
+        self.assertEqual(list(StageHistory.objects.filter(lead=lead).values_list('from_stage', 'to_stage')),
+                         [('prospect', 'regret')])
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_leaving_regret_deletes_only_its_row(self):
+        self.warm_counters(('regret', self.regret()), ('prospect', None))
+        lead = make_lead(1)
+        transition(lead.id, 'regret', self.user, state=self.regret())
+
+        with CaptureQueriesContext(connection) as queries:
+            transition(lead.id, 'prospect', self.user, notes='Re-engaged')
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertIn('leads_regretoffer', deletes[0])
+        self.assertIn('leads_searchdocument', deletes[1])
+        # savepoint, locked read, regret DELETE + counter + text, lead UPDATE,
+        # 2 stage counters, history INSERT + counter + text, release
+        self.assertEqual(len(queries), 12)
+        self.assertFalse(RegretOffer.objects.filter(lead=lead).exists())
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_only_changed_fields_are_written(self):
+        lead = make_lead(1, stage='requirement_yes')
+        requirement = RequirementYes.objects.create(lead=lead, client_type_main='EPC', tank_application='Fire')
+
+        # Nothing changes: only the locked read, inside its savepoint
+        with self.assertNumQueries(3):
+            transition(lead.id, 'requirement_yes', self.user,
+                       lead_fields={'client_type_main': None}, state={'client_type_main': 'EPC'})
+
+        with CaptureQueriesContext(connection) as queries:
+            transition(lead.id, 'requirement_yes', self.user, state={'client_type_main': 'EPC', 'tank_location': 'Roof'})
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "leads_requirementyes" SET "tank_location" = .*, "updated_at" = [^,]* WHERE')
+        requirement.refresh_from_db()
+        self.assertEqual(requirement.tank_location, 'Roof')
+        self.assertFalse(StageHistory.objects.filter(lead=lead).exists())
+
+    def test_moves_outside_the_table_are_refused(self):
+        lead = make_lead(1, stage='requirement_yes')
+        with self.assertRaises(ValueError):
+            transition(lead.id, 'future', self.user, state={'client_type_main': 'EPC', 'remark': 'Later',
+                                                             'followup_date': self.followup})
+        lead.refresh_from_db()
+        self.assertEqual(lead.stage, 'requirement_yes')
+        self.assertFalse(FutureRequirement.objects.exists())
+
+    def test_call_outcome_records_one_call(self):
+        lead = make_lead(1)
+        self.client.force_login(self.user)
+        self.client.post(reverse('lead_detail', args=[lead.id]), {
+            'actual_call_date': timezone.localdate(), 'outcome': 'future', 'client_type_future': 'EPC',
+            'followup_date_future': self.followup, 'remark_future': 'Budget next year',
+        })
+        lead.refresh_from_db()
+        self.assertEqual(lead.stage, 'future')
+        self.assertEqual(CallHistory.objects.filter(lead=lead).count(), 1)
+        self.assertEqual(StageHistory.objects.filter(lead=lead).count(), 1)
+
+        # Reconnecting brings it back to prospect and drops the future requirement
+        self.client.post(reverse('lead_detail', args=[lead.id]), {
+            'actual_call_date': timezone.localdate(), 'outcome': 'reconnect',
+            'followup_date_reconnect': self.followup, 'remark_reconnect': 'Call in a month',
+        })
+        lead.refresh_from_db()
+        self.assertEqual((lead.stage, lead.last_remark), ('prospect', 'Call in a month'))
+        self.assertFalse(FutureRequirement.objects.filter(lead=lead).exists())
+        self.assertEqual(CallHistory.objects.filter(lead=lead, expected_call_date=self.followup).count(), 1)
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_refused_outcome_records_no_call(self):
+        # A stale prospect tab posting for a lead already in requirement_yes
+        lead = make_lead(1, stage='requirement_yes')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('lead_detail', args=[lead.id]), {
+            'actual_call_date': timezone.localdate(), 'outcome': 'reconnect',
+            'followup_date_reconnect': self.followup, 'remark_reconnect': 'Call in a month',
+        })
+        self.assertRedirects(response, reverse('requirement_yes_detail', args=[lead.id]), fetch_redirect_response=False)
+        lead.refresh_from_db()
+        self.assertEqual((lead.stage, lead.reconnect_cycle_start, lead.reconnect_followups), ('requirement_yes', None, 0))
+        self.assertFalse(CallHistory.objects.filter(lead=lead).exists())
+
+        # A handler refusing the outcome rolls the call back too
+        prospect = make_lead(2)
+        self.client.post(reverse('lead_detail', args=[prospect.id]), {
+            'actual_call_date': timezone.localdate(), 'outcome': 'future', 'remark_future': 'No date given',
+        })
+        self.assertFalse(CallHistory.objects.filter(lead=prospect).exists())
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+
+class BulkTransitionTests(TestCase):
+    """Ticked prospects move together, in a query count that grows per chunk, not per lead"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        cls.leads = [make_lead(n) for n in range(1, 2 * BULK_CHUNK_SIZE + 31)]
+
+    def regret_fields(self, **extra):
+        return {'client_type_main': 'EPC', 'tank_type': 'GRP Tank', 'remark': 'Went with GRP',
+                'followup_date': timezone.localdate() + timedelta(days=30), **extra}
+
+    def move(self, leads, to_stage='regret', **fields):
+        return bulk_transition(
+            [lead.id for lead in leads], to_stage, self.user, timezone.localdate(),
+            fields or self.regret_fields(),
+        )
+
+    def test_query_count_grows_with_chunks_not_leads(self):
+        self.move(self.leads[:1])  # first use creates the counter rows
+        few, full, two = self.leads[1:4], self.leads[4:4 + BULK_CHUNK_SIZE], self.leads[4 + BULK_CHUNK_SIZE:]
+        self.assertGreater(len(two), BULK_CHUNK_SIZE)
+
+        counts = []
+        for selection in (few, full, two):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.move(selection)), len(selection))
+            counts.append(len(queries))
+        # savepoint + release around a fixed set of queries per chunk
+        per_chunk = counts[0] - 2
+        self.assertEqual(counts, [2 + per_chunk, 2 + per_chunk, 2 + 2 * per_chunk])
+
+        moved = len(self.leads)
+        self.assertEqual(Lead.objects.filter(stage='regret').count(), moved)
+        self.assertEqual(RegretOffer.objects.count(), moved)
+        self.assertEqual(CallHistory.objects.filter(outcome='regret').count(), moved)
+        self.assertEqual(StageHistory.objects.filter(from_stage='prospect', to_stage='regret').count(), moved)
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+        hits, _, _ = search_leads('grp', limit=moved + 10)
+        self.assertEqual(len(hits), moved)
+
+    def test_skips_leads_that_left_prospect_and_replaces_stale_state(self):
+        lead, gone = self.leads[0], self.leads[1]
+        RegretOffer.objects.create(lead=lead, client_type_main='CONSULTANT', client_type_detail='PMC',
+                                   tank_type='Other', tank_type_other='Steel',
+                                   followup_date=timezone.localdate(), remark='Earlier visit')
+        gone.stage = 'future'
+        gone.save()
+        Lead.objects.filter(pk=lead.pk).update(reconnect_cycle_start=timezone.localdate(), reconnect_followups=2)
+
+        self.assertEqual(self.move([lead, gone, lead]), [lead.id])
+        lead.refresh_from_db()
+        self.assertEqual((lead.stage, lead.reconnect_cycle_start, lead.reconnect_followups), ('regret', None, 0))
+        regret = RegretOffer.objects.get(lead=lead)
+        self.assertEqual(
+            (regret.client_type_main, regret.client_type_detail, regret.tank_type, regret.tank_type_other, regret.remark),
+            ('EPC', None, 'GRP Tank', None, 'Went with GRP'),
+        )
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_list_page_form_moves_selected_leads(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('lead_list')), 'bulk-transition-form')
+
+        data = {'lead_ids': [self.leads[0].id, self.leads[1].id], 'to_stage': 'regret',
+                'actual_call_date': timezone.localdate(), **self.regret_fields()}
+        response = self.client.post(reverse('bulk_transition_leads'), data, follow=True)
+        self.assertContains(response, '2 leads moved to Regret Offer')
+        self.assertEqual(Lead.objects.filter(stage='regret').count(), 2)
+
+        response = self.client.post(reverse('bulk_transition_leads'), {**data, 'tank_type': ''}, follow=True)
+        self.assertContains(response, 'A regret offer needs the competitor tank type')
+
+        self.user.profile.role = 'sales'
+        self.user.profile.save()
+        self.assertEqual(self.client.post(reverse('bulk_transition_leads'), data).status_code, 403)
+
+
+# ===========================================
+# LEAD CODES AND IMPORTS
+# ===========================================
+@contextmanager
+def default_database(alias):
+    """Send this thread's default-database queries to another alias"""
+    default = connections['default']
+    connections['default'] = connections[alias]
+    try:
+        yield
+    finally:
+        connections['default'] = default
+
+
+class LeadCodeTests(TransactionTestCase):
+    """Lead codes come from the sequence table, in blocks, and never collide"""
+
+    # File-backed, IMMEDIATE-mode SQLite: concurrent writers see real locking
+    databases = {'default', 'concurrency'}
+
+    def setUp(self):
+        lead_codes.reset()
+        self.user = User.objects.create_user('marketing', password='pass')
+
+    def tearDown(self):
+        lead_codes.reset()
+
+    def test_concurrent_add_lead_never_collides(self):
+        threads, per_thread = 8, 10
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        with default_database('concurrency'):
+            user = User.objects.create_user('marketing', password='pass')
+
+        def submit(worker):
+            with default_database('concurrency'):
+                add_leads(worker)
+
+        def add_leads(worker):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            try:
+                for n in range(per_thread):
+                    response = client.post(reverse('add_lead'), {
+                        'company_name': f'Worker {worker} Lead {n}', 'city': 'Pune', 'state': 'Maharashtra',
+                        'sector': 'Water', 'source': 'Web', 'contact_name': 'Asha',
+                        'contact_email': f'w{worker}n{n}@example.com', 'contact_phone': f'98765{worker:02d}{n:03d}',
+                    })
+                    if response.status_code != 302:
+                        errors.append((worker, n, response.status_code))
+            except Exception as exc:
+                errors.append((worker, exc))
+            finally:
+                connection.close()
+
+        with patch('leads.codes.reserve_block', wraps=reserve_block) as reserve:
+            workers = [threading.Thread(target=submit, args=(n,)) for n in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(errors, [])
+        codes = list(Lead.objects.using('concurrency').values_list('lead_code', flat=True))
+        self.assertEqual(len(codes), threads * per_thread)
+        self.assertEqual(len(set(codes)), len(codes))
+        # One sequence write per block, not per lead
+        self.assertLess(reserve.call_count, len(codes))
+
+    def test_sequence_continues_after_existing_codes(self):
+        CodeSequence.objects.all().delete()
+        make_lead(41)
+        make_lead(7)
+        self.assertEqual(next_lead_code(), 'EP00042')
+        self.assertEqual(next_lead_code(), 'EP00043')
+        self.assertEqual(CodeSequence.objects.get().next_value, 42 + LEAD_CODE_BLOCK_SIZE)
+
+    def test_rolled_back_block_is_not_pooled(self):
+        with transaction.atomic():
+            code = next_lead_code()
+            transaction.set_rollback(True)
+        self.assertEqual(next_lead_code(), code)
+        self.assertEqual(next_lead_code(), f'EP{int(code[2:]) + 1:05d}')
+
+
+class LeadImportTests(TestCase):
+    """Lead sheets import in committed batches, skipping duplicates and invalid rows"""
+
+    HEADER = ['Company Name', 'City', 'State', 'Sector', 'Source', 'Contact Name', 'Email', 'Phone']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('marketing', password='pass')
+        # make_lead() writes its code directly; keep it clear of the sequence
+        make_lead(900, contact_email='known@example.com', contact_phone='9000000001')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def row(self, n, email=None, phone=None):
+        return [f'Fair Company {n}', 'Pune', 'Maharashtra', 'Water', 'Trade fair', 'Asha',
+                email or f'fair{n}@example.com', phone or f'98{n:08d}']
+
+    def write_sheet(self, rows, name='fair.csv'):
+        path = os.path.join(self.directory, name)
+        if name.endswith('.xlsx'):
+            workbook = openpyxl.Workbook()
+            workbook.active.append(self.HEADER)
+            for row in rows:
+                workbook.active.append(row)
+            workbook.save(path)
+            return path
+        with open(path, 'w', newline='', encoding='utf-8') as sheet:
+            writer = csv.writer(sheet)
+            writer.writerow(self.HEADER)
+            writer.writerows(rows)
+        return path
+
+    def imported(self):
+        return Lead.objects.filter(company_name__startswith='Fair')
+
+    def test_command_imports_valid_unique_rows(self):
+        path = self.write_sheet([self.row(n) for n in range(1, 6)] + [
+            self.row(6, email='fair5@example.com'),  # same batch as row 5
+            self.row(7, email='KNOWN@example.com'),  # existing lead
+            self.row(8, phone='+91 98000 00001'),  # row 1, an earlier batch
+            self.row(9, email='not-an-email'),
+            [''] * len(self.HEADER),
+        ])
+        output = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_leads', path, batch_size=3, user='marketing', stdout=output)
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.total_rows, job.next_row), ('completed', 9, 9))
+        self.assertEqual((job.created_count, job.duplicate_count, job.invalid_count), (5, 3, 1))
+        self.assertEqual([error['row'] for error in job.errors], [7, 8, 9, 10])
+        self.assertIn('Imported 5 leads', output.getvalue())
+
+        codes = set(self.imported().values_list('lead_code', flat=True))
+        self.assertEqual(len(codes), 5)
+        lead = self.imported().get(company_name='Fair Company 2')
+        self.assertEqual((lead.email_key, lead.created_by), ('fair2@example.com', self.user))
+        # Derived state bulk_create skips the signals for
+        self.assertIn(lead.id, find_name_candidates('Fair Company 2'))
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_command_imports_xlsx(self):
+        rows = [self.row(n) for n in range(1, 4)]
+        rows[0][-1] = 9800000001  # phone typed as a number
+        rows.append(self.row(4, email='known@example.com'))
+        path = self.write_sheet(rows, name='fair.xlsx')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_leads', path, batch_size=2, user='marketing', stdout=io.StringIO())
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.total_rows, job.next_row), ('completed', 4, 4))
+        self.assertEqual((job.created_count, job.duplicate_count, job.invalid_count), (3, 1, 0))
+        lead = self.imported().get(company_name='Fair Company 1')
+        self.assertEqual((lead.contact_phone, lead.city, lead.created_by), ('9800000001', 'Pune', self.user))
+        self.assertEqual(rebuild_counters(dry_run=True), 0)
+
+    def test_resume_after_a_failed_batch(self):
+        path = self.write_sheet([self.row(n) for n in range(1, 8)])
+        with patch('leads.imports.build_name_index', side_effect=[None, OperationalError('disk I/O error')]):
+            with self.assertRaisesMessage(CommandError, '--resume'):
+                call_command('import_leads', path, batch_size=3, stdout=io.StringIO())
+
+        job = ImportJob.objects.get()
+        self.assertEqual((job.status, job.next_row, job.created_count), ('failed', 3, 3))
+        self.assertIn('disk I/O error', job.last_error)
+        self.assertEqual(self.imported().count(), 3)
+
+        call_command('import_leads', resume=job.pk, batch_size=3, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.next_row, job.created_count), ('completed', 7, 7))
+        self.assertEqual(self.imported().count(), 7)
+        self.assertEqual(self.imported().values('lead_code').distinct().count(), 7)
+
+    @override_settings(LEADS_IMPORT_IN_BACKGROUND=False)
+    def test_upload_page_imports_and_reports_progress(self):
+        self.client.force_login(self.user)
+        with open(self.write_sheet([self.row(1), self.row(2)]), 'rb') as sheet:
+            upload = SimpleUploadedFile('fair.csv', sheet.read())
+        with override_settings(LEADS_IMPORT_DIR=self.directory):
+            response = self.client.post(reverse('import_leads'), {'sheet': upload})
+            self.assertRedirects(response, reverse('import_leads'))
+            rejected = self.client.post(reverse('import_leads'), {'sheet': SimpleUploadedFile('fair.txt', b'x')}, follow=True)
+        self.assertContains(rejected, 'Only .csv and .xlsx files can be imported')
+        self.assertContains(rejected, 'fair.csv')
+
+        job = ImportJob.objects.get()
+        status = self.client.get(reverse('import_job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['created_count'], status['percent']), ('completed', 2, 100))
+
+        self.user.profile.role = 'sales'
+        self.user.profile.save()
+        self.assertEqual(self.client.get(reverse('import_leads')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('import_job_status', args=[job.id])).status_code, 403)
+
+
+# ===========================================
+# QUERY PLANS
+# ===========================================
+FULL_SCAN = re.compile(r'\bSCAN (\w+)\b(?! USING)')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+class QueryPlanTests(TestCase):
+    """Every hot query must be answered from an index, never a full table SCAN"""
+
+    def hot_queries(self):
+        today = timezone.now().date()
+        lead = Lead(pk=1)
+        requirement = RequirementYes(pk=1)
+        queries = {
+            'dashboard recent leads': Lead.objects.order_by('-created_at')[:5],
+            'dashboard recent meetings': Meeting.objects.order_by('-meeting_date')[:5],
+            'dashboard recent stage changes': StageHistory.objects.order_by('-changed_at')[:10],
+            'conversions this month': StageHistory.objects.filter(
+                to_stage='requirement_yes', changed_at__gte=today.replace(day=1)
+            ),
+            'future follow-ups due': FutureRequirement.objects.filter(followup_date__lte=today),
+            'regret follow-ups due': RegretOffer.objects.filter(followup_date__lte=today),
+            'call history': CallHistory.objects.filter(lead=lead).order_by('-actual_call_date'),
+            'stage history': StageHistory.objects.filter(lead=lead).order_by('-changed_at'),
+            'meetings': Meeting.objects.filter(requirement=requirement).order_by('-meeting_date'),
+            'lead timeline': timeline_queryset(1)[:21],
+            'lead freshness': freshness_queryset(1),
+            'search API versions': versions_queryset(Lead, CallHistory, AdditionalContact),
+            'lead timeline next page': timeline_queryset(
+                1, [today.isoformat(), timezone.now().isoformat(), 'meeting', 1]
+            )[:21],
+        }
+        for name, stage_list in LISTS.items():
+            rows = stage_list.queryset('marketing').order_by(*stage_list.ordering)
+            queries[f'{name} first page'] = rows[:PAGE_SIZE + 1]
+            after = [timezone.now().isoformat() if 'created_at' in stage_list.ordering[0] else today, 1]
+            queries[f'{name} next page'] = rows.filter(keyset_filter(stage_list.ordering, after))[:PAGE_SIZE + 1]
+            for sort in stage_list.sorts:
+                queries[f'{name} sorted {sort}'] = stage_list.rows('marketing', {'sort': sort})[:PAGE_SIZE + 1]
+            for list_filter in stage_list.filters:
+                for sort in stage_list.sorts:
+                    params = {'sort': sort}
+                    for param in list_filter.params():
+                        params[param] = list_filter.choices[0][0] if getattr(list_filter, 'choices', None) else (
+                            today.isoformat() if isinstance(list_filter, DateRangeFilter) else 'Pune'
+                        )
+                    queries[f'{name} filtered by {list_filter.param}, {sort}'] = (
+                        stage_list.rows('marketing', params)[:PAGE_SIZE + 1]
+                    )
+        return queries
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(FULL_SCAN.search(plan), f'{name} does a full scan:\n{plan}')
+
+
+# ===========================================
+# QUERY BUDGETS AND PROFILING
+# ===========================================
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for n in range(1, 4):
+            make_lead(n)
+
+    def n_plus_one_view(self, request):
+        for lead_id in Lead.objects.values_list('id', flat=True):
+            Lead.objects.get(pk=lead_id)
+        return HttpResponse('ok')
+
+    def test_server_timing_header(self):
+        response = QueryBudgetMiddleware(self.n_plus_one_view)(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="4 queries", app;dur=[\d.]+, total;dur=')
+
+    def test_sql_shape_folds_literals(self):
+        self.assertEqual(
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            sql_shape('SELECT * FROM t WHERE id IN (%s) LIMIT 1'),
+        )
+
+    @override_settings(LEADS_N_PLUS_ONE_THRESHOLD=3, LEADS_QUERY_BUDGET_RAISE=True)
+    def test_n_plus_one_raises_in_strict_mode(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, '3x SELECT'):
+            QueryBudgetMiddleware(self.n_plus_one_view)(RequestFactory().get('/'))
+
+    @override_settings(LEADS_QUERY_BUDGET=2)
+    def test_over_budget_is_logged(self):
+        def run(view):
+            # process_view runs inside the middleware, as in the handler
+            def handler(request):
+                middleware.process_view(request, view, (), {})
+                return view(request)
+            middleware = QueryBudgetMiddleware(handler)
+            return middleware(RequestFactory().get('/'))
+
+        with self.assertLogs('leads.middleware', 'WARNING') as logs:
+            run(self.n_plus_one_view)
+        self.assertIn('4 queries (budget 2)', logs.output[0])
+
+        # A view can raise its own budget
+        with self.assertNoLogs('leads.middleware', 'WARNING'):
+            run(query_budget(10)(lambda request: self.n_plus_one_view(request)))
+
+
+class ProfilerTests(TestCase):
+
+    def slow_view(self, request):
+        time.sleep(0.01)
+        return HttpResponse('ok')
+
+    def test_profiles_are_sampled_rotated_and_summarized(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(LEADS_PROFILE_SAMPLE_RATE=1, LEADS_PROFILE_DIR=directory, LEADS_PROFILE_KEEP=2):
+                middleware = ProfilerMiddleware(self.slow_view)
+                for _ in range(3):
+                    middleware(RequestFactory().get('/'))
+
+            profiles = sorted(os.listdir(directory))
+            self.assertEqual(len(profiles), 2)
+            self.assertRegex(profiles[0], r'^\d{8}T\d{12}-unresolved-\d+ms\.prof$')
+
+            output = io.StringIO()
+            call_command('profile_summary', dir=directory, stdout=output)
+            self.assertIn('2 profiles', output.getvalue())
+            self.assertIn('slow_view', output.getvalue())
+
+    def test_slow_threshold_only_keeps_slow_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(LEADS_PROFILE_SLOW_MS=5000, LEADS_PROFILE_DIR=directory):
+                ProfilerMiddleware(self.slow_view)(RequestFactory().get('/'))
+            self.assertEqual(os.listdir(directory), [])
@@ -0,0 +1,173 @@
+from django.conf import settings
+from django.db.models import CharField, DateField, F, Q, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import CallHistory, StageHistory, Meeting, Quotation
+from .pagination import encode_cursor, decode_cursor
+
+
+# Entries per timeline page on the detail pages and the timeline API
+TIMELINE_PAGE_SIZE = getattr(settings, 'LEADS_TIMELINE_PAGE_SIZE', 20)
+
+# Newest day first, then newest first within the day; kind and id
+# break ties between rows saved together
+TIMELINE_ORDERING = ('-day', '-at', '-kind', '-row_id')
+
+# kind -> (model, lead path, {column: field, expression or None})
+# Every source fills the same columns in the same order, so the
+# branches line up in the UNION ALL. 'day' is the date the entry
+# belongs to: a call's actual_call_date, so a backdated call sorts
+# among that date's entries. 'at' is when the entry was recorded;
+# 'event_date' is the date it happened, where that differs.
+TIMELINE_SOURCES = {
+    'call': (CallHistory, 'lead_id', {
+        'day': 'actual_call_date',
+        'at': 'created_at',
+        'event_date': 'actual_call_date',
+        'expected_on': 'expected_call_date',
+        'title': 'outcome',
+        'body': 'remark',
+        'user': 'created_by__username',
+    }),
+    'stage': (StageHistory, 'lead_id', {
+        'day': TruncDate('changed_at'),
+        'at': 'changed_at',
+        'event_date': None,
+        'expected_on': None,
+        'title': 'to_stage',
+        'body': 'notes',
+        'user': 'changed_by__username',
+    }),
+    'meeting': (Meeting, 'requirement__lead_id', {
+        'day': TruncDate('created_at'),
+        'at': 'created_at',
+        'event_date': 'meeting_date',
+        'expected_on': None,
+        'title': 'meeting_type',
+        'body': 'notes',
+        'user': 'created_by__username',
+    }),
+    'quotation': (Quotation, 'requirement__lead_id', {
+        'day': TruncDate('created_at'),
+        'at': 'created_at',
+        'event_date': Coalesce('actual_date', 'expected_date'),
+        'expected_on': None,
+        'title': 'quotation_number',
+        'body': 'notes',
+        'user': 'created_by__username',
+    }),
+}
+
+CALL_OUTCOMES = dict(CallHistory.OUTCOME_CHOICES)
+MEETING_TYPES = dict(Meeting._meta.get_field('meeting_type').choices)
+
+
+# ===========================================
+# HELPER: UNION ALL branches
+# ===========================================
+def _column(value):
+    if value is None:
+        return Value(None, output_field=DateField())
+    return F(value) if isinstance(value, str) else value
+
+
+def _after(kind, after):
+    """
+    Keyset condition for one branch. kind is constant within a branch,
+    so (day, at, kind, id) < (d, t, k, i) reduces to comparisons on day
+    and at.
+    """
+    day, at, after_kind, after_id = after
+    if kind < after_kind:
+        same_day = Q(at__lte=at)
+    elif kind == after_kind:
+        same_day = Q(at__lt=at) | Q(at=at, row_id__lt=after_id)
+    else:
+        same_day = Q(at__lt=at)
+    return Q(day__lt=day) | (Q(day=day) & same_day)
+
+
+def _branches(lead_id, after):
+    for kind, (model, lead_path, columns) in TIMELINE_SOURCES.items():
+        rows = model.objects.filter(**{lead_path: lead_id}).annotate(
+            kind=Value(kind, output_field=CharField()),
+            row_id=F('id'),
+            **{column: _column(value) for column, value in columns.items()},
+        )
+        if after is not None:
+            rows = rows.filter(_after(kind, after))
+        # Meta.ordering isn't allowed inside a compound statement
+        yield rows.order_by().values('kind', 'row_id', *columns)
+
+
+def _tone(entry):
+    """success / warning / error highlight of the timeline dot"""
+    kind, title = entry['kind'], entry['title'] or ''
+    if kind == 'call':
+        return {'yes': 'success', 'reconnect': 'warning'}.get(title, '')
+    if kind == 'stage':
+        if title in ('order_lost', 'not_converted'):
+            return 'error'
+        return 'success' if 'completed' in title or 'accepted' in title else ''
+    return ''
+
+
+def _label(entry):
+    kind, title = entry['kind'], entry['title']
+    if kind == 'call':
+        return CALL_OUTCOMES.get(title, title)
+    if kind == 'stage':
+        return title.replace('_', ' ').title()
+    if kind == 'meeting':
+        return f'{MEETING_TYPES.get(title, title)} meeting'
+    return f'Quotation {title}' if title else 'Quotation'
+
+
+# ===========================================
+# TIMELINE PAGES
+# ===========================================
+def timeline_queryset(lead_id, after=None):
+    """UNION ALL of every timeline source, newest first, after a decoded cursor"""
+    first, *rest = _branches(lead_id, after)
+    return first.union(*rest, all=True).order_by(*TIMELINE_ORDERING)
+
+
+def timeline_page(lead_id, cursor=None, limit=None):
+    """
+    (entries, next cursor or None): calls, stage changes, meetings and
+    quotations of a lead, newest first, in one UNION ALL query.
+
+    Raises ValueError for a malformed cursor.
+    """
+    limit = limit or TIMELINE_PAGE_SIZE
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and not (
+        len(after) == 4 and isinstance(after[0], str) and parse_date(after[0])
+        and isinstance(after[1], str) and parse_datetime(after[1])
+        and after[2] in TIMELINE_SOURCES and isinstance(after[3], int)
+    ):
+        raise ValueError('Invalid cursor')
+
+    entries = list(timeline_queryset(lead_id, after)[:limit + 1])
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        last = entries[-1]
+        next_cursor = encode_cursor([last['day'].isoformat(), last['at'].isoformat(), last['kind'], last['row_id']])
+
+    for entry in entries:
+        entry['label'] = _label(entry)
+        entry['tone'] = _tone(entry)
+    return entries, next_cursor
+
+
+def serialize_entry(entry):
+    return {
+        **entry,
+        'day': entry['day'].isoformat(),
+        'at': entry['at'].isoformat(),
+        'event_date': entry['event_date'].isoformat() if entry['event_date'] else None,
+        'expected_on': entry['expected_on'].isoformat() if entry['expected_on'] else None,
+    }
@@ -0,0 +1,204 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_generation
+from .counters import bulk_apply_counter_diff, counter_keys
+from .models import Lead, CallHistory, StageHistory, RegretOffer, FutureRequirement
+from .search import bulk_index_search_documents
+
+
+# Lead stage -> the stages a lead in it can be moved to. Moving to the
+# current stage updates the lead and its state row without a history row.
+TRANSITIONS = {
+    'prospect': ('prospect', 'requirement_yes', 'regret', 'future'),
+    'reconnect': ('prospect', 'requirement_yes', 'regret', 'future'),
+    'future': ('prospect', 'requirement_yes', 'regret', 'future'),
+    'regret': ('prospect', 'requirement_yes', 'regret', 'future'),
+    'requirement_yes': ('requirement_yes', 'regret'),
+}
+
+# Stage -> the one-to-one row on Lead holding that stage's details
+STAGE_STATE = {
+    'requirement_yes': 'requirementyes',
+    'regret': 'regret_data',
+    'future': 'future_data',
+}
+
+# Stages whose row only describes an open follow-up and is dropped when
+# the lead leaves. A requirement keeps its row: meetings and quotations
+# hang off it, and the lost order pages read it.
+CLEARED_ON_EXIT = ('regret', 'future')
+
+# Leads moved per bulk chunk. Keeps every bulk insert inside SQLite's
+# 999 bound parameters, so each is a single statement and the query
+# count grows with the number of chunks, not of leads.
+BULK_CHUNK_SIZE = 50
+
+# Stages a lead can be bulk-moved out of (reconnects stay in 'prospect')
+BULK_SOURCES = ('prospect',)
+
+# Target stage -> (state model, call outcome, stage history note)
+BULK_TARGETS = {
+    'regret': (RegretOffer, 'regret', 'Moved to Regret Offer (bulk)'),
+    'future': (FutureRequirement, 'future', 'Moved to Future Requirement (bulk)'),
+}
+
+
+# ===========================================
+# HELPERS
+# ===========================================
+def _state_row(lead, stage):
+    """The lead's state row for a stage, from the select_related cache"""
+    try:
+        return getattr(lead, STAGE_STATE[stage])
+    except ObjectDoesNotExist:
+        return None
+
+
+def _save_changes(instance, values):
+    """Set values on a loaded row and save only the fields that differ"""
+    meta = instance._meta
+    changed = []
+    for name, value in values.items():
+        value = meta.get_field(name).to_python(value)
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+    if changed:
+        # auto_now fields are only written when named
+        changed += [field.name for field in meta.concrete_fields if getattr(field, 'auto_now', False)]
+        instance.save(update_fields=changed)
+    return changed
+
+
+def _replaced_fields(state_model):
+    """Every column a bulk upsert rewrites: all but the row's identity and creation time"""
+    return [
+        field.name for field in state_model._meta.concrete_fields
+        if not field.primary_key and field.name not in ('lead', 'created_at')
+    ]
+
+
+# ===========================================
+# TRANSITIONS
+# ===========================================
+def transition(lead_id, to_stage, user, notes='', lead_fields=None, state=None):
+    """
+    Move a lead to to_stage in one transaction: lock the lead, drop the
+    state row of a CLEARED_ON_EXIT stage it leaves (when it has one),
+    write only the Lead and state row fields that change, and record
+    one StageHistory row.
+
+    lead_fields are other Lead values to set; state the values of
+    to_stage's state row, created if the lead has none. Returns the
+    lead. Raises ValueError for a move TRANSITIONS doesn't allow.
+    """
+    with transaction.atomic():
+        lead = (
+            Lead.objects.select_for_update(of=('self',))
+            .select_related(*STAGE_STATE.values())
+            .get(pk=lead_id)
+        )
+        from_stage = lead.stage
+        if to_stage not in TRANSITIONS.get(from_stage, ()):
+            raise ValueError(
+                f"{lead.company_name} can't move from {lead.get_stage_display()} "
+                f"to {dict(Lead.STAGE_CHOICES).get(to_stage, to_stage)}"
+            )
+
+        if from_stage != to_stage and from_stage in CLEARED_ON_EXIT:
+            stale = _state_row(lead, from_stage)
+            if stale is not None:
+                stale.delete()
+
+        _save_changes(lead, {'stage': to_stage, **(lead_fields or {})})
+
+        if state is not None:
+            row = _state_row(lead, to_stage)
+            if row is None:
+                model = Lead._meta.get_field(STAGE_STATE[to_stage]).related_model
+                setattr(lead, STAGE_STATE[to_stage], model.objects.create(lead=lead, **state))
+            else:
+                _save_changes(row, state)
+
+        if from_stage != to_stage:
+            StageHistory.objects.create(
+                lead=lead, from_stage=from_stage, to_stage=to_stage, changed_by=user, notes=notes,
+            )
+    return lead
+
+
+# ===========================================
+# BULK TRANSITIONS
+# ===========================================
+def _bulk_move_chunk(lead_ids, to_stage, user, call_date, state_fields):
+    """bulk_transition for up to BULK_CHUNK_SIZE leads; returns the ids that moved"""
+    state_model, outcome, notes = BULK_TARGETS[to_stage]
+    leads = list(
+        Lead.objects.select_for_update()
+        .filter(pk__in=lead_ids, stage__in=BULK_SOURCES)
+        .values('id', 'stage', 'created_at')
+    )
+    if not leads:
+        return []
+    moved = [lead['id'] for lead in leads]
+    # A state row left over from an earlier visit to the stage is
+    # replaced: columns missing from state_fields go back to None
+    stale = list(state_model.objects.filter(lead_id__in=moved).values('followup_date'))
+
+    Lead.objects.filter(pk__in=moved).update(
+        stage=to_stage, updated_at=timezone.now(),
+        # What update_reconnect_cycle does for a non-reconnect call
+        reconnect_cycle_start=None, reconnect_followups=0,
+    )
+    calls = CallHistory.objects.bulk_create([
+        CallHistory(lead_id=lead_id, actual_call_date=call_date, outcome=outcome,
+                    remark=state_fields['remark'], created_by=user)
+        for lead_id in moved
+    ])
+    history = StageHistory.objects.bulk_create([
+        StageHistory(lead_id=lead['id'], from_stage=lead['stage'], to_stage=to_stage,
+                     changed_by=user, notes=notes)
+        for lead in leads
+    ])
+    states = state_model.objects.bulk_create(
+        [state_model(lead_id=lead_id, **state_fields) for lead_id in moved],
+        update_conflicts=True, unique_fields=['lead'], update_fields=_replaced_fields(state_model),
+    )
+
+    bulk_index_search_documents([*calls, *history, *states])
+    model_name = state_model.__name__
+    bulk_apply_counter_diff(
+        [key for lead in leads for key in counter_keys('Lead', lead)]
+        + [key for row in stale for key in counter_keys(model_name, row)],
+        [key for lead in leads for key in counter_keys('Lead', {**lead, 'stage': to_stage})]
+        + [key for row in history for key in counter_keys('StageHistory', row.__dict__)]
+        + [key for row in states for key in counter_keys(model_name, row.__dict__)],
+    )
+    return moved
+
+
+def bulk_transition(lead_ids, to_stage, user, call_date, state_fields):
+    """
+    Move leads to 'regret' or 'future' in one transaction, writing the
+    call, stage change and state row each would get from its detail
+    page. state_fields are the RegretOffer / FutureRequirement values.
+
+    Leads no longer in a BULK_SOURCES stage are skipped; returns the
+    ids that moved. Works through the selection BULK_CHUNK_SIZE leads
+    at a time, a fixed number of queries per chunk, keeping counters,
+    search text and cache generations in step by hand since bulk
+    writes send no signals.
+    """
+    state_model, _, _ = BULK_TARGETS[to_stage]
+    lead_ids = list(dict.fromkeys(lead_ids))
+    moved = []
+    with transaction.atomic():
+        for start in range(0, len(lead_ids), BULK_CHUNK_SIZE):
+            moved += _bulk_move_chunk(
+                lead_ids[start:start + BULK_CHUNK_SIZE], to_stage, user, call_date, state_fields,
+            )
+        if moved:
+            bump_generation(Lead, CallHistory, StageHistory, state_model)
+    return moved
@@ -7,13 +7,32 @@ urlpatterns = [
     
     # Duplicate detection API
     path('api/check-duplicates/', views.check_duplicates, name='check_duplicates'),
+    path('api/check-duplicates/batch/', views.check_duplicates_batch, name='check_duplicates_batch'),
 
     # Universal search API
     path('api/universal-search/', views.universal_search, name='universal_search'),
+    path('api/autocomplete/', views.autocomplete, name='autocomplete'),
+
+    # Page cache hit/miss counters
+    path('api/cache-stats/', views.cache_stats_api, name='cache_stats'),
+
+    # A lead's calls, stage changes, meetings and quotations, keyset-paged
+    path('api/leads/<int:lead_id>/timeline/', views.lead_timeline, name='lead_timeline'),
+
+    # Progress of a lead sheet import
+    path('api/imports/<int:job_id>/', views.import_job_status, name='import_job_status'),
+
+    # Keyset-paged stage lists (infinite scroll), after the fixed api/ routes
+    path('api/<slug:list_name>/', views.list_api, name='list_api'),
+
+    # Streamed CSV / JSON lines export of a stage list
+    path('export/<slug:list_name>/', views.export_list, name='export_list'),
 
     # Prospect Stage
     path('prospects/', views.lead_list, name='lead_list'),
     path('prospects/add/', views.add_lead, name='add_lead'),
+    path('prospects/import/', views.import_leads, name='import_leads'),
+    path('prospects/bulk-transition/', views.bulk_transition_leads, name='bulk_transition_leads'),
     
     # Requirement Yes Stage
     path('requirement-yes/', views.requirement_yes_list, name='requirement_yes_list'),
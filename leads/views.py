@@ -1,239 +1,104 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, JsonResponse
+from django.http import Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.db import transaction
 import json
 from datetime import datetime, timedelta
 from django.urls import reverse
+from urllib.parse import urlencode
 from django.utils import timezone
-from django.db.models import Q,Count
-from difflib import SequenceMatcher 
 
 from .models import (
     Lead, Profile, CallHistory, RequirementYes, 
     StageHistory, Quotation, Meeting, RegretOffer, 
-    FutureRequirement, AdditionalContact
+    FutureRequirement, AdditionalContact, ImportJob, FOLLOWUP_REMARK_PREFIX, MAX_RECONNECT_FOLLOWUPS
+)
+from .forms import LeadCreateForm, BulkTransitionForm
+from .dashboard import get_dashboard_metrics, get_dashboard_activity, counter_total, LOST_SALES_STAGES
+from .cache import cached_context, cache_stats
+from .search import search_leads
+from .autocomplete import autocomplete_leads
+from .pagination import encode_cursor, decode_cursor
+from .lists import LISTS
+from .timeline import timeline_page, serialize_entry
+from .dossier import LeadDossier
+from .conditional import conditional_lead_page, conditional_on
+from .codes import next_lead_code
+from .imports import IMPORT_FORMATS, save_upload, start_import
+from .transitions import transition, bulk_transition, TRANSITIONS
+from .export import export_chunks, EXPORT_COLUMNS, EXPORT_FORMATS
+from .duplicates import (
+    find_name_candidates, leads_by_email, leads_by_phone,
+    lead_match, TopMatches, NameMatcher, find_duplicates_batch, MAX_BATCH_RECORDS
 )
-from .forms import LeadCreateForm
 
 @login_required
 def dashboard(request):
     """
     Comprehensive dashboard with all key metrics and insights
     """
-    today = timezone.now().date()
-    week_start = today - timedelta(days=7)
-    month_start = today.replace(day=1)
-    
-    # ============================================
-    # 1️⃣ LEAD OVERVIEW
-    # ============================================
-    total_leads = Lead.objects.count()
-    prospect_leads = Lead.objects.filter(stage='prospect').count()
-    requirement_yes_leads = Lead.objects.filter(stage='requirement_yes').count()
-    future_leads = Lead.objects.filter(stage='future').count()
-    regret_leads = Lead.objects.filter(stage='regret').count()
-    
-    # Converted Customers (Order Completed)
-    converted_customers = RequirementYes.objects.filter(
-        sales_stage='order_completed'
-    ).count()
-    
-    # Lost Orders
-    lost_orders = RequirementYes.objects.filter(
-        sales_stage__in=['not_converted', 'order_lost']
-    ).count()
-    
-    # ============================================
-    # 2️⃣ FOLLOW-UP INSIGHTS
-    # ============================================
-    
-    # Overdue followups (Future Requirements)
-    overdue_future_followups = FutureRequirement.objects.filter(
-        followup_date__lt=today
-    ).select_related('lead').count()
-    
-    # Today's followups
-    today_future_followups = FutureRequirement.objects.filter(
-        followup_date=today
-    ).select_related('lead').count()
-    
-    # Upcoming followups (next 7 days)
-    upcoming_future_followups = FutureRequirement.objects.filter(
-        followup_date__gt=today,
-        followup_date__lte=today + timedelta(days=7)
-    ).select_related('lead').count()
-    
-    # Regret followups
-    overdue_regret_followups = RegretOffer.objects.filter(
-        followup_date__lt=today
-    ).select_related('lead').count()
-    
-    today_regret_followups = RegretOffer.objects.filter(
-        followup_date=today
-    ).select_related('lead').count()
-    
-    upcoming_regret_followups = RegretOffer.objects.filter(
-        followup_date__gt=today,
-        followup_date__lte=today + timedelta(days=7)
-    ).select_related('lead').count()
-    
-    # Total followups
-    total_overdue = overdue_future_followups + overdue_regret_followups
-    total_today = today_future_followups + today_regret_followups
-    total_upcoming = upcoming_future_followups + upcoming_regret_followups
-    
-    # ============================================
-    # 3️⃣ MEETING INSIGHTS
-    # ============================================
-    
-    # Meetings today
-    meetings_today = Meeting.objects.filter(
-        meeting_date=today
-    ).select_related('requirement__lead').count()
-    
-    # Upcoming meetings (next 7 days)
-    upcoming_meetings = Meeting.objects.filter(
-        meeting_date__gt=today,
-        meeting_date__lte=today + timedelta(days=7)
-    ).select_related('requirement__lead').count()
-    
-    # Past meetings without outcome
-    past_meetings_no_outcome = Meeting.objects.filter(
-        meeting_date__lt=today,
-        outcome__isnull=True
-    ).select_related('requirement__lead').count()
-    
-    # ============================================
-    # 4️⃣ SALES PIPELINE
-    # ============================================
-    
-    pipeline_stages = {
-        'costing_created': RequirementYes.objects.filter(sales_stage='costing_created').count(),
-        'quotation_created': RequirementYes.objects.filter(sales_stage='quotation_created').count(),
-        'quotation_sent': RequirementYes.objects.filter(sales_stage='quotation_sent').count(),
-        'quotation_revision': RequirementYes.objects.filter(sales_stage='quotation_revision').count(),
-        'quotation_accepted': RequirementYes.objects.filter(sales_stage='quotation_accepted').count(),
-        'po_received': RequirementYes.objects.filter(sales_stage='po_received').count(),
-        'oa_created': RequirementYes.objects.filter(sales_stage='oa_created').count(),
-        'oa_sent': RequirementYes.objects.filter(sales_stage='oa_sent').count(),
-        'oa_revision': RequirementYes.objects.filter(sales_stage='oa_revision').count(),
-        'oa_accepted': RequirementYes.objects.filter(sales_stage='oa_accepted').count(),
-        'order_completed': RequirementYes.objects.filter(sales_stage='order_completed').count(),
-        'order_lost': RequirementYes.objects.filter(sales_stage='order_lost').count(),
-    }
-    
-    # ============================================
-    # 5️⃣ PERFORMANCE INSIGHTS
-    # ============================================
-    
-    # Leads added this month
-    leads_added_this_month = Lead.objects.filter(
-        created_at__gte=month_start
-    ).count()
-    
-    # Conversions this month (moved to requirement_yes)
-    conversions_this_month = StageHistory.objects.filter(
-        to_stage='requirement_yes',
-        changed_at__gte=month_start
-    ).count()
-    
-    # Conversion rate
-    if prospect_leads > 0:
-        conversion_rate = round((requirement_yes_leads / (prospect_leads + requirement_yes_leads)) * 100, 1)
-    else:
-        conversion_rate = 0
-    
-    # Meetings scheduled this month
-    meetings_this_month = Meeting.objects.filter(
-        created_at__gte=month_start
-    ).count()
-    
-    # Orders closed this month
-    orders_this_month = RequirementYes.objects.filter(
-        sales_stage='order_completed',
-        updated_at__gte=month_start
-    ).count()
-    
-    # ============================================
-    # 📊 RECENT ACTIVITIES (Latest 10)
-    # ============================================
-    
-    recent_leads = Lead.objects.order_by('-created_at')[:5]
-    recent_meetings = Meeting.objects.select_related('requirement__lead').order_by('-meeting_date')[:5]
-    recent_stage_changes = StageHistory.objects.select_related('lead', 'changed_by').order_by('-changed_at')[:10]
-    
-    # ============================================
-    # 🎯 TOP PERFORMERS (if multiple users)
-    # ============================================
-    
-    top_converters = (
-        Lead.objects
-        .filter(created_by__isnull=False)
-        .values('created_by__username')
-        .annotate(
-            total_leads=Count('id'),
-            converted=Count('id', filter=Q(stage='requirement_yes'))
-        )
-        .order_by('-converted')[:5]
+    def build():
+        context = get_dashboard_metrics()
+        context.update({
+            name: list(queryset)
+            for name, queryset in get_dashboard_activity().items()
+        })
+        return context
+
+    context = cached_context(
+        'dashboard',
+        (Lead, RequirementYes, FutureRequirement, RegretOffer, Meeting, StageHistory),
+        build,
+        timezone.now().date(),
     )
-    
-    # ============================================
-    # CONTEXT
-    # ============================================
-    
-    context = {
-        # Lead Overview
-        'total_leads': total_leads,
-        'prospect_leads': prospect_leads,
-        'requirement_yes_leads': requirement_yes_leads,
-        'future_leads': future_leads,
-        'regret_leads': regret_leads,
-        'converted_customers': converted_customers,
-        'lost_orders': lost_orders,
-        
-        # Follow-up Insights
-        'overdue_followups': total_overdue,
-        'today_followups': total_today,
-        'upcoming_followups': total_upcoming,
-        'overdue_future': overdue_future_followups,
-        'overdue_regret': overdue_regret_followups,
-        
-        # Meeting Insights
-        'meetings_today': meetings_today,
-        'upcoming_meetings': upcoming_meetings,
-        'past_meetings_no_outcome': past_meetings_no_outcome,
-        
-        # Sales Pipeline
-        'pipeline_stages': pipeline_stages,
-        
-        # Performance
-        'leads_added_this_month': leads_added_this_month,
-        'conversions_this_month': conversions_this_month,
-        'conversion_rate': conversion_rate,
-        'meetings_this_month': meetings_this_month,
-        'orders_this_month': orders_this_month,
-        
-        # Recent Activity
-        'recent_leads': recent_leads,
-        'recent_meetings': recent_meetings,
-        'recent_stage_changes': recent_stage_changes,
-        
-        # Top Performers
-        'top_converters': top_converters,
-    }
-    
+
     return render(request, 'leads/dashboard.html', context)
 
 # ===========================================
-# HELPER FUNCTION: Clear Lead States
+# HELPER FUNCTION: Stage list page context
 # ===========================================
-def clear_lead_states(lead):
-    """Clear all state-specific objects when moving between major stages"""
-    RegretOffer.objects.filter(lead=lead).delete()
-    FutureRequirement.objects.filter(lead=lead).delete()
-    RequirementYes.objects.filter(lead=lead).delete()
+def stage_list_context(request, list_name, role=None, total=None):
+    """
+    First page of a stage list with the request's filters and sort,
+    plus what the template needs for the filter bar, export links and
+    infinite scroll. total() gives the unfiltered row count.
+    """
+    stage_list = LISTS[list_name]
+    params = request.GET
+    filter_error = None
+    try:
+        _, sort, used = stage_list.query(params)
+    except ValueError as e:
+        # Bad filter in the URL: show the full list and say why
+        filter_error = str(e)
+        params = {}
+        _, sort, used = stage_list.query(params)
+
+    rows, next_cursor = stage_list.page(role, params=params)
+    query_string = urlencode(used)
+
+    if total is None:
+        total_count = None
+    elif used:
+        # Filtered: count the matching rows (an indexed count)
+        total_count = stage_list.rows(role, params).count()
+    else:
+        total_count = total()
+
+    return {
+        stage_list.context_name: rows,
+        'total_count': total_count,
+        'next_cursor': next_cursor,
+        'list_api_url': reverse('list_api', args=[list_name]) + (f'?{query_string}' if query_string else ''),
+        'export_query': query_string,
+        'filter_fields': stage_list.filter_form(params),
+        'sort_options': stage_list.sort_choices(),
+        'current_sort': sort,
+        'filters_active': bool(used),
+        'filter_error': filter_error,
+    }
 
 
 # ===========================================
@@ -247,36 +112,74 @@ def lead_list(request):
         defaults={'role': 'marketing'}
     )
     
-    # Marketing sees all prospects
+    # Marketing sees all prospects, sales sees requirement_yes leads
+    context = stage_list_context(request, 'prospects', profile.role)
+    context['role'] = profile.role
     if profile.role == 'marketing':
-        leads = Lead.objects.filter(stage='prospect')
-    else:
-        # Sales sees requirement_yes leads
-        leads = Lead.objects.filter(stage='requirement_yes')
+        context['bulk_form'] = BulkTransitionForm(initial={'actual_call_date': timezone.localdate()})
     
-    return render(request, 'leads/lead_list.html', {
-        'leads': leads,
-        'role': profile.role
-    })
+    return render(request, 'leads/lead_list.html', context)
+
+
+# ===========================================
+# BULK STAGE TRANSITION (PROSPECT LIST)
+# ===========================================
+@login_required
+def bulk_transition_leads(request):
+    """Record one call outcome for every lead ticked on the prospect list"""
+    if request.user.profile.role != 'marketing':
+        return HttpResponseForbidden("Only marketing can update prospect leads.")
+    if request.method != 'POST':
+        return redirect('lead_list')
+
+    lead_ids = list(dict.fromkeys(int(value) for value in request.POST.getlist('lead_ids') if value.isdigit()))
+    form = BulkTransitionForm(request.POST)
+    if not lead_ids:
+        messages.error(request, 'Select at least one lead')
+    elif not form.is_valid():
+        messages.error(request, '; '.join(errors[0] for errors in form.errors.values()))
+    else:
+        to_stage = form.cleaned_data['to_stage']
+        moved = bulk_transition(
+            lead_ids, to_stage, request.user,
+            form.cleaned_data['actual_call_date'], form.state_fields(),
+        )
+        label = dict(Lead.STAGE_CHOICES)[to_stage]
+        messages.success(request, f'{len(moved)} leads moved to {label}')
+        if len(moved) < len(lead_ids):
+            messages.warning(request, f'{len(lead_ids) - len(moved)} leads had already left Prospect')
+
+    return redirect('lead_list')
 
 
 # ===========================================
 # LEAD DETAIL (PROSPECT STAGE)
 # ===========================================
+# Call outcome -> the stage it moves the lead to
+OUTCOME_STAGES = {
+    'yes': 'requirement_yes',
+    'regret': 'regret',
+    'future': 'future',
+    'reconnect': 'prospect',
+}
+
+
 @login_required
+@conditional_lead_page
 def lead_detail(request, lead_id):
-    lead = get_object_or_404(Lead, id=lead_id)
-
     if request.user.profile.role != 'marketing':
         return HttpResponseForbidden("Only marketing can update prospect leads.")
 
     if request.method == 'POST':
+        # The dossier's timeline and state rows are only needed to render the page
+        lead = get_object_or_404(Lead, id=lead_id)
         action = request.POST.get('action')
         
         # ✅ NEW: Handle Follow-up Sending
         if action == 'send_followup':
             with transaction.atomic():
-                # Get current followup status
+                # Lock the lead so two clicks can't both send follow-up N
+                lead = Lead.objects.select_for_update().get(pk=lead.pk)
                 followup_status = get_current_reconnect_followup_count(lead)
                 
                 if not followup_status['can_send_followup']:
@@ -285,7 +188,7 @@ def lead_detail(request, lead_id):
                 
                 next_followup_num = followup_status['followup_count'] + 1
                 today = timezone.now().date()
-                remark = f"Followup Sent {next_followup_num}"
+                remark = f"{FOLLOWUP_REMARK_PREFIX} {next_followup_num}"
                 
                 # Create call history entry
                 CallHistory.objects.create(
@@ -320,11 +223,21 @@ def lead_detail(request, lead_id):
                 outcome_remark = request.POST.get('remark', '')
             elif outcome == 'reconnect':
                 outcome_remark = request.POST.get('remark_reconnect', '')
+                # A reconnect call is expected again on its follow-up date
+                expected_call_date = request.POST.get('followup_date_reconnect') or expected_call_date
             elif outcome == 'future':
                 outcome_remark = request.POST.get('remark_future', '')
             elif outcome == 'regret':
                 outcome_remark = request.POST.get('remark_regret', '')
 
+            # Refuse a move the lead can't make (e.g. a stale tab) before
+            # recording the call; handlers roll the call back on any other error
+            to_stage = OUTCOME_STAGES.get(outcome)
+            if to_stage not in TRANSITIONS.get(lead.stage, ()):
+                messages.error(request, f"{lead.company_name} can't take a '{outcome}' outcome "
+                                        f"while in {lead.get_stage_display()}")
+                return redirect(get_lead_detail_url(lead))
+
             # Always save call history FIRST
             CallHistory.objects.create(
                 lead=lead,
@@ -338,25 +251,17 @@ def lead_detail(request, lead_id):
             if outcome == 'yes':
                 return handle_requirement_yes(request, lead)
             elif outcome == 'regret':
-                return handle_regret_offer(request, lead, actual_call_date, expected_call_date)
+                return handle_regret_offer(request, lead)
             elif outcome == 'future':
-                return handle_future_requirement(request, lead, actual_call_date, expected_call_date)
+                return handle_future_requirement(request, lead)
             elif outcome == 'reconnect':
-                return handle_reconnect(request, lead, actual_call_date, expected_call_date)
+                return handle_reconnect(request, lead, actual_call_date)
 
-    # ✅ GET: Calculate followup status for display
-    followup_status = get_current_reconnect_followup_count(lead)
-    
-    # Get call history
-    call_history = CallHistory.objects.filter(
-        lead=lead
-    ).select_related('created_by').order_by('-actual_call_date')
-    
-    return render(request, 'leads/lead_detail.html', {
-        'lead': lead,
-        'call_history': call_history,
-        'followup_status': followup_status,  # ✅ NEW
-    })
+    # ✅ GET: Followup status comes from the counters on the lead
+    dossier = LeadDossier.load(lead_id)
+    return render(request, 'leads/lead_detail.html', dossier.context(
+        followup_status=get_current_reconnect_followup_count(dossier.lead),
+    ))
 
 
 # ===========================================
@@ -371,7 +276,8 @@ def send_followup(request, lead_id):
         return HttpResponseForbidden("Only marketing can update prospect leads.")
 
     with transaction.atomic():
-        # Get current followup status
+        # Lock the lead so two clicks can't both send follow-up N
+        lead = Lead.objects.select_for_update().get(pk=lead.pk)
         followup_status = get_current_reconnect_followup_count(lead)
         
         if not followup_status['can_send_followup']:
@@ -380,7 +286,7 @@ def send_followup(request, lead_id):
         
         next_followup_num = followup_status['followup_count'] + 1
         today = timezone.now().date()
-        remark = f"Followup Sent {next_followup_num}"
+        remark = f"{FOLLOWUP_REMARK_PREFIX} {next_followup_num}"
         
         # Create call history entry
         CallHistory.objects.create(
@@ -458,57 +364,19 @@ def send_followup_email(lead, followup_number, user):
 # HELPER: Calculate Followup Count for Current Reconnect Cycle
 # ===========================================
 def get_current_reconnect_followup_count(lead):
-    
-    
-    # Get all call history ordered by date (newest first)
-    all_history = CallHistory.objects.filter(lead=lead).order_by('-actual_call_date')
-    
-    if not all_history.exists():
-        return {
-            'followup_count': 0,
-            'can_send_followup': False,
-            'last_main_outcome_date': None,
-            'is_in_reconnect_cycle': False
-        }
-    
-    # Find the most recent MAIN outcome (non-followup reconnect)
-    # This marks the start of the current cycle
-    last_main_outcome = None
-    for history in all_history:
-        # Check if this is a real reconnect (not a followup)
-        if history.outcome == 'reconnect' and not history.remark.startswith('Followup Sent'):
-            last_main_outcome = history
-            break
-        # If we hit a different outcome, the reconnect cycle hasn't started
-        elif history.outcome != 'reconnect':
-            break
-    
-    # If no reconnect found, lead is not in a reconnect cycle
-    if not last_main_outcome:
-        return {
-            'followup_count': 0,
-            'can_send_followup': False,
-            'last_main_outcome_date': None,
-            'is_in_reconnect_cycle': False
-        }
-    
-    # Count followups AFTER the last main reconnect
-    followup_count = CallHistory.objects.filter(
-        lead=lead,
-        outcome='reconnect',
-        actual_call_date__gte=last_main_outcome.actual_call_date,
-        remark__startswith='Followup Sent'
-    ).count()
-    
+    """
+    Follow-up status of the lead's current reconnect cycle, read from
+    the counters kept on Lead (no CallHistory queries)
+    """
+    in_cycle = lead.reconnect_cycle_start is not None
     return {
-        'followup_count': followup_count,
-        'can_send_followup': followup_count < 3,
-        'last_main_outcome_date': last_main_outcome.actual_call_date,
-        'is_in_reconnect_cycle': True
+        'followup_count': lead.reconnect_followups if in_cycle else 0,
+        'can_send_followup': in_cycle and lead.reconnect_followups < MAX_RECONNECT_FOLLOWUPS,
+        'last_main_outcome_date': lead.reconnect_cycle_start,
+        'is_in_reconnect_cycle': in_cycle,
     }
 
 
-
 # ===========================================
 # HANDLE REQUIREMENT YES
 # ===========================================
@@ -519,6 +387,7 @@ def handle_requirement_yes(request, lead):
     remark = request.POST.get('remark', '')
 
     if not client_type_main or not tank_application or not assigned_sales:
+        transaction.set_rollback(True)
         messages.error(request, "Missing required Requirement details")
         return redirect('lead_detail', lead_id=lead.id)
 
@@ -546,66 +415,40 @@ def handle_requirement_yes(request, lead):
     print(f"DEBUG - Final tanks array: {tanks}")  # 🔍 DEBUG
 
     if not tanks:
+        transaction.set_rollback(True)
         messages.error(request, "Please add at least one tank detail")
         return redirect('lead_detail', lead_id=lead.id)
 
-    old_stage = lead.stage
-
-    # ----------------------------------
-    # ✅ UPDATE LEAD
-    # ----------------------------------
-    lead.stage = 'requirement_yes'
-    lead.client_type_main = client_type_main
-    lead.client_type_detail = (
+    client_type_detail = (
         request.POST.get('consultant_type')
         or request.POST.get('contractor_type')
         or request.POST.get('endclient_category')
         or ''
     )
-    lead.save()
 
     # ----------------------------------
-    # ✅ CREATE OR UPDATE REQUIREMENT YES
+    # ✅ MOVE LEAD, CREATE OR UPDATE REQUIREMENT YES
     # ----------------------------------
-    requirement, created = RequirementYes.objects.get_or_create(
-        lead=lead,
-        defaults={
-            'client_type_main': client_type_main,
-            'client_type_detail': lead.client_type_detail,
-            'tank_application': tank_application,
-            'tank_location': request.POST.get('tank_location', ''),
-            'assigned_sales_person': assigned_sales,
-            'expected_delivery_date': request.POST.get('expected_delivery_date') or None,
-            'tanks_json': tanks,
-            'current_remark': remark,
-            'sales_stage': 'costing_created'  # ✅ Changed from 'quotation_sent'
-        }
-    )
-
-    if not created:
-        requirement.client_type_main = client_type_main
-        requirement.client_type_detail = lead.client_type_detail
-        requirement.tank_application = tank_application
-        requirement.tank_location = request.POST.get('tank_location', '')
-        requirement.assigned_sales_person = assigned_sales
-        requirement.expected_delivery_date = request.POST.get('expected_delivery_date') or None
-        requirement.tanks_json = tanks
-        requirement.current_remark = remark
-        requirement.save()
-
-    print(f"DEBUG - Saved requirement tanks_json: {requirement.tanks_json}")  # 🔍 DEBUG
-
-    # ----------------------------------
-    # ✅ STAGE HISTORY
-    # ----------------------------------
-    if old_stage != 'requirement_yes':
-        StageHistory.objects.create(
-            lead=lead,
-            from_stage=old_stage,
-            to_stage='requirement_yes',
-            changed_by=request.user,
-            notes='Converted to Requirement Yes'
+    try:
+        transition(
+            lead.id, 'requirement_yes', request.user,
+            notes='Converted to Requirement Yes',
+            lead_fields={'client_type_main': client_type_main, 'client_type_detail': client_type_detail},
+            state={
+                'client_type_main': client_type_main,
+                'client_type_detail': client_type_detail,
+                'tank_application': tank_application,
+                'tank_location': request.POST.get('tank_location', ''),
+                'assigned_sales_person': assigned_sales,
+                'expected_delivery_date': request.POST.get('expected_delivery_date') or None,
+                'tanks_json': tanks,
+                'current_remark': remark,
+            },
         )
+    except ValueError as e:
+        transaction.set_rollback(True)
+        messages.error(request, str(e))
+        return redirect('lead_detail', lead_id=lead.id)
 
     messages.success(request, 'Lead moved to Requirement Yes')
     return redirect('requirement_yes_detail', lead_id=lead.id)
@@ -614,7 +457,7 @@ def handle_requirement_yes(request, lead):
 # ===========================================
 # HANDLE REGRET OFFER
 # ===========================================
-def handle_regret_offer(request, lead, actual_call_date, expected_call_date):
+def handle_regret_offer(request, lead):
     """Process Regret Offer outcome"""
     
     client_type_main = request.POST.get('client_type_regret')
@@ -623,6 +466,7 @@ def handle_regret_offer(request, lead, actual_call_date, expected_call_date):
     remark = request.POST.get('remark_regret')
     
     if not all([client_type_main, followup_date, tank_type, remark]):
+        transaction.set_rollback(True)
         messages.error(request, 'Please fill all required fields')
         return render(request, 'leads/lead_detail.html', {'lead': lead})
     
@@ -640,53 +484,25 @@ def handle_regret_offer(request, lead, actual_call_date, expected_call_date):
     
     tank_type_other = request.POST.get('tank_type_other_text_regret') if tank_type == 'Other' else None
     
-    # Update lead
-    old_stage = lead.stage
-    lead.stage = 'regret'
-    lead.save()
-    
-    # Create call history
-    CallHistory.objects.create(
-        lead=lead,
-        expected_call_date=expected_call_date or None,
-        actual_call_date=actual_call_date,
-        outcome='regret',
-        remark=remark,
-        created_by=request.user
-    )
-    
-    # ✅ FIX 1: Use get_or_create for RegretOffer (idempotent)
-    regret_offer, created = RegretOffer.objects.get_or_create(
-        lead=lead,
-        defaults={
-            'client_type_main': client_type_main,
-            'client_type_detail': client_type_detail,
-            'tank_type': tank_type,
-            'tank_type_other': tank_type_other,
-            'followup_date': followup_date,
-            'remark': remark,
-        }
-    )
-    
-    if not created:
-        # Update existing regret offer
-        regret_offer.client_type_main = client_type_main
-        regret_offer.client_type_detail = client_type_detail
-        regret_offer.tank_type = tank_type
-        regret_offer.tank_type_other = tank_type_other
-        regret_offer.followup_date = followup_date
-        regret_offer.remark = remark
-        regret_offer.save()
-    
-    # Create stage history
-    StageHistory.objects.create(
-        lead=lead,
-        from_stage=old_stage,
-        to_stage='regret',
-        changed_by=request.user,
-        notes=f"Moved to Regret Offer. Competitor: {tank_type}"
-    )
-    
+    # The call itself was recorded by lead_detail
+    try:
+        transition(
+            lead.id, 'regret', request.user,
+            notes=f"Moved to Regret Offer. Competitor: {tank_type}",
+            state={
+                'client_type_main': client_type_main,
+                'client_type_detail': client_type_detail,
+                'tank_type': tank_type,
+                'tank_type_other': tank_type_other,
+                'followup_date': followup_date,
+                'remark': remark,
+            },
+        )
+    except ValueError as e:
+        transaction.set_rollback(True)
+        messages.error(request, str(e))
+        return redirect('lead_detail', lead_id=lead.id)
+
     messages.success(request, f'{lead.company_name} moved to Regret Offer')
     return redirect('regret_offers_list')
 
@@ -694,7 +510,7 @@ def handle_regret_offer(request, lead, actual_call_date, expected_call_date):
 # ===========================================
 # HANDLE FUTURE REQUIREMENT
 # ===========================================
-def handle_future_requirement(request, lead, actual_call_date, expected_call_date):
+def handle_future_requirement(request, lead):
     """Process Future Requirement outcome"""
     
     client_type_main = request.POST.get('client_type_future')
@@ -702,6 +518,7 @@ def handle_future_requirement(request, lead, actual_call_date, expected_call_dat
     remark = request.POST.get('remark_future')
     
     if not all([client_type_main, followup_date, remark]):
+        transaction.set_rollback(True)
         messages.error(request, 'Please fill all required fields')
         return render(request, 'leads/lead_detail.html', {'lead': lead})
     
@@ -717,48 +534,23 @@ def handle_future_requirement(request, lead, actual_call_date, expected_call_dat
         endclient_category = request.POST.get('endclient_category_future')
         client_type_detail = request.POST.get('endclient_other_text_future') if endclient_category == 'Other' else endclient_category
     
-    # Update lead
-    old_stage = lead.stage
-    lead.stage = 'future'
-    lead.save()
-    
-    # Create call history
-    CallHistory.objects.create(
-        lead=lead,
-        expected_call_date=expected_call_date or None,
-        actual_call_date=actual_call_date,
-        outcome='future',
-        remark=remark,
-        created_by=request.user
-    )
-    
-    # ✅ Apply same pattern for FutureRequirement
-    future_req, created = FutureRequirement.objects.get_or_create(
-        lead=lead,
-        defaults={
-            'client_type_main': client_type_main,
-            'client_type_detail': client_type_detail,
-            'followup_date': followup_date,
-            'remark': remark
-        }
-    )
-    
-    if not created:
-        future_req.client_type_main = client_type_main
-        future_req.client_type_detail = client_type_detail
-        future_req.followup_date = followup_date
-        future_req.remark = remark
-        future_req.save()
-    
-    # Create stage history
-    StageHistory.objects.create(
-        lead=lead,
-        from_stage=old_stage,
-        to_stage='future',
-        changed_by=request.user,
-        notes="Moved to Future Requirement"
-    )
-    
+    # The call itself was recorded by lead_detail
+    try:
+        transition(
+            lead.id, 'future', request.user,
+            notes="Moved to Future Requirement",
+            state={
+                'client_type_main': client_type_main,
+                'client_type_detail': client_type_detail,
+                'followup_date': followup_date,
+                'remark': remark,
+            },
+        )
+    except ValueError as e:
+        transaction.set_rollback(True)
+        messages.error(request, str(e))
+        return redirect('lead_detail', lead_id=lead.id)
+
     messages.success(request, f'{lead.company_name} moved to Future Requirement')
     return redirect('future_requirements_list')
 
@@ -766,32 +558,29 @@ def handle_future_requirement(request, lead, actual_call_date, expected_call_dat
 # ===========================================
 # HANDLE RECONNECT
 # ===========================================
-def handle_reconnect(request, lead, actual_call_date, expected_call_date):
+def handle_reconnect(request, lead, actual_call_date):
     """Process Reconnect outcome - stays in prospect"""
     
     followup_date = request.POST.get('followup_date_reconnect')
     remark = request.POST.get('remark_reconnect')
     
     if not all([followup_date, remark]):
+        transaction.set_rollback(True)
         messages.error(request, 'Please fill all required fields')
         return render(request, 'leads/lead_detail.html', {'lead': lead})
     
-    # ✅ Lead STAYS in prospect stage (not a separate stage)
-    lead.stage = 'prospect'  # Keep in prospect
-    lead.last_call_date = actual_call_date  # Store last call
-    lead.last_remark = remark  # Store last remark
-    lead.save()
-    
-    # Create call history
-    CallHistory.objects.create(
-        lead=lead,
-        expected_call_date=followup_date or None,  # ✅ Use followup_date
-        actual_call_date=actual_call_date,
-        outcome='reconnect',
-        remark=remark,
-        created_by=request.user
-    )
-    
+    # ✅ Lead STAYS in (or returns to) prospect stage; lead_detail recorded the call
+    try:
+        transition(
+            lead.id, 'prospect', request.user,
+            notes='Reconnect',
+            lead_fields={'last_call_date': actual_call_date, 'last_remark': remark},
+        )
+    except ValueError as e:
+        transaction.set_rollback(True)
+        messages.error(request, str(e))
+        return redirect('lead_detail', lead_id=lead.id)
+
     messages.success(request, f'{lead.company_name} marked for reconnect')
     return redirect('lead_list')
 
@@ -801,16 +590,14 @@ def handle_reconnect(request, lead, actual_call_date, expected_call_date):
 # ===========================================
 @login_required
 def requirement_yes_list(request):
-    requirements = (
-        RequirementYes.objects
-        .select_related('lead')
-        .filter(lead__stage='requirement_yes')  
-        .exclude(sales_stage__in=['not_converted', 'order_lost', 'order_completed'])
+    context = stage_list_context(
+        request, 'requirement-yes',
+        total=lambda: counter_total(
+            'sales_stage', exclude=['not_converted', 'order_lost', 'order_completed']
+        ),
     )
 
-    return render(request, 'leads/requirement_yes_list.html', {
-        'requirements': requirements
-    })
+    return render(request, 'leads/requirement_yes_list.html', context)
 
 
 
@@ -818,12 +605,16 @@ def requirement_yes_list(request):
 # REQUIREMENT YES DETAIL
 # ===========================================
 @login_required
+@conditional_lead_page
 def requirement_yes_detail(request, lead_id):
-    lead = get_object_or_404(Lead, id=lead_id)
+    dossier = LeadDossier.load(lead_id)
+    lead = dossier.lead
 
     if lead.stage != 'requirement_yes':
         return redirect(get_lead_detail_url(lead))
-    requirement = get_object_or_404(RequirementYes, lead=lead)
+    if dossier.requirement is None:
+        raise Http404('No RequirementYes matches the given query.')
+    requirement = dossier.requirement
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -872,30 +663,22 @@ def requirement_yes_detail(request, lead_id):
                 messages.error(request, 'Please provide a remark')
                 return redirect('requirement_yes_detail', lead_id=lead.id)
 
-            # Move lead back to regret stage
-            lead.stage = 'regret'
-            lead.save()
-
-            # Create/update regret offer
-            RegretOffer.objects.update_or_create(
-                lead=lead,
-                defaults={
-                    'client_type_main': requirement.client_type_main,
-                    'client_type_detail': requirement.client_type_detail,
-                    'tank_type': 'Not specified',
-                    'followup_date': timezone.now().date() + timedelta(days=30),
-                    'remark': final_remark,
-                }
-            )
-
-            # Create stage history
-            StageHistory.objects.create(
-                lead=lead,
-                from_stage='requirement_yes',
-                to_stage='regret',
-                changed_by=request.user,
-                notes=final_remark
-            )
+            # Move lead to regret stage; the requirement row stays for its history
+            try:
+                transition(
+                    lead.id, 'regret', request.user,
+                    notes=final_remark,
+                    state={
+                        'client_type_main': requirement.client_type_main,
+                        'client_type_detail': requirement.client_type_detail,
+                        'tank_type': 'Not specified',
+                        'followup_date': timezone.now().date() + timedelta(days=30),
+                        'remark': final_remark,
+                    },
+                )
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('requirement_yes_detail', lead_id=lead.id)
 
             messages.success(request, f'{lead.company_name} moved to Regret section')
             return redirect('regret_offers_list')
@@ -950,19 +733,7 @@ def requirement_yes_detail(request, lead_id):
 
         return redirect('requirement_yes_detail', lead_id=lead.id)
 
-    # Get call history
-    call_history = CallHistory.objects.filter(
-        lead=lead
-    ).select_related('created_by').order_by('-actual_call_date')
-
-    return render(request, 'leads/requirement_yes_detail.html', {
-        'lead': lead,
-        'requirement': requirement,
-        'history': StageHistory.objects.filter(lead=lead).order_by('-changed_at'),
-        'meetings': Meeting.objects.filter(requirement=requirement),
-        'quotations': Quotation.objects.filter(requirement=requirement),
-        'call_history': call_history,
-    })
+    return render(request, 'leads/requirement_yes_detail.html', dossier.context(requirement=requirement))
 
 
 
@@ -1124,10 +895,8 @@ def add_lead(request):
             lead = form.save(commit=False)
             lead.created_by = request.user
             
-            # Generate unique lead code
-            last_lead = Lead.objects.order_by('-id').first()
-            next_id = (last_lead.id + 1) if last_lead else 1
-            lead.lead_code = f"EP{next_id:05d}"
+            # Unique even under concurrent submissions (sequence table)
+            lead.lead_code = next_lead_code()
             
             lead.save()
             messages.success(request, f'Lead {lead.lead_code} created successfully!')
@@ -1138,6 +907,69 @@ def add_lead(request):
     return render(request, 'leads/add_lead.html', {'form': form})
 
 
+# ===========================================
+# IMPORT LEADS (CSV / XLSX SHEETS)
+# ===========================================
+def import_job_data(job):
+    return {
+        'id': job.id,
+        'file_name': job.file_name,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'total_rows': job.total_rows,
+        'next_row': job.next_row,
+        'percent': job.percent,
+        'created_count': job.created_count,
+        'duplicate_count': job.duplicate_count,
+        'invalid_count': job.invalid_count,
+        'errors': job.errors,
+        'last_error': job.last_error,
+    }
+
+
+@login_required
+def import_leads(request):
+    """Upload a lead sheet; it's imported in the background and the page polls its progress"""
+    if request.user.profile.role != 'marketing':
+        return HttpResponseForbidden("Only marketing can import leads.")
+
+    if request.method == 'POST':
+        if request.POST.get('action') == 'resume':
+            job = get_object_or_404(ImportJob, pk=request.POST.get('job_id'), status='failed')
+            start_import(job)
+            messages.success(request, f'Resuming {job.file_name} after row {job.next_row}')
+            return redirect('import_leads')
+
+        upload = request.FILES.get('sheet')
+        if not upload:
+            messages.error(request, 'Please choose a CSV or XLSX file')
+            return redirect('import_leads')
+        try:
+            job = save_upload(upload, request.user)
+        except ValueError as exc:
+            messages.error(request, f'Cannot import {upload.name}: {exc}')
+            return redirect('import_leads')
+
+        start_import(job)
+        messages.success(request, f'Importing {job.total_rows} rows from {job.file_name}')
+        return redirect('import_leads')
+
+    return render(request, 'leads/import_leads.html', {
+        'jobs': ImportJob.objects.select_related('created_by')[:10],
+        'accept': ','.join(IMPORT_FORMATS),
+    })
+
+
+@login_required
+def import_job_status(request, job_id):
+    """Progress of one import, polled by the import page"""
+    if request.user.profile.role != 'marketing':
+        return HttpResponseForbidden("Only marketing can import leads.")
+
+    job = get_object_or_404(ImportJob, pk=job_id)
+    return JsonResponse(import_job_data(job))
+
+
 # ===========================================
 # LOST ORDERS LIST
 # ===========================================
@@ -1145,65 +977,34 @@ def add_lead(request):
 def lost_orders_list(request):
     
     
-    lost_orders = RequirementYes.objects.filter(
-        sales_stage__in=['not_converted', 'order_lost']
-    ).select_related('lead')
+    context = stage_list_context(
+        request, 'lost-orders',
+        total=lambda: counter_total('sales_stage', keys=LOST_SALES_STAGES),
+    )
     
-    return render(request, 'leads/lost_orders_list.html', {
-        'lost_orders': lost_orders,
-        'lost_orders_count': lost_orders.count(),
-    })
+    return render(request, 'leads/lost_orders_list.html', context)
 
 # ===========================================
 # LOST ORDERS Detail
 # ===========================================
 @login_required
+@conditional_lead_page
 def lost_order_detail(request, lead_id):
     """
     View for Lost Order details - Read-only view showing why order was lost
     """
-    lead = get_object_or_404(Lead, id=lead_id)
-    requirement = get_object_or_404(RequirementYes, lead=lead)
+    dossier = LeadDossier.load(lead_id, require='requirement')
+    lead, requirement = dossier.lead, dossier.requirement
     
     # ✅ Verify this is actually a lost order
     if requirement.sales_stage not in ['not_converted', 'order_lost']:
         messages.warning(request, 'This lead is not marked as a lost order.')
         return redirect('requirement_yes_detail', lead_id=lead.id)
     
-    # Get call history from prospect stage
-    call_history = CallHistory.objects.filter(
-        lead=lead
-    ).select_related('created_by').order_by('-actual_call_date')
-    
-    # Get stage history (sales progression)
-    stage_history = StageHistory.objects.filter(
-        lead=lead
-    ).select_related('changed_by').order_by('-changed_at')
-    
-    # Get meetings if any
-    meetings = Meeting.objects.filter(
-        requirement=requirement
-    ).select_related('created_by').order_by('-meeting_date')
-    
-    # Get quotations if any
-    quotations = Quotation.objects.filter(
-        requirement=requirement
-    ).select_related('created_by').order_by('-created_at')
-    
-    # ✅ Find the "Lost Order" conversion record
-    lost_order_record = stage_history.filter(
-        to_stage='order_lost'
-    ).first()
-    
-    return render(request, 'leads/lost_order_detail.html', {
-        'lead': lead,
-        'requirement': requirement,
-        'call_history': call_history,
-        'stage_history': stage_history,
-        'meetings': meetings,
-        'quotations': quotations,
-        'lost_order_record': lost_order_record,  
-    })
+    return render(request, 'leads/lost_order_detail.html', dossier.context(
+        requirement=requirement,
+        lost_order_record=dossier.closing_record('order_lost'),
+    ))
 # ===========================================
 # CUSTOMERS LIST
 # ===========================================
@@ -1212,71 +1013,35 @@ def customers_list(request):
     """Show all leads marked as Order Completed (Customers)"""
     
     # ✅ Filter by order_completed status and ensure lead exists
-    customers = RequirementYes.objects.filter(
-        sales_stage='order_completed',
-        lead__isnull=False
-    ).select_related('lead')
-    
-    return render(request, 'leads/customers_list.html', {
-        'customers': customers,
-        'customers_count': customers.count(),
-    })
+    context = stage_list_context(
+        request, 'customers',
+        total=lambda: counter_total('sales_stage', keys=['order_completed']),
+    )
+    
+    return render(request, 'leads/customers_list.html', context)
 
 # ===========================================
 # CUSTOMERS DETAILS
 # ===========================================
 # In views.py - customer_detail function
 @login_required
+@conditional_lead_page
 def customer_detail(request, lead_id):
     """
     View for Customer details - Read-only view showing completed order journey
     """
-    lead = get_object_or_404(Lead, id=lead_id)
-    requirement = get_object_or_404(RequirementYes, lead=lead)
+    dossier = LeadDossier.load(lead_id, require='requirement')
+    lead, requirement = dossier.lead, dossier.requirement
     
     # ✅ Verify this is actually a customer
     if requirement.sales_stage != 'order_completed':
         messages.warning(request, 'This lead is not marked as a customer.')
         return redirect('requirement_yes_detail', lead_id=lead.id)
     
-    # Get call history from prospect stage
-    call_history = CallHistory.objects.filter(
-        lead=lead
-    ).select_related('created_by').order_by('-actual_call_date')
-    
-    # Get stage history (sales progression)
-    stage_history = StageHistory.objects.filter(
-        lead=lead
-    ).select_related('changed_by').order_by('-changed_at')
-    
-    # ✅ FORMAT STAGE NAMES HERE
-    for item in stage_history:
-        item.to_stage_display = item.to_stage.replace('_', ' ').title()
-    
-    # Get meetings if any
-    meetings = Meeting.objects.filter(
-        requirement=requirement
-    ).select_related('created_by').order_by('-meeting_date')
-    
-    # Get quotations if any
-    quotations = Quotation.objects.filter(
-        requirement=requirement
-    ).select_related('created_by').order_by('-created_at')
-    
-    # ✅ Find the "Customer Conversion" record
-    customer_conversion_record = stage_history.filter(
-        to_stage='order_completed'
-    ).first()
-    
-    return render(request, 'leads/customer_detail.html', {
-        'lead': lead,
-        'requirement': requirement,
-        'call_history': call_history,
-        'stage_history': stage_history,
-        'meetings': meetings,
-        'quotations': quotations,
-        'customer_conversion_record': customer_conversion_record,
-    })
+    return render(request, 'leads/customer_detail.html', dossier.context(
+        requirement=requirement,
+        customer_conversion_record=dossier.closing_record('order_completed'),
+    ))
 
 # ===========================================
 # FUTURE REQUIREMENTS LIST
@@ -1285,22 +1050,23 @@ def customer_detail(request, lead_id):
 def future_requirements_list(request):
     """Show all leads marked as Future Requirement"""
     
-    future_reqs = FutureRequirement.objects.select_related('lead').order_by('-followup_date')
+    context = stage_list_context(
+        request, 'future-requirements', total=lambda: counter_total('future_followup')
+    )
     
-    return render(request, 'leads/future_requirement_list.html', {
-        'future_requirements': future_reqs
-    })
+    return render(request, 'leads/future_requirement_list.html', context)
 
 
 # ===========================================
 # FUTURE REQUIREMENT DETAIL
 # ===========================================
 @login_required
+@conditional_lead_page
 def future_requirement_detail(request, lead_id):
     """View and update future requirement details"""
     
-    lead = get_object_or_404(Lead, id=lead_id)
-    future_req = get_object_or_404(FutureRequirement, lead=lead)
+    dossier = LeadDossier.load(lead_id, require='future_requirement')
+    lead, future_req = dossier.lead, dossier.future_requirement
 
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -1350,38 +1116,27 @@ def future_requirement_detail(request, lead_id):
             elif request.POST.get('endclient_category') == 'Other':
                 client_type_detail = request.POST.get('endclient_other_text', '')
 
-            # ✅ CLEAR FUTURE REQUIREMENT STATE
-            old_stage = lead.stage
-            FutureRequirement.objects.filter(lead=lead).delete()
-
-            # ✅ UPDATE LEAD
-            lead.stage = 'requirement_yes'
-            lead.client_type_main = client_type_main
-            lead.client_type_detail = client_type_detail
-            lead.save()
-
-            # ✅ CREATE REQUIREMENT YES
-            requirement = RequirementYes.objects.create(
-                lead=lead,
-                client_type_main=client_type_main,
-                client_type_detail=client_type_detail,
-                tank_application=tank_application,
-                tank_location=request.POST.get('tank_location', ''),
-                assigned_sales_person=assigned_sales,
-                expected_delivery_date=request.POST.get('expected_delivery_date') or None,
-                tanks_json=tanks,
-                current_remark=remark,
-                sales_stage='costing_created'
-            )
-
-            # ✅ STAGE HISTORY
-            StageHistory.objects.create(
-                lead=lead,
-                from_stage=old_stage,
-                to_stage='requirement_yes',
-                changed_by=request.user,
-                notes=f'Converted from Future Requirement to Requirement Yes'
-            )
+            # ✅ MOVE LEAD: drops the future requirement, creates the requirement
+            try:
+                transition(
+                    lead.id, 'requirement_yes', request.user,
+                    notes='Converted from Future Requirement to Requirement Yes',
+                    lead_fields={'client_type_main': client_type_main, 'client_type_detail': client_type_detail},
+                    state={
+                        'client_type_main': client_type_main,
+                        'client_type_detail': client_type_detail,
+                        'tank_application': tank_application,
+                        'tank_location': request.POST.get('tank_location', ''),
+                        'assigned_sales_person': assigned_sales,
+                        'expected_delivery_date': request.POST.get('expected_delivery_date') or None,
+                        'tanks_json': tanks,
+                        'current_remark': remark,
+                        'sales_stage': 'costing_created',
+                    },
+                )
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('future_requirement_detail', lead_id=lead.id)
 
             messages.success(request, f'✅ {lead.company_name} converted to Requirement Yes')
             return redirect('requirement_yes_detail', lead_id=lead.id)
@@ -1413,14 +1168,7 @@ def future_requirement_detail(request, lead_id):
             # Convert to regret offer
             return redirect('lead_detail', lead_id=lead.id)
     
-    # Get call history for this lead
-    call_history = CallHistory.objects.filter(lead=lead).order_by('-actual_call_date')
-    
-    return render(request, 'leads/future_requirement_detail.html', {
-        'lead': lead,
-        'future_req': future_req,
-        'call_history': call_history
-    })
+    return render(request, 'leads/future_requirement_detail.html', dossier.context(future_req=future_req))
 
 
 # ===========================================
@@ -1430,40 +1178,32 @@ def future_requirement_detail(request, lead_id):
 def regret_offers_list(request):
     """Show all leads marked as Regret Offer"""
     
-    regret_offers = RegretOffer.objects.select_related('lead').order_by('-followup_date')
+    context = stage_list_context(
+        request, 'regret-offers', total=lambda: counter_total('regret_followup')
+    )
     
-    return render(request, 'leads/regret_offers_list.html', {
-        'regret_offers': regret_offers
-    })
+    return render(request, 'leads/regret_offers_list.html', context)
 
 
 # ===========================================
 # REGRET OFFER DETAIL
 # ===========================================
 @login_required
+@conditional_lead_page
 def regret_offer_detail(request, lead_id):
-    lead = get_object_or_404(Lead, id=lead_id)
-    regret_offer = get_object_or_404(RegretOffer, lead=lead)
+    dossier = LeadDossier.load(lead_id, require='regret_offer')
+    lead, regret_offer = dossier.lead, dossier.regret_offer
 
     if request.method == 'POST':
         action = request.POST.get('action')
 
         if action == 'reconvert':
-            old_stage = lead.stage
-            
-            # ✅ FIX 2: Delete regret state object when reconverting
-            RegretOffer.objects.filter(lead=lead).delete()
-            
-            lead.stage = 'prospect'
-            lead.save()
-
-            StageHistory.objects.create(
-                lead=lead,
-                from_stage=old_stage,
-                to_stage='prospect',
-                changed_by=request.user,
-                notes='Re-engaged from Regret Offer'
-            )
+            # ✅ Leaving regret drops its regret offer
+            try:
+                transition(lead.id, 'prospect', request.user, notes='Re-engaged from Regret Offer')
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect('regret_offer_detail', lead_id=lead.id)
 
             messages.success(
                 request,
@@ -1483,48 +1223,9 @@ def regret_offer_detail(request, lead_id):
 
             messages.success(request, 'Regret offer updated successfully')
 
-    call_history = CallHistory.objects.filter(
-        lead=lead
-    ).order_by('-actual_call_date')
-
-    return render(request, 'leads/regret_offer_detail.html', {
-        'lead': lead,
-        'regret_offer': regret_offer,
-        'call_history': call_history
-    })
-
+    return render(request, 'leads/regret_offer_detail.html', dossier.context(regret_offer=regret_offer))
 
 
-def convert_lead(lead, to_stage, *, regret_data=None, requirement_data=None, user=None, notes=""):
-    with transaction.atomic():
-        old_stage = lead.stage
-
-        # 🔥 Clear ALL other states first
-        RequirementYes.objects.filter(lead=lead).delete()
-        RegretOffer.objects.filter(lead=lead).delete()
-        FutureRequirement.objects.filter(lead=lead).delete()
-
-        # 🔁 Apply new state
-        if to_stage == 'requirement_yes':
-            RequirementYes.objects.create(**requirement_data, lead=lead)
-
-        elif to_stage == 'regret':
-            RegretOffer.objects.create(**regret_data, lead=lead)
-
-        elif to_stage == 'future':
-            FutureRequirement.objects.create(**future_data, lead=lead)
-
-        # ✅ Update lead LAST
-        lead.stage = to_stage
-        lead.save()
-
-        StageHistory.objects.create(
-            lead=lead,
-            from_stage=old_stage,
-            to_stage=to_stage,
-            changed_by=user,
-            notes=notes
-        )
 
 
 # ===========================================
@@ -1532,6 +1233,7 @@ def convert_lead(lead, to_stage, *, regret_data=None, requirement_data=None, use
 # ===========================================
 
 @login_required
+@conditional_on(Lead, AdditionalContact)
 def check_duplicates(request):
     """
     API endpoint to check for duplicate leads in real-time
@@ -1544,75 +1246,34 @@ def check_duplicates(request):
     email = request.GET.get('email', '').strip()
     phone = request.GET.get('phone', '').strip()
     
-    matches = []
+    top_matches = TopMatches()
     
-    # Exact match for email
+    # Exact match for email (normalized, incl. additional contacts)
     if email:
-        email_matches = Lead.objects.filter(contact_email__iexact=email)
-        for lead in email_matches:
-            matches.append({
-                'id': lead.id,
-                'company_name': lead.company_name,
-                'contact_email': lead.contact_email,
-                'contact_phone': lead.contact_phone,
-                'stage': lead.get_stage_display(),
-                'stage_code': lead.stage,
-                'lead_code': lead.lead_code,
-                'match_type': 'email',
-                'match_score': 100
-            })
+        for lead in leads_by_email(email).order_by('-created_at', '-id'):
+            top_matches.add(lead_match(lead, 'email', 100))
     
-    # Exact match for phone
+    # Exact match for phone (normalized, incl. additional contacts)
+    # Leads already matched by email are skipped by TopMatches
     if phone:
-        phone_matches = Lead.objects.filter(contact_phone=phone)
-        for lead in phone_matches:
-            # Avoid duplicates if already matched by email
-            if not any(m['id'] == lead.id for m in matches):
-                matches.append({
-                    'id': lead.id,
-                    'company_name': lead.company_name,
-                    'contact_email': lead.contact_email,
-                    'contact_phone': lead.contact_phone,
-                    'stage': lead.get_stage_display(),
-                    'stage_code': lead.stage,
-                    'lead_code': lead.lead_code,
-                    'match_type': 'phone',
-                    'match_score': 100
-                })
+        for lead in leads_by_phone(phone).order_by('-created_at', '-id'):
+            top_matches.add(lead_match(lead, 'phone', 100))
     
     # Fuzzy match for company name (similarity > 70%)
     if company_name and len(company_name) >= 3:
-        all_leads = Lead.objects.all()
+        # Only score leads sharing enough trigrams with the typed name
+        candidates = Lead.objects.filter(id__in=find_name_candidates(company_name)).order_by('-created_at', '-id')
+        matcher = NameMatcher(company_name)
         
-        for lead in all_leads:
-            # Skip if already matched
-            if any(m['id'] == lead.id for m in matches):
+        for lead in candidates:
+            if lead.id in top_matches:
                 continue
-            
-            # Calculate similarity ratio
-            similarity = SequenceMatcher(None, 
-                                        company_name.lower(), 
-                                        lead.company_name.lower()).ratio()
-            
-            # Match if similarity > 70%
-            if similarity > 0.7:
-                matches.append({
-                    'id': lead.id,
-                    'company_name': lead.company_name,
-                    'contact_email': lead.contact_email,
-                    'contact_phone': lead.contact_phone,
-                    'stage': lead.get_stage_display(),
-                    'stage_code': lead.stage,
-                    'lead_code': lead.lead_code,
-                    'match_type': 'company_name',
-                    'match_score': int(similarity * 100)
-                })
-    
-    # Sort by match score (highest first)
-    matches.sort(key=lambda x: x['match_score'], reverse=True)
-    
-    # Limit to top 5 matches
-    matches = matches[:5]
+            similarity = matcher.score(lead.company_name, floor=top_matches.floor())
+            if similarity is not None:
+                top_matches.add(lead_match(lead, 'company_name', int(similarity * 100)))
+    
+    # Top 5, highest match score first
+    matches = top_matches.results()
     
     return JsonResponse({
         'matches': matches,
@@ -1620,14 +1281,69 @@ def check_duplicates(request):
     })
 
 
+# ===========================================
+# Batch Check Duplicates API
+# ===========================================
+@login_required
+def check_duplicates_batch(request):
+    """
+    API endpoint to check many pasted rows for duplicates in one request
+    Body: {"records": [{"company_name": ..., "email": ..., "phone": ...}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    try:
+        records = json.loads(request.body).get('records')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return JsonResponse({'error': '"records" must be a list of objects'}, status=400)
+    
+    if len(records) > MAX_BATCH_RECORDS:
+        return JsonResponse(
+            {'error': f'At most {MAX_BATCH_RECORDS} records per request'}, status=400
+        )
+    
+    results = [
+        {'index': index, 'matches': matches, 'count': len(matches)}
+        for index, matches in enumerate(find_duplicates_batch(records))
+    ]
+    
+    return JsonResponse({
+        'results': results,
+        'count': len(results)
+    })
+
+
 # ===========================================
 # UNIVERSAL SEARCH API
 # ===========================================
+def search_result(lead):
+    """JSON shape of one lead in the search modal"""
+    return {
+        'id': lead.id,
+        'company_name': lead.company_name,
+        'contact_name': lead.contact_name,
+        'contact_email': lead.contact_email,
+        'contact_phone': lead.contact_phone,
+        'lead_code': lead.lead_code,
+        'stage_code': lead.stage,
+        'stage_display': lead.get_stage_display(),
+        'city': lead.city,
+        'state': lead.state,
+    }
+
+
 @login_required
+@conditional_on(Lead, CallHistory, StageHistory, RegretOffer, FutureRequirement, Meeting, AdditionalContact)
 def universal_search(request):
     """
     Universal search API endpoint
-    Searches across company name, contact name, email, and phone
+    Searches across company name, contact name, email, phone and the
+    remarks/notes attached to each lead. Pass next_cursor back as
+    ?cursor= to get the next page.
     """
     if request.method != 'GET':
         return JsonResponse({'error': 'Invalid request method'}, status=405)
@@ -1635,33 +1351,166 @@ def universal_search(request):
     query = request.GET.get('q', '').strip()
     
     if len(query) < 2:
-        return JsonResponse({'results': [], 'count': 0})
+        return JsonResponse({'results': [], 'count': 0, 'next_cursor': None})
+
+    after = None
+    if request.GET.get('cursor'):
+        try:
+            after = decode_cursor(request.GET['cursor'])
+        except ValueError:
+            after = None
+        if not after or len(after) != 2:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
     
-    # Search across multiple fields
-    leads = Lead.objects.filter(
-        Q(company_name__icontains=query) |
-        Q(contact_name__icontains=query) |
-        Q(contact_email__icontains=query) |
-        Q(contact_phone__icontains=query) |
-        Q(lead_code__icontains=query)
-    ).select_related()[:20]  # Limit to 20 results
+    # Ranked across lead fields and notes (FTS5 indexes on SQLite)
+    leads, snippets, next_cursor = search_leads(query, after=after, limit=20)
     
     results = []
     for lead in leads:
-        results.append({
-            'id': lead.id,
-            'company_name': lead.company_name,
-            'contact_name': lead.contact_name,
-            'contact_email': lead.contact_email,
-            'contact_phone': lead.contact_phone,
-            'lead_code': lead.lead_code,
-            'stage_code': lead.stage,
-            'stage_display': lead.get_stage_display(),
-            'city': lead.city,
-            'state': lead.state,
-        })
+        result = search_result(lead)
+        result['matches'] = [
+            {'source': source, 'snippet': snippet}
+            for source, snippet in snippets.get(lead.id, [])
+        ]
+        results.append(result)
     
     return JsonResponse({
         'results': results,
-        'count': len(results)
-    })
\ No newline at end of file
+        'count': len(results),
+        'next_cursor': encode_cursor(next_cursor) if next_cursor else None,
+    })
+
+# ===========================================
+# AUTOCOMPLETE API
+# ===========================================
+@login_required
+def autocomplete(request):
+    """
+    Type-ahead results for the search modal, answered from the
+    in-memory prefix index (falls back to universal search ranking
+    if the index is over its memory ceiling)
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    query = request.GET.get('q', '').strip()
+
+    if len(query) < 2:
+        return JsonResponse({'results': [], 'count': 0})
+
+    leads = autocomplete_leads(query, limit=10)
+    if leads is None:
+        leads, _, _ = search_leads(query, limit=10)
+
+    results = [search_result(lead) for lead in leads]
+    return JsonResponse({'results': results, 'count': len(results)})
+
+
+# ===========================================
+# STAGE LIST API (KEYSET PAGES)
+# ===========================================
+@login_required
+def list_api(request, list_name):
+    """
+    One page of a stage list as JSON: the rows, their rendered table
+    rows (for infinite scroll) and the cursor of the next page
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    stage_list = LISTS.get(list_name)
+    if stage_list is None:
+        return JsonResponse({'error': 'Unknown list'}, status=404)
+
+    profile, _ = Profile.objects.get_or_create(
+        user=request.user,
+        defaults={'role': 'marketing'}
+    )
+    try:
+        rows, next_cursor = stage_list.page(profile.role, request.GET.get('cursor'), params=request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'results': [stage_list.serialize(row) for row in rows],
+        'html': render_to_string(stage_list.rows_template, {stage_list.context_name: rows}, request),
+        'count': len(rows),
+        'next_cursor': next_cursor,
+    })
+
+
+# ===========================================
+# LEAD TIMELINE API
+# ===========================================
+@login_required
+def lead_timeline(request, lead_id):
+    """
+    One page of a lead's activity timeline as JSON, with the rendered
+    entries for the detail pages' "Show older activity" button
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    lead = get_object_or_404(Lead, id=lead_id)
+    try:
+        entries, next_cursor = timeline_page(lead.id, request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'results': [serialize_entry(entry) for entry in entries],
+        'html': render_to_string('leads/partials/timeline_items.html', {'timeline': entries}, request),
+        'next_cursor': next_cursor,
+    })
+
+
+# ===========================================
+# STAGE LIST EXPORT (STREAMED)
+# ===========================================
+@login_required
+def export_list(request, list_name):
+    """
+    Download a whole stage list as CSV (default) or JSON lines.
+    ?format=jsonl for JSON lines, ?gzip=1 to compress on the fly.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    if list_name not in EXPORT_COLUMNS:
+        return JsonResponse({'error': 'Unknown list'}, status=404)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported format'}, status=400)
+    compress = request.GET.get('gzip') == '1'
+
+    profile, _ = Profile.objects.get_or_create(
+        user=request.user,
+        defaults={'role': 'marketing'}
+    )
+    filename = f"{list_name}-{timezone.now():%Y%m%d}.{fmt}" + ('.gz' if compress else '')
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+
+    try:
+        LISTS[list_name].query(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        export_chunks(list_name, fmt, profile.role, compress, params=request.GET),
+        content_type='application/gzip' if compress else f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ===========================================
+# CACHE STATS API
+# ===========================================
+@login_required
+def cache_stats_api(request):
+    """Hit/miss counters for the page cache"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    return JsonResponse(cache_stats())